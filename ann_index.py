@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Approximate nearest-neighbour search over stored frame embeddings.
+IVFIndex clusters the L2-normalized CLIP vectors of the embedding index with
+spherical k-means and keeps one inverted list of row ids per cluster. A query
+only scores the rows of the `nprobe` clusters whose centroids are closest to
+it, so the cost grows with nprobe / n_lists of the library instead of all of
+it. nprobe is the recall/latency knob: n_lists probes is an exact search.
+Only numpy is needed.
+"""
+
+import math
+from typing import List, Optional
+
+# Upper bound on the number of inverted lists built automatically
+MAX_LISTS = 4096
+
+# Rows assigned to centroids at a time while building
+_ASSIGN_CHUNK_ROWS = 65536
+
+
+def _iter_chunks(parts: List, chunk_rows: int = _ASSIGN_CHUNK_ROWS):
+    """Yield (global_row_offset, float32 chunk) over a list of (N_i, dim) arrays."""
+    import numpy as np
+
+    offset = 0
+    for part in parts:
+        for start in range(0, len(part), chunk_rows):
+            chunk = np.asarray(part[start:start + chunk_rows], dtype=np.float32)
+            yield offset + start, chunk
+        offset += len(part)
+
+
+def _normalize(vectors):
+    import numpy as np
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class IVFIndex:
+    """
+    Inverted-file index: centroids plus the row ids assigned to each of them.
+
+    Row ids are global positions in the concatenation of the arrays the index was
+    built from, in order.
+    """
+
+    def __init__(self, centroids, list_offsets, list_rows):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+
+    @property
+    def n_lists(self) -> int:
+        return len(self.centroids)
+
+    @property
+    def size(self) -> int:
+        return len(self.list_rows)
+
+    @classmethod
+    def build(
+        cls,
+        parts: List,
+        n_lists: Optional[int] = None,
+        iterations: int = 10,
+        train_size: Optional[int] = None,
+        seed: int = 0,
+    ) -> 'IVFIndex':
+        """
+        Cluster the rows of parts and build the inverted lists.
+
+        Args:
+            parts: (N_i, dim) arrays of L2-normalized vectors (float16 memmaps are fine);
+                they are read chunk by chunk and never concatenated.
+            n_lists: Number of clusters; defaults to sqrt(total rows), capped at MAX_LISTS.
+            iterations: k-means iterations on the training sample.
+            train_size: Rows sampled to train the centroids (default 64 per list).
+            seed: Seed of the training sample and initial centroids.
+        """
+        import numpy as np
+
+        total = sum(len(p) for p in parts)
+        if total == 0:
+            raise ValueError("cannot build an index over zero vectors")
+        if n_lists is None:
+            n_lists = int(math.sqrt(total))
+        n_lists = max(1, min(int(n_lists), MAX_LISTS, total))
+        train_size = min(total, train_size or n_lists * 64)
+
+        # gather a random training sample without materializing every part
+        rng = np.random.default_rng(seed)
+        picked = np.sort(rng.choice(total, size=train_size, replace=False))
+        sample, offset = [], 0
+        for part in parts:
+            local = picked[(picked >= offset) & (picked < offset + len(part))] - offset
+            if len(local):
+                sample.append(np.asarray(part[local], dtype=np.float32))
+            offset += len(part)
+        sample = np.concatenate(sample)
+
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assign = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            counts = np.bincount(assign, minlength=n_lists)
+            # empty clusters keep their previous centroid
+            filled = counts > 0
+            centroids[filled] = _normalize(sums[filled])
+
+        assignments = np.empty(total, dtype=np.int32)
+        for start, chunk in _iter_chunks(parts):
+            assignments[start:start + len(chunk)] = (chunk @ centroids.T).argmax(axis=1)
+
+        list_rows = np.argsort(assignments, kind='stable').astype(np.int64)
+        list_offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_offsets[1:])
+        return cls(centroids, list_offsets, list_rows)
+
+    def candidates(self, queries, nprobe: int):
+        """
+        Row ids worth scoring for a stack of queries.
+
+        Args:
+            queries: (Q, dim) float32 array of L2-normalized query vectors.
+            nprobe: Clusters probed per query; higher means better recall and more work.
+
+        Returns:
+            Sorted int64 numpy array of unique row ids from the probed lists of all queries.
+        """
+        import numpy as np
+
+        nprobe = max(1, min(int(nprobe), self.n_lists))
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.centroids.shape[1])
+        if nprobe == self.n_lists:
+            return np.arange(self.size, dtype=np.int64)
+        closest = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        lists = np.unique(closest)
+        rows = [self.list_rows[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists]
+        return np.unique(np.concatenate(rows)) if rows else np.zeros(0, dtype=np.int64)
+
+    def save(self, path: str):
+        import numpy as np
+        from embedding_index import atomic_write
+
+        with atomic_write(path) as f:
+            np.savez(f, centroids=self.centroids, list_offsets=self.list_offsets, list_rows=self.list_rows)
+
+    @classmethod
+    def load(cls, path: str) -> Optional['IVFIndex']:
+        """Load an index saved with save(), or return None if it is missing or unreadable."""
+        import numpy as np
+
+        try:
+            with np.load(path) as data:
+                return cls(data['centroids'], data['list_offsets'], data['list_rows'])
+        except (OSError, ValueError, KeyError):
+            return None
@@ -22,7 +22,10 @@ from widgets.result_card import ResultCard
 # 导入搜索和工具模块
 from search import AISearchEngine, format_ms
 from translations import TRANSLATIONS
-from search_worker import SearchWorker
+from search_worker import SearchWorker, WarmupWorker
+
+# 窗口显示后延迟多久开始后台预加载模型（毫秒），让首帧先绘制
+WARMUP_DELAY_MS = 300
 
 # 确保资源文件被加载
 try:
@@ -53,7 +56,7 @@ class VideoSearchApp(QMainWindow, Ui_MainWindow):
         self.videos = []  # 选中的视频列表
         self.images = []  # 选中的图像列表
         self.search_worker = None  # 搜索工作线程
-        self.search_engine = AISearchEngine()  # AI搜索引擎实例
+        self.warmup_worker = None  # 模型预加载线程
         
         # 初始化翻译
         self.translations = TRANSLATIONS
@@ -62,6 +65,11 @@ class VideoSearchApp(QMainWindow, Ui_MainWindow):
         self.config_path = os.path.join(os.path.expanduser('~'), '.videosearch_config.json')
         self.config = self._load_config()
         
+        # AI搜索引擎实例；precision 为 'int8' 时 CLIP 使用动态量化在 CPU 上推理，
+        # backend 为 'onnx' 时用 ONNX Runtime 推理（intra/inter_op_threads 设置线程数）
+        engine_options = ('precision', 'backend', 'onnx_dir', 'intra_op_threads', 'inter_op_threads')
+        self.search_engine = AISearchEngine(**{k: self.config[k] for k in engine_options if k in self.config})
+        
         # 初始化UI组件
         self._init_ui()
         
@@ -70,6 +78,10 @@ class VideoSearchApp(QMainWindow, Ui_MainWindow):
         
         # 应用初始设置
         self._apply_initial_settings()
+        
+        # 窗口显示后在后台预加载上次使用的搜索模式的模型
+        if self.config.get('warm_up', True):
+            QTimer.singleShot(WARMUP_DELAY_MS, self._start_warm_up)
     
     def _init_ui(self):
         """初始化UI组件"""
@@ -610,6 +622,7 @@ class VideoSearchApp(QMainWindow, Ui_MainWindow):
         print(f"Search mode: {mode}")
         if mode is None:
             return
+        self.config['last_mode'] = mode
         
         # 准备搜索参数
         search_params = self._prepare_search_params(mode)
@@ -670,6 +683,7 @@ class VideoSearchApp(QMainWindow, Ui_MainWindow):
         self.list_results.clear()
         self.txt_log.clear()
         self.progress_bar.setValue(0)
+        self.progress_bar.setFormat('%p%')
         
         # 更新搜索按钮状态已在_on_search_toggle中完成
         pass
@@ -686,6 +700,8 @@ class VideoSearchApp(QMainWindow, Ui_MainWindow):
                 query_text=params.get('query_text'),
                 query_category=params.get('query_category'),
                 score_threshold=params['score_threshold'],
+                workers=int(self.config.get('workers', 1)),
+                search_options=self.config.get('search_options'),
                 parent=self
             )
             
@@ -706,6 +722,29 @@ class VideoSearchApp(QMainWindow, Ui_MainWindow):
             import traceback
             traceback.print_exc()
     
+    def _start_warm_up(self):
+        """在后台线程中加载上次使用的搜索模式的模型并运行一次推理"""
+        mode = self.config.get('last_mode') or self._get_search_mode() or 'text'
+        if self.search_worker or self.warmup_worker:
+            return
+        try:
+            self.warmup_worker = WarmupWorker(self.search_engine, mode, parent=self)
+            self.warmup_worker.ready.connect(self._on_warm_up_ready)
+            self.warmup_worker.failed.connect(self._on_warm_up_failed)
+            self._on_message(('warmup_started', {'mode': self._t('search_mode_' + mode)}))
+            self.warmup_worker.start()
+        except Exception as e:
+            print(f"Error starting warm-up: {e}")
+            self.warmup_worker = None
+    
+    def _on_warm_up_ready(self, mode, seconds):
+        """模型预加载完成"""
+        self._on_message(('warmup_ready', {'mode': self._t('search_mode_' + mode), 'sec': seconds}))
+    
+    def _on_warm_up_failed(self, mode, error_msg):
+        """模型预加载失败（首次搜索时会重新加载）"""
+        self._on_message(('warmup_failed', {'mode': self._t('search_mode_' + mode), 'error': error_msg}))
+    
     def on_stop_search(self):
         """停止搜索"""
         if self.search_worker:
@@ -808,6 +847,12 @@ class VideoSearchApp(QMainWindow, Ui_MainWindow):
                 if total_samples > 0:
                     pct = int((processed / float(total_samples)) * 100)
                     self.progress_bar.setValue(max(0, min(pct, 99)))
+                # 近似重复帧复用了之前的模型结果，在进度条上显示复用帧数
+                reused = int(info[5]) if len(info) >= 6 else 0
+                if reused > 0:
+                    self.progress_bar.setFormat(self._t('progress_reused').format(reused=reused))
+                else:
+                    self.progress_bar.setFormat('%p%')
             elif kind == 'video' and len(info) >= 3:
                 completed = int(info[1])
                 total_videos = int(info[2])
@@ -1027,6 +1072,15 @@ class VideoSearchApp(QMainWindow, Ui_MainWindow):
         except Exception:
             pass
         
+        # 停止模型预加载线程；正在进行的模型加载无法中断，必须等它结束，
+        # 否则 QThread 在运行中被销毁会导致程序崩溃
+        try:
+            if self.warmup_worker and self.warmup_worker.isRunning():
+                self.warmup_worker.stop()
+                self.warmup_worker.wait()
+        except Exception:
+            pass
+        
         # 停止播放器
         try:
             if self.player_widget:
@@ -1092,6 +1146,10 @@ def _set_initial_splitter_sizes(window):
             pass
 
 if __name__ == "__main__":
+    # 打包（冻结）后的 Windows 程序中，并行搜索的 spawn 子进程会重新执行本入口；
+    # 必须在创建界面之前调用，否则每个子进程都会再打开一个主窗口
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
 
 
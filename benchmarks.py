@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Command line benchmarks for the search engine's performance options.
+
+    python benchmarks.py ann [--vectors N] [--probes 1,4,16] [--index-dir DIR]
+    python benchmarks.py yolo-batch [--video PATH] [--batch-sizes 1,4,8,16]
+    python benchmarks.py clip-int8 [--video PATH] [--frames N] [--threads N]
+    python benchmarks.py backends [--video PATH] [--frames N] [--threads N]
+    python benchmarks.py pipeline --video PATH [--mode text] [--workers 0:0,1:1,2:1]
+
+Each subcommand prints a small table; none of them needs the Qt UI.
+"""
+
+import argparse
+import time
+
+
+def _synthetic_embeddings(count: int, dim: int, seed: int = 0):
+    """
+    L2-normalized float16 vectors grouped like sampled video frames.
+
+    Consecutive frames of a shot are near-duplicates of each other, so vectors are
+    drawn around a few thousand random "shot" directions rather than uniformly.
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    shots = rng.standard_normal((max(1, count // 200), dim)).astype(np.float32)
+    vectors = np.empty((count, dim), dtype=np.float16)
+    for start in range(0, count, 65536):
+        n = min(65536, count - start)
+        chunk = shots[rng.integers(0, len(shots), n)] + 1.5 * rng.standard_normal((n, dim)).astype(np.float32)
+        vectors[start:start + n] = chunk / np.linalg.norm(chunk, axis=1, keepdims=True)
+    return vectors
+
+
+def _stored_embeddings(index_dir: str):
+    """Every entry of an embedding index directory, as a list of float16 memmaps."""
+    import glob
+    import os
+
+    from embedding_index import EmbeddingIndex
+
+    index = EmbeddingIndex(index_dir)
+    parts = []
+    for path in sorted(glob.glob(os.path.join(index_dir, '*', '*.emb'))):
+        entry = index.load(os.path.basename(path)[:-len('.emb')])
+        if entry is not None and len(entry[1]):
+            parts.append(entry[1])
+    return parts
+
+
+def bench_ann(args):
+    """Compare IVF candidate scoring with the exact matmul used for indexed videos."""
+    import numpy as np
+
+    from ann_index import IVFIndex
+    from embedding_index import max_similarity
+
+    if args.index_dir:
+        parts = _stored_embeddings(args.index_dir)
+        if not parts:
+            print(f"No embeddings found in {args.index_dir}")
+            return
+        vectors = np.concatenate(parts)
+    else:
+        vectors = _synthetic_embeddings(args.vectors, args.dim)
+    print(f"{len(vectors)} vectors of dim {vectors.shape[1]}")
+
+    # queries close to stored frames, like a text/image query that matches a scene
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)].astype(np.float32)
+    queries += 0.02 * rng.standard_normal(queries.shape).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    t0 = time.perf_counter()
+    ivf = IVFIndex.build([vectors], n_lists=args.lists)
+    print(f"IVF build: {ivf.n_lists} lists in {time.perf_counter() - t0:.2f}s")
+
+    exact_times, exact_top = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        scores = max_similarity(vectors, q[None, :])
+        exact_times.append(time.perf_counter() - t0)
+        exact_top.append(set(np.argpartition(-scores, args.k)[:args.k].tolist()))
+    exact_ms = 1000 * float(np.mean(exact_times))
+    print(f"{'method':>10} {'ms/query':>10} {'speedup':>8} {'scored':>8} {'recall@' + str(args.k):>10}")
+    print(f"{'exact':>10} {exact_ms:10.2f} {1.0:8.1f} {1.0:8.3f} {1.0:10.3f}")
+
+    for nprobe in [int(p) for p in args.probes.split(',')]:
+        times, recalls, scored = [], [], []
+        for q, top in zip(queries, exact_top):
+            t0 = time.perf_counter()
+            rows = ivf.candidates(q[None, :], nprobe)
+            scores = max_similarity(vectors[rows], q[None, :])
+            times.append(time.perf_counter() - t0)
+            best = rows[np.argsort(-scores)[:args.k]]
+            recalls.append(len(top.intersection(best.tolist())) / len(top))
+            scored.append(len(rows) / len(vectors))
+        ms = 1000 * float(np.mean(times))
+        print(f"{'ivf/' + str(nprobe):>10} {ms:10.2f} {exact_ms / ms:8.1f} {np.mean(scored):8.3f} {np.mean(recalls):10.3f}")
+
+
+def _benchmark_frames(video_path, count: int, resize):
+    """count BGR frames sampled from video_path, or random frames of a 16:9 640-wide video."""
+    import numpy as np
+
+    if not video_path:
+        rng = np.random.default_rng(0)
+        return [rng.integers(0, 256, (360, 640, 3), dtype=np.uint8) for _ in range(count)]
+
+    from frame_sampler import open_frame_source
+
+    source = open_frame_source(video_path, sample_interval_s=1.0, resize=resize)
+    if source is None:
+        raise SystemExit(f"Cannot open {video_path}")
+    frames = []
+    try:
+        for _, frame in source.frames():
+            frames.append(frame)
+            if len(frames) == count:
+                break
+    finally:
+        source.release()
+    if not frames:
+        raise SystemExit(f"No frames decoded from {video_path}")
+    # loop short videos so every batch size sees the same number of frames
+    return [frames[i % len(frames)] for i in range(count)]
+
+
+def bench_yolo_batch(args):
+    """Detector throughput for several batch sizes, as used by category search."""
+    from search import AISearchEngine
+
+    predict_kwargs = {}
+    if args.backend == 'torch':
+        import torch
+
+        if args.device == 'cpu':
+            torch.set_num_threads(args.threads or torch.get_num_threads())
+        predict_kwargs['device'] = args.device
+    engine = AISearchEngine(use_index=False, backend=args.backend, intra_op_threads=args.threads or 0)
+    engine._ensure_yolo_loaded()
+    frames = _benchmark_frames(args.video, args.frames, engine._frame_resize('category'))
+    device = args.device if args.backend == 'torch' else 'onnxruntime cpu'
+    print(f"{len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, device={device}")
+
+    # first call builds the predictor and warms up kernels
+    engine._detect_frames(frames[:1], **predict_kwargs)
+
+    print(f"{'batch':>6} {'frames/s':>10} {'ms/frame':>10}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(',')]:
+        t0 = time.perf_counter()
+        for start in range(0, len(frames), batch_size):
+            engine._detect_frames(frames[start:start + batch_size], **predict_kwargs)
+        elapsed = time.perf_counter() - t0
+        print(f"{batch_size:>6} {len(frames) / elapsed:10.1f} {1000 * elapsed / len(frames):10.1f}")
+
+
+_REFERENCE_TEXTS = [
+    'a person walking', 'a car on the road', 'a dog', 'people talking in a room',
+    'a city street at night', 'a close-up of a face', 'trees and grass', 'a computer screen',
+]
+
+
+def _serialized_size(model) -> int:
+    """Bytes of a model's state dict as torch.save writes it (quantized weights stay packed int8)."""
+    import io
+
+    import torch
+
+    buf = io.BytesIO()
+    torch.save(model.state_dict(), buf)
+    return buf.tell()
+
+
+def _compare_clip(engines: dict, frames: list, batch_size: int, sizes: dict = None):
+    """
+    Embed the same frames and reference texts with every engine and print speed and drift.
+
+    The first engine is the reference the others are compared with.
+    """
+    import numpy as np
+
+    image_emb, text_emb = {}, {}
+    print(f"{'engine':>12} {'ms/frame':>10}" + (f" {'size MB':>8}" if sizes else ""))
+    for label, engine in engines.items():
+        # first call warms up kernels (and checks fast preprocessing)
+        engine._get_clip_image_embeddings(frames[:1])
+        t0 = time.perf_counter()
+        batches = [engine._get_clip_image_embeddings(frames[i:i + batch_size]) for i in range(0, len(frames), batch_size)]
+        elapsed = time.perf_counter() - t0
+        image_emb[label] = np.concatenate(batches)
+        text_emb[label] = np.concatenate([engine._get_clip_text_embedding(text) for text in _REFERENCE_TEXTS])
+        size = f" {sizes[label] / (1024 * 1024):8.1f}" if sizes else ""
+        print(f"{label:>12} {1000 * elapsed / len(frames):10.1f}" + size)
+
+    reference, *others = engines
+    # does each text still pick the same best frame?
+    best = {label: (text_emb[label] @ image_emb[label].T).argmax(axis=1) for label in engines}
+    for label in others:
+        image_cos = (image_emb[reference] * image_emb[label]).sum(axis=1)
+        text_cos = (text_emb[reference] * text_emb[label]).sum(axis=1)
+        print(f"image cosine {reference}/{label}: mean {image_cos.mean():.4f} min {image_cos.min():.4f}")
+        print(f"text cosine {reference}/{label}:  mean {text_cos.mean():.4f} min {text_cos.min():.4f}")
+        print(f"text->frame top-1 agreement: {(best[reference] == best[label]).mean():.3f}")
+
+
+def bench_clip_int8(args):
+    """Speed, size and embedding drift of int8 dynamically quantized CLIP against fp32 on CPU."""
+    import torch
+
+    from search import CLIP_INPUT_SIZE, AISearchEngine
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    engines = {precision: AISearchEngine(use_index=False, precision=precision) for precision in ('fp32', 'int8')}
+    for engine in engines.values():
+        engine._ensure_clip_loaded()
+    # compare both on CPU, where int8 kernels run
+    engines['fp32']._clip_model.to('cpu')
+    engines['fp32']._device = 'cpu'
+    frames = _benchmark_frames(args.video, args.frames, ('short', CLIP_INPUT_SIZE))
+    print(f"{len(frames)} frames, {len(_REFERENCE_TEXTS)} texts, {torch.get_num_threads()} threads")
+    sizes = {precision: _serialized_size(engine._clip_model) for precision, engine in engines.items()}
+    _compare_clip(engines, frames, args.batch_size, sizes)
+
+
+def bench_backends(args):
+    """Eager PyTorch against ONNX Runtime on CPU, for CLIP embeddings and YOLO detections."""
+    import numpy as np
+    import torch
+
+    from search import AISearchEngine
+
+    threads = args.threads or torch.get_num_threads()
+    torch.set_num_threads(threads)
+    engines = {
+        backend: AISearchEngine(use_index=False, backend=backend, precision=args.precision, intra_op_threads=threads)
+        for backend in ('torch', 'onnx')
+    }
+    for engine in engines.values():
+        engine._ensure_clip_loaded()
+        engine._ensure_yolo_loaded()
+    engines['torch']._clip_model.to('cpu')
+    engines['torch']._device = 'cpu'
+    print(f"{threads} threads, precision={args.precision}")
+
+    frames = _benchmark_frames(args.video, args.frames, engines['torch']._frame_resize('image'))
+    _compare_clip(engines, frames, args.batch_size)
+
+    frames = _benchmark_frames(args.video, args.frames, engines['torch']._frame_resize('category'))
+    detections = {}
+    print(f"{'engine':>12} {'yolo ms/frame':>14}")
+    for backend, engine in engines.items():
+        predict_kwargs = {'device': 'cpu'} if backend == 'torch' else {}
+        engine._detect_frames(frames[:1], **predict_kwargs)
+        t0 = time.perf_counter()
+        detections[backend] = []
+        for start in range(0, len(frames), args.batch_size):
+            detections[backend] += engine._detect_frames(frames[start:start + args.batch_size], **predict_kwargs)
+        print(f"{backend:>12} {1000 * (time.perf_counter() - t0) / len(frames):14.1f}")
+    # frames whose set of detected classes is the same with both backends
+    same = [np.array_equal(np.unique(a[0]), np.unique(b[0])) for a, b in zip(detections['torch'], detections['onnx'])]
+    print(f"frames with the same detected classes: {np.mean(same):.3f}")
+
+
+def bench_pipeline(args):
+    """Whole-video search time per (preprocess, inference) worker count of the scoring pipeline."""
+    from search import AISearchEngine
+
+    engine = AISearchEngine(use_index=False, backend=args.backend)
+    query = {
+        'text': {'query_text': args.query or 'a person walking'},
+        'category': {'query_category': args.query or 'person'},
+        'multi': {'queries': [('text', args.query or 'a person walking'), ('category', 'person')]},
+    }[args.mode]
+    engine.warm_up('multi' if args.mode == 'multi' else args.mode)
+
+    print(f"{'workers':>8} {'s':>7} {'matches':>8} {'decode':>7} {'prep':>7} {'infer':>7} {'score':>7}")
+    for spec in args.workers.split(','):
+        preprocess_workers, inference_workers = (int(n) for n in spec.split(':'))
+        stats = {}
+        t0 = time.perf_counter()
+        matches = list(engine.search(
+            [args.video], args.mode, sample_interval_s=args.interval, batch_size=args.batch_size,
+            similarity_threshold=0.25, confidence_threshold=0.5,
+            preprocess_workers=preprocess_workers, inference_workers=inference_workers,
+            stats_callback=lambda _, d: stats.update(d), **query
+        ))
+        elapsed = time.perf_counter() - t0
+        busy = stats.get('pipeline_busy_s', {})
+        print(f"{spec:>8} {elapsed:7.2f} {len(matches):8d} " + ' '.join(
+            f"{busy.get(stage, 0.0):7.2f}" for stage in ('decode', 'preprocess', 'inference', 'score')
+        ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="VideoSearch performance benchmarks")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    ann = sub.add_parser('ann', help="IVF index vs exact scoring of stored frame embeddings")
+    ann.add_argument('--vectors', type=int, default=1000000, help="synthetic vectors (ignored with --index-dir)")
+    ann.add_argument('--dim', type=int, default=512)
+    ann.add_argument('--index-dir', default=None, help="use the embeddings stored in this index directory")
+    ann.add_argument('--lists', type=int, default=None, help="IVF lists (default sqrt(vectors))")
+    ann.add_argument('--probes', default='1,2,4,8,16,32', help="comma-separated nprobe values")
+    ann.add_argument('--queries', type=int, default=20)
+    ann.add_argument('-k', type=int, default=100, help="top-k used for recall")
+    ann.set_defaults(func=bench_ann)
+
+    yolo = sub.add_parser('yolo-batch', help="YOLO throughput per batch size")
+    yolo.add_argument('--video', default=None, help="sample frames from this video (default: random frames)")
+    yolo.add_argument('--frames', type=int, default=64)
+    yolo.add_argument('--batch-sizes', default='1,4,8,16', help="comma-separated batch sizes")
+    yolo.add_argument('--device', default='cpu')
+    yolo.add_argument('--threads', type=int, default=None, help="torch CPU threads / ONNX Runtime intra-op threads")
+    yolo.add_argument('--backend', default='torch', choices=('torch', 'onnx'))
+    yolo.set_defaults(func=bench_yolo_batch)
+
+    clip_int8 = sub.add_parser('clip-int8', help="int8 quantized vs fp32 CLIP on CPU")
+    clip_int8.add_argument('--video', default=None, help="sample frames from this video (default: random frames)")
+    clip_int8.add_argument('--frames', type=int, default=64)
+    clip_int8.add_argument('--batch-size', type=int, default=8)
+    clip_int8.add_argument('--threads', type=int, default=None, help="torch CPU threads")
+    clip_int8.set_defaults(func=bench_clip_int8)
+
+    backends = sub.add_parser('backends', help="PyTorch vs ONNX Runtime on CPU for CLIP and YOLO")
+    backends.add_argument('--video', default=None, help="sample frames from this video (default: random frames)")
+    backends.add_argument('--frames', type=int, default=64)
+    backends.add_argument('--batch-size', type=int, default=8)
+    backends.add_argument('--precision', default='fp32', choices=('fp32', 'int8'))
+    backends.add_argument('--threads', type=int, default=None, help="torch and ONNX Runtime intra-op threads")
+    backends.set_defaults(func=bench_backends)
+
+    pipeline = sub.add_parser('pipeline', help="search time per pipeline worker count")
+    pipeline.add_argument('--video', required=True)
+    pipeline.add_argument('--mode', default='text', choices=('text', 'category', 'multi'))
+    pipeline.add_argument('--query', default=None)
+    pipeline.add_argument('--interval', type=float, default=1.0, help="sample interval in seconds")
+    pipeline.add_argument('--batch-size', type=int, default=8)
+    pipeline.add_argument('--backend', default='torch', choices=('torch', 'onnx'))
+    pipeline.add_argument('--workers', default='0:0,1:1,2:1,2:2', help="comma-separated preprocess:inference worker counts")
+    pipeline.set_defaults(func=bench_pipeline)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Compound category queries for YOLO search.
+A query combines category names with AND / OR (AND binds tighter, parentheses
+group) and optional counts:
+
+    person
+    person AND dog
+    car OR truck
+    at least 3 person
+    (car OR truck) AND at least 2 person
+
+Every term is scored per frame as the confidence of its N-th most confident
+matching box (N = the count, 1 by default) and 0 if there are fewer boxes.
+AND takes the minimum of its operands and OR the maximum, so a frame matches
+exactly when the query holds for boxes at or above the confidence threshold,
+and a plain category name behaves like the original single-class search.
+
+A parsed query is compiled once against the detector's class names
+(CompiledCategoryQuery): names are matched up front, so a name the detector does
+not know is rejected before any frame is scored, and per-frame scoring is a few
+vectorized numpy operations over the class ids and confidences of the boxes.
+"""
+
+import re
+from typing import Dict, List, Union
+
+_TOKEN_RE = re.compile(r'\(|\)|[^\s()]+')
+
+
+def category_matches(class_name_lower: str, query_category_lower: str) -> bool:
+    """Whether a (lowercase) YOLO class name matches a (lowercase) category name."""
+    # Check for exact match or word boundary match
+    # Split class name into words and check if query matches any word
+    class_words = class_name_lower.replace('-', ' ').replace('_', ' ').split()
+    query_words = query_category_lower.replace('-', ' ').replace('_', ' ').split()
+
+    return (
+        class_name_lower == query_category_lower or
+        query_category_lower in class_words or
+        any(qw in class_words for qw in query_words)
+    )
+
+
+class Term:
+    """At least `count` boxes of a category."""
+
+    def __init__(self, name: str, count: int = 1):
+        self.name = name
+        self.count = count
+
+    def terms(self) -> List['Term']:
+        return [self]
+
+    def evaluate(self, term_scores: Dict['Term', object]):
+        return term_scores[self]
+
+    def __repr__(self):
+        return f"Term({self.name!r}, {self.count})" if self.count != 1 else f"Term({self.name!r})"
+
+
+class BoolOp:
+    """AND (minimum) or OR (maximum) of sub-queries."""
+
+    def __init__(self, op: str, operands: List[Union['BoolOp', Term]]):
+        self.op = op
+        self.operands = operands
+
+    def terms(self) -> List[Term]:
+        return [term for operand in self.operands for term in operand.terms()]
+
+    def evaluate(self, term_scores: Dict[Term, object]):
+        """
+        Combine per-term scores; works on floats or on numpy arrays of per-frame scores.
+        """
+        import numpy as np
+
+        combine = np.minimum if self.op == 'AND' else np.maximum
+        result = self.operands[0].evaluate(term_scores)
+        for operand in self.operands[1:]:
+            result = combine(result, operand.evaluate(term_scores))
+        return result
+
+    def __repr__(self):
+        return f"{self.op}({', '.join(repr(o) for o in self.operands)})"
+
+
+def parse_category_query(text: str) -> Union[BoolOp, Term]:
+    """
+    Parse a category query string.
+
+    Raises:
+        ValueError: if the query is empty or malformed.
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    pos = [0]
+
+    def _peek():
+        return tokens[pos[0]] if pos[0] < len(tokens) else None
+
+    def _take():
+        token = _peek()
+        pos[0] += 1
+        return token
+
+    def _expr(op, operand):
+        operands = [operand()]
+        while _peek() == op.lower():
+            _take()
+            operands.append(operand())
+        return operands[0] if len(operands) == 1 else BoolOp(op, operands)
+
+    def _or_expr():
+        return _expr('OR', _and_expr)
+
+    def _and_expr():
+        return _expr('AND', _atom)
+
+    def _atom():
+        if _peek() == '(':
+            _take()
+            node = _or_expr()
+            if _take() != ')':
+                raise ValueError(f"Missing ')' in category query: {text!r}")
+            return node
+        return _term()
+
+    def _term():
+        count = 1
+        if _peek() == 'at' and pos[0] + 1 < len(tokens) and tokens[pos[0] + 1] == 'least':
+            pos[0] += 2
+            if _peek() is None or not _peek().isdigit():
+                raise ValueError(f"Expected a number after 'at least' in category query: {text!r}")
+        if _peek() is not None and _peek().isdigit():
+            count = int(_take())
+            if count < 1:
+                raise ValueError(f"Counts must be at least 1 in category query: {text!r}")
+        words = []
+        while _peek() not in (None, '(', ')', 'and', 'or'):
+            words.append(_take())
+        if not words:
+            raise ValueError(f"Expected a category name in category query: {text!r}")
+        return Term(' '.join(words), count)
+
+    if not tokens:
+        raise ValueError("Empty category query")
+    node = _or_expr()
+    if pos[0] != len(tokens):
+        raise ValueError(f"Unexpected {tokens[pos[0]]!r} in category query: {text!r}")
+    return node
+
+
+class CompiledCategoryQuery:
+    """
+    A parsed query bound to a detector's class names.
+
+    Attributes:
+        query: The parsed query (Term or BoolOp).
+        class_ids: Sorted ids of every class any term refers to; suitable for the
+            detector's class filter.
+
+    Raises:
+        ValueError: if a term names no class of the detector. Such a term would score
+            0 on every frame, which silently matches everything at threshold 0.
+    """
+
+    def __init__(self, query: Union[BoolOp, Term], names: Dict[int, str]):
+        import numpy as np
+
+        self.query = query
+        self.terms = query.terms()
+        self.term_ids = {
+            term: np.array(sorted(i for i, name in names.items() if category_matches(name.lower(), term.name)), dtype=np.int64)
+            for term in self.terms
+        }
+        unknown = [term.name for term in self.terms if not len(self.term_ids[term])]
+        if unknown:
+            raise ValueError(f"Unknown category in category query: {', '.join(repr(name) for name in unknown)}")
+        self.class_ids = sorted({int(i) for ids in self.term_ids.values() for i in ids})
+
+    def score(self, classes, confidences, confidence_threshold: float) -> float:
+        """
+        Score one frame from the class ids and confidences of its boxes (numpy arrays).
+        """
+        import numpy as np
+
+        keep = confidences >= confidence_threshold
+        classes, confidences = classes[keep], confidences[keep]
+        term_scores = {}
+        for term in self.terms:
+            matched = confidences[np.isin(classes, self.term_ids[term])]
+            if len(matched) < term.count:
+                term_scores[term] = 0.0
+            else:
+                # k-th largest without sorting every box
+                term_scores[term] = float(-np.partition(-matched, term.count - 1)[term.count - 1])
+        return float(self.query.evaluate(term_scores))
+
+    def frame_scores(self, detections, confidence_threshold: float):
+        """Score every frame of a detection_index.Detections entry; returns a float32 array."""
+        term_scores = {
+            term: detections.kth_confidence(self.term_ids[term], confidence_threshold, term.count)
+            for term in self.terms
+        }
+        return self.query.evaluate(term_scores)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent per-video index of YOLO detections.
+YOLO reports every COCO class on each frame it sees, so AISearchEngine keeps all
+detections (class id, confidence, normalized box) of every sampled frame the
+first time a video is searched by category. Later category queries, with any
+class or confidence threshold at or above the recorded floor, are answered from
+these arrays without decoding the video or loading the detector.
+"""
+
+import json
+import os
+from typing import Dict, Optional
+
+from embedding_index import EmbeddingIndex, atomic_write
+
+DEFAULT_DETECTION_DIR = os.path.join(os.path.expanduser('~'), '.videosearch_cache', 'detections')
+
+
+class Detections:
+    """
+    All detections of one video, stored flat.
+
+    Frame i (taken at timestamps[i] ms) owns boxes offsets[i]:offsets[i + 1] of
+    classes, confidences and boxes (xyxy, normalized to 0..1).
+    """
+
+    def __init__(self, timestamps, offsets, classes, confidences, boxes, names: Dict[int, str], min_conf: float):
+        self.timestamps = timestamps
+        self.offsets = offsets
+        self.classes = classes
+        self.confidences = confidences
+        self.boxes = boxes
+        self.names = names
+        self.min_conf = min_conf
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    def box_frames(self):
+        """Frame index of every stored box."""
+        import numpy as np
+
+        return np.repeat(np.arange(len(self.timestamps)), np.diff(self.offsets))
+
+    def kth_confidence(self, class_ids, confidence_threshold: float, k: int = 1):
+        """
+        Per frame, the k-th highest confidence among boxes of class_ids at or above the threshold.
+
+        Returns a float32 numpy array of shape (len(self),), 0.0 for frames with fewer than k such boxes.
+        """
+        import numpy as np
+
+        scores = np.zeros(len(self.timestamps), dtype=np.float32)
+        mask = np.isin(self.classes, list(class_ids)) & (self.confidences >= confidence_threshold)
+        frames = self.box_frames()[mask]
+        confidences = self.confidences[mask]
+        # sort boxes by frame, most confident first, then rank them within their frame
+        order = np.lexsort((-confidences, frames))
+        frames, confidences = frames[order], confidences[order]
+        rank = np.arange(len(frames)) - np.searchsorted(frames, frames, side='left')
+        selected = rank == k - 1
+        scores[frames[selected]] = confidences[selected]
+        return scores
+
+
+class DetectionIndex:
+    """Directory of cached detections, keyed like embedding_index.EmbeddingIndex entries."""
+
+    make_key = staticmethod(EmbeddingIndex.make_key)
+
+    def __init__(self, root: str = DEFAULT_DETECTION_DIR):
+        self.root = root
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + '.npz')
+
+    def load(self, key: str) -> Optional[Detections]:
+        """Load a cached entry, or return None if it does not exist or is unreadable."""
+        import numpy as np
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as data:
+                meta = json.loads(str(data['meta']))
+                return Detections(
+                    data['timestamps'].astype(np.int64),
+                    data['offsets'].astype(np.int64),
+                    data['classes'].astype(np.int64),
+                    data['confidences'].astype(np.float32),
+                    data['boxes'].astype(np.float32),
+                    {int(k): v for k, v in meta['names'].items()},
+                    float(meta['min_conf']),
+                )
+        except Exception:
+            return None
+
+    def save(self, key: str, detections: Detections, meta: Optional[dict] = None):
+        """Store an entry; meta is merged with the class names and confidence floor."""
+        import numpy as np
+
+        meta = dict(meta or {})
+        meta.update({'names': {str(k): v for k, v in detections.names.items()}, 'min_conf': detections.min_conf})
+        with atomic_write(self._path(key)) as f:
+            np.savez_compressed(
+                f,
+                timestamps=np.asarray(detections.timestamps, dtype=np.int64),
+                offsets=np.asarray(detections.offsets, dtype=np.int64),
+                classes=np.asarray(detections.classes, dtype=np.int16),
+                confidences=np.asarray(detections.confidences, dtype=np.float32),
+                boxes=np.asarray(detections.boxes, dtype=np.float16),
+                meta=np.array(json.dumps(meta)),
+            )
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent per-video index of sampled frame embeddings.
+AISearchEngine stores the CLIP embedding of every sampled frame together with
+its timestamp the first time a video is scanned, so later text/image queries on
+the same video are a matrix multiply over the stored vectors instead of a full
+decode and embed pass.
+
+Entries use a fixed binary layout so they can be memory-mapped instead of read:
+
+    header      64 bytes: magic, format version, vector dim, vector count
+    timestamps  count x int64 (milliseconds, ascending)
+    vectors     count x dim x float16 (rows L2-normalized)
+
+A library with tens of millions of 512-d vectors therefore takes half the space
+of float32 and is scored chunk by chunk straight from the page cache.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import struct
+from typing import Optional, Tuple
+
+DEFAULT_INDEX_DIR = os.path.join(os.path.expanduser('~'), '.videosearch_cache', 'embeddings')
+
+_MAGIC = b'VSEMB'
+_VERSION = 1
+_HEADER = struct.Struct('<5sBxxIQ')
+_HEADER_SIZE = 64
+
+# Rows converted to float32 and multiplied at a time when scoring a memory-mapped entry
+SCORE_CHUNK_ROWS = 65536
+
+# ANN indexes kept under <root>/ann; the least recently used ones are deleted beyond this
+MAX_ANN_INDEXES = 16
+
+
+@contextlib.contextmanager
+def atomic_write(path: str):
+    """
+    Open path for binary writing, creating its directory, and move the file into place
+    only once the block completes, so a crash never leaves a truncated file behind.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def video_fingerprint(video_path: str) -> dict:
+    """Identity of a video file on disk: absolute path, size and modification time."""
+    st = os.stat(video_path)
+    return {'path': os.path.abspath(video_path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+
+def max_similarity(embeddings, queries, chunk_rows: int = SCORE_CHUNK_ROWS):
+    """
+    Best cosine similarity of every stored vector against a stack of queries.
+
+    Args:
+        embeddings: (N, dim) array, typically a float16 memmap returned by EmbeddingIndex.load.
+        queries: (Q, dim) float32 array of L2-normalized query vectors.
+        chunk_rows: Rows converted to float32 at a time, bounding the working memory.
+
+    Returns:
+        float32 numpy array of shape (N,).
+    """
+    import numpy as np
+
+    queries_t = np.ascontiguousarray(np.asarray(queries, dtype=np.float32).T)
+    scores = np.empty(len(embeddings), dtype=np.float32)
+    for start in range(0, len(embeddings), chunk_rows):
+        chunk = np.asarray(embeddings[start:start + chunk_rows], dtype=np.float32)
+        # (rows, dim) @ (dim, num_queries) -> best similarity per row
+        scores[start:start + len(chunk)] = (chunk @ queries_t).max(axis=1)
+    return scores
+
+
+class EmbeddingIndex:
+    """
+    Directory of cached frame embeddings, one entry per (video, sampling settings, model).
+
+    An entry is keyed by the video's path, size and mtime plus the sampling
+    interval, sampling mode and model name, so editing or replacing a video, or
+    changing how it is sampled, never returns stale vectors.
+    """
+
+    def __init__(self, root: str = DEFAULT_INDEX_DIR):
+        self.root = root
+
+    @staticmethod
+    def make_key(video_path: str, sample_interval_s: float, model_name: str, **extra) -> Optional[str]:
+        """Return the cache key for a video, or None if the file cannot be inspected."""
+        try:
+            ident = video_fingerprint(video_path)
+        except OSError:
+            return None
+        ident.update({'interval': round(float(sample_interval_s), 6), 'model': model_name})
+        ident.update(extra)
+        return hashlib.sha1(json.dumps(ident, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + '.emb')
+
+    def load(self, key: str) -> Optional[Tuple[object, object]]:
+        """
+        Open a cached entry without reading it into memory.
+
+        Returns (timestamps_ms, embeddings) as read-only numpy memmaps of shape (N,)
+        int64 and (N, dim) float16, or None if the entry does not exist or is unreadable.
+        """
+        import numpy as np
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                magic, version, dim, count = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                return None
+            if os.path.getsize(path) != _HEADER_SIZE + count * 8 + count * dim * 2:
+                return None
+            if count == 0:
+                return np.zeros(0, dtype=np.int64), np.zeros((0, dim), dtype=np.float16)
+            timestamps = np.memmap(path, dtype=np.int64, mode='r', offset=_HEADER_SIZE, shape=(count,))
+            embeddings = np.memmap(path, dtype=np.float16, mode='r', offset=_HEADER_SIZE + count * 8, shape=(count, dim))
+            return timestamps, embeddings
+        except (OSError, ValueError, struct.error):
+            return None
+
+    def ann_path(self, keys) -> str:
+        """
+        Location of the ANN index (see ann_index.IVFIndex) built over the entries of keys, in order.
+
+        The name also covers each entry file's size and mtime, so rewriting an entry never
+        finds an index built over its old vectors.
+        """
+        digest = hashlib.sha1()
+        for key in keys:
+            try:
+                st = os.stat(self._path(key))
+                stamp = f'{st.st_size}:{st.st_mtime_ns}'
+            except OSError:
+                stamp = ''
+            digest.update(f'{key} {stamp}\n'.encode('utf-8'))
+        return os.path.join(self.root, 'ann', digest.hexdigest() + '.npz')
+
+    def load_ann(self, keys):
+        """The ann_index.IVFIndex saved for the entries of keys with save_ann, or None."""
+        from ann_index import IVFIndex
+
+        path = self.ann_path(keys)
+        ivf = IVFIndex.load(path)
+        if ivf is not None:
+            try:
+                # eviction goes by last use
+                os.utime(path)
+            except OSError:
+                pass
+        return ivf
+
+    def save_ann(self, keys, ivf):
+        """
+        Store an ann_index.IVFIndex built over the entries of keys, with the keys next to
+        it so rewriting one of those entries deletes it, then evict the least recently
+        used indexes beyond MAX_ANN_INDEXES.
+        """
+        keys = list(keys)
+        path = self.ann_path(keys)
+        ivf.save(path)
+        with open(path[:-len('.npz')] + '.json', 'w', encoding='utf-8') as f:
+            json.dump({'keys': keys}, f)
+
+        indexes = []
+        for name in os.listdir(os.path.dirname(path)):
+            if name.endswith('.npz'):
+                try:
+                    indexes.append((os.path.getmtime(os.path.join(self.root, 'ann', name)), name))
+                except OSError:
+                    pass
+        indexes.sort(reverse=True)
+        for _, name in indexes[MAX_ANN_INDEXES:]:
+            self._remove_ann(os.path.join(self.root, 'ann', name))
+
+    def _drop_ann(self, key: str):
+        """Delete every ANN index built over the entry of key."""
+        ann_dir = os.path.join(self.root, 'ann')
+        try:
+            names = os.listdir(ann_dir)
+        except OSError:
+            return
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(ann_dir, name), 'r', encoding='utf-8') as f:
+                    keys = json.load(f).get('keys', [])
+            except (OSError, ValueError, AttributeError):
+                continue
+            if key in keys:
+                self._remove_ann(os.path.join(ann_dir, name[:-len('.json')] + '.npz'))
+
+    @staticmethod
+    def _remove_ann(path: str):
+        for stale in (path, path[:-len('.npz')] + '.json'):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+    def load_meta(self, key: str) -> Optional[dict]:
+        """Metadata stored with an entry (video path, model...), or None."""
+        try:
+            with open(self._path(key)[:-len('.emb')] + '.json', 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key: str, timestamps_ms, embeddings, meta: Optional[dict] = None):
+        """Store an entry; timestamps_ms is (N,) ascending, embeddings is (N, dim) with rows L2-normalized."""
+        import numpy as np
+
+        timestamps_ms = np.ascontiguousarray(timestamps_ms, dtype='<i8')
+        embeddings = np.ascontiguousarray(embeddings, dtype='<f2')
+        if embeddings.ndim != 2 or len(embeddings) != len(timestamps_ms):
+            raise ValueError("embeddings must be (N, dim) with one row per timestamp")
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path[:-len('.emb')] + '.json', 'w', encoding='utf-8') as f:
+            json.dump(meta or {}, f)
+
+        with atomic_write(path) as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, embeddings.shape[1], len(timestamps_ms)).ljust(_HEADER_SIZE, b'\0'))
+            f.write(timestamps_ms.tobytes())
+            f.write(embeddings.tobytes())
+        # ANN indexes over the old vectors are unreachable now (see ann_path)
+        self._drop_ann(key)
+
+
+class QueryEmbeddingCache:
+    """
+    Disk cache of query image embeddings, keyed by model name and image file content.
+
+    Renaming or moving a query image keeps its entry; editing it does not.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    @staticmethod
+    def make_key(data: bytes, model_name: str) -> str:
+        digest = hashlib.sha1(model_name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + '.npy')
+
+    def load(self, key: str):
+        """Return the cached (dim,) float32 embedding, or None."""
+        import numpy as np
+
+        try:
+            return np.load(self._path(key)).astype(np.float32)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key: str, embedding):
+        import numpy as np
+
+        with atomic_write(self._path(key)) as f:
+            np.save(f, np.asarray(embedding, dtype=np.float32))
@@ -0,0 +1,815 @@
+# -*- coding: utf-8 -*-
+"""
+Frame sampling helpers for AISearchEngine.
+Provides frame sources that walk a video and only fully decode the frames that
+are actually scored, plus DecodeStats to report how much decode work that saved,
+and cheap filters that keep the model from scoring many near-identical samples:
+a shot-boundary detector (select_shot_frames) and a perceptual hash (frame_dhash,
+compared together with coarse colours by is_near_duplicate).
+Like search.py, heavy imports are kept local to functions; PyAV is only needed
+for keyframe sampling and the 'pyav' decode backend.
+"""
+
+import math
+import time
+import threading
+from typing import Callable, Generator, Optional, Tuple
+
+# Sampling modes implemented on top of cv2.VideoCapture (see iter_sampled_frames)
+OPENCV_SAMPLING_MODES = ('read', 'grab', 'seek')
+# All values accepted for the `sampling` argument of open_frame_source / AISearchEngine.search
+SAMPLING_MODES = OPENCV_SAMPLING_MODES + ('keyframes',)
+# Values accepted for the `backend` argument of open_frame_source
+DECODE_BACKENDS = ('opencv', 'pyav')
+
+# Histogram distance at which select_shot_frames treats a sampled frame as a new shot
+DEFAULT_SHOT_THRESHOLD = 0.3
+# Longest time select_shot_frames goes without passing on a frame of the same shot
+DEFAULT_SHOT_MAX_INTERVAL_S = 10.0
+# Width frames are shrunk to before computing their shot histogram
+SHOT_SIGNATURE_WIDTH = 64
+# Frames with less gradient than this (0-255, see frame_fingerprint) are never treated as duplicates
+DEDUP_MIN_DETAIL = 2.0
+# Largest difference of a coarse mean colour (0-255) between two frames treated as duplicates
+DEDUP_MAX_COLOUR_DELTA = 16.0
+
+
+def fit_size(width: int, height: int, resize: Optional[Tuple[str, int]]) -> Tuple[int, int]:
+    """
+    Size a frame should be delivered at for a model input requirement.
+
+    resize is ('short', n) to bring the shorter side down to n pixels (CLIP),
+    ('long', n) to bring the longer side down to n pixels (YOLO letterbox) or
+    None for full size. Aspect ratio is kept and frames are never upscaled.
+    """
+    if not resize or width <= 0 or height <= 0:
+        return width, height
+    edge, target = resize
+    current = min(width, height) if edge == 'short' else max(width, height)
+    if current <= target:
+        return width, height
+    scale = target / float(current)
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+
+class DecodeStats:
+    """Counters collected while sampling frames from one video."""
+
+    def __init__(self, sampling: str = 'grab'):
+        self.sampling = sampling
+        self.frames_total = 0  # frames the sampler advanced over
+        self.frames_grabbed = 0  # frames demuxed/decoded with grab() (or read())
+        self.frames_retrieved = 0  # frames converted to BGR arrays with retrieve() (or read())
+        self.seeks = 0
+        self.grab_time_s = 0.0
+        self.retrieve_time_s = 0.0
+        self.seek_time_s = 0.0
+        self.resize_time_s = 0.0
+        self.source_size = (0, 0)  # decoded frame size (width, height)
+        self.output_size = (0, 0)  # size frames are delivered at after downscaling
+        self.output_bytes = 0  # bytes of BGR frames actually delivered
+        self.full_size_bytes = 0  # bytes the same frames would take at full size
+
+    @property
+    def frames_skipped(self) -> int:
+        """Frames that were never converted to a BGR array."""
+        return max(0, self.frames_total - self.frames_retrieved)
+
+    @property
+    def decode_time_s(self) -> float:
+        """Time actually spent in grab/retrieve/seek calls (and in downscaling after retrieve)."""
+        return self.grab_time_s + self.retrieve_time_s + self.seek_time_s + self.resize_time_s
+
+    def record_output(self, frame, source_size: Tuple[int, int]):
+        """Account for one delivered frame and the full-size frame it replaces."""
+        self.source_size = source_size
+        self.output_size = (frame.shape[1], frame.shape[0])
+        self.output_bytes += frame.nbytes
+        self.full_size_bytes += source_size[0] * source_size[1] * 3
+
+    def estimated_full_decode_time_s(self) -> float:
+        """Estimated time cap.read() on every frame would have taken, from the measured per-frame costs."""
+        if self.frames_grabbed == 0 or self.frames_retrieved == 0:
+            return self.decode_time_s
+        per_grab = self.grab_time_s / self.frames_grabbed
+        per_retrieve = self.retrieve_time_s / self.frames_retrieved
+        return self.frames_total * (per_grab + per_retrieve)
+
+    def estimated_time_saved_s(self) -> float:
+        """Estimated decode time saved compared with reading every frame."""
+        return max(0.0, self.estimated_full_decode_time_s() - self.decode_time_s)
+
+    def merge(self, other: 'DecodeStats'):
+        """Add the counters of another DecodeStats (e.g. from another segment of the same video)."""
+        self.frames_total += other.frames_total
+        self.frames_grabbed += other.frames_grabbed
+        self.frames_retrieved += other.frames_retrieved
+        self.seeks += other.seeks
+        self.grab_time_s += other.grab_time_s
+        self.retrieve_time_s += other.retrieve_time_s
+        self.seek_time_s += other.seek_time_s
+        self.resize_time_s += other.resize_time_s
+        self.output_bytes += other.output_bytes
+        self.full_size_bytes += other.full_size_bytes
+        if other.frames_retrieved:
+            self.source_size = other.source_size
+            self.output_size = other.output_size
+
+    def as_dict(self) -> dict:
+        return {
+            'sampling': self.sampling,
+            'frames_total': self.frames_total,
+            'frames_decoded': self.frames_retrieved,
+            'frames_skipped': self.frames_skipped,
+            'seeks': self.seeks,
+            'decode_time_s': self.decode_time_s,
+            'saved_time_s': self.estimated_time_saved_s(),
+            'resize_time_s': self.resize_time_s,
+            'source_size': self.source_size,
+            'output_size': self.output_size,
+            'output_bytes': self.output_bytes,
+            'saved_bytes': max(0, self.full_size_bytes - self.output_bytes),
+        }
+
+
+def iter_sampled_frames(
+    cap,
+    step: int,
+    sampling: str = 'grab',
+    start_frame: int = 0,
+    end_frame: Optional[int] = None,
+    wanted: Optional[Callable[[int], bool]] = None,
+    stats: Optional[DecodeStats] = None,
+    stop_check: Optional[Callable[[], bool]] = None,
+) -> Generator[Tuple[int, object], None, None]:
+    """
+    Yield (frame_idx, frame) for every step-th frame of an opened cv2.VideoCapture.
+
+    Args:
+        cap: Opened cv2.VideoCapture.
+        step: Distance in frames between sampled frames.
+        sampling: 'read' decodes every frame with cap.read() (legacy behaviour),
+            'grab' advances with cap.grab() and only calls cap.retrieve() on sampled
+            frames, 'seek' jumps straight to each sampled frame. 'seek' is the
+            fastest for large steps on seekable files but depends on the container
+            index, so 'grab' is the safe default.
+        start_frame: First frame index to consider.
+        end_frame: Stop before this frame index (None reads to the end of the video).
+        wanted: optional predicate; sampled frames for which it returns False are
+            skipped without being retrieved.
+        stats: optional DecodeStats updated while sampling.
+        stop_check: optional callable; sampling stops as soon as it returns True.
+    """
+    import cv2
+
+    if sampling not in OPENCV_SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode: {sampling}")
+
+    step = max(1, int(step))
+    if stats is None:
+        stats = DecodeStats(sampling)
+
+    if sampling == 'seek':
+        frame_idx = start_frame
+        while end_frame is None or frame_idx < end_frame:
+            if stop_check and stop_check():
+                return
+            if wanted is not None and not wanted(frame_idx):
+                frame_idx += step
+                continue
+
+            t0 = time.perf_counter()
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+            t1 = time.perf_counter()
+            ok = cap.grab()
+            t2 = time.perf_counter()
+            frame = cap.retrieve()[1] if ok else None
+            t3 = time.perf_counter()
+            stats.seeks += 1
+            stats.seek_time_s += t1 - t0
+            stats.grab_time_s += t2 - t1
+            if not ok or frame is None:
+                return
+            stats.retrieve_time_s += t3 - t2
+            stats.frames_grabbed += 1
+            stats.frames_retrieved += 1
+            # the container may land on a nearby frame; report where we really are
+            actual_idx = int(cap.get(cv2.CAP_PROP_POS_FRAMES) or (frame_idx + 1)) - 1
+            stats.frames_total = max(stats.frames_total, actual_idx + 1 - start_frame)
+            yield max(start_frame, actual_idx), frame
+            frame_idx = max(frame_idx, actual_idx) + step
+        return
+
+    frame_idx = start_frame
+    if start_frame > 0:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+        stats.seeks += 1
+
+    while end_frame is None or frame_idx < end_frame:
+        if stop_check and stop_check():
+            return
+
+        is_sample = (frame_idx - start_frame) % step == 0 and (wanted is None or wanted(frame_idx))
+
+        if sampling == 'read':
+            t0 = time.perf_counter()
+            ok, frame = cap.read()
+            # read() is grab() + retrieve(); book it as both so the saving estimate stays at zero
+            elapsed = time.perf_counter() - t0
+            if not ok:
+                return
+            stats.grab_time_s += elapsed / 2.0
+            stats.retrieve_time_s += elapsed / 2.0
+            stats.frames_grabbed += 1
+            stats.frames_retrieved += 1
+        else:
+            t0 = time.perf_counter()
+            ok = cap.grab()
+            stats.grab_time_s += time.perf_counter() - t0
+            if not ok:
+                return
+            stats.frames_grabbed += 1
+            frame = None
+            if is_sample:
+                t0 = time.perf_counter()
+                ok, frame = cap.retrieve()
+                stats.retrieve_time_s += time.perf_counter() - t0
+                if not ok:
+                    return
+                stats.frames_retrieved += 1
+
+        stats.frames_total += 1
+        if is_sample:
+            yield frame_idx, frame
+        frame_idx += 1
+
+
+class FrameSource:
+    """
+    An opened video that yields (timestamp_ms, frame) for each sampled frame.
+
+    Use open_frame_source() to create one. total_samples is an estimate used for
+    progress reporting and may be refined while frames are being read.
+    duration_ms is 0 when the length of the video is unknown.
+    """
+
+    def __init__(self, video_path: str, sample_interval_s: float, sampling: str, resize=None):
+        self.video_path = video_path
+        self.sample_interval_s = sample_interval_s
+        self.sampling = sampling
+        self.resize = resize  # see fit_size()
+        self.stats = DecodeStats(sampling)
+        self.total_samples = 1
+        self.duration_ms = 0
+
+    def frames(
+        self,
+        wanted: Optional[Callable[[int], bool]] = None,
+        stop_check: Optional[Callable[[], bool]] = None,
+        start_ms: int = 0,
+        end_ms: Optional[int] = None,
+    ) -> Generator[Tuple[int, object], None, None]:
+        """
+        Yield (timestamp_ms, BGR frame); frames whose timestamp fails wanted() are not decoded.
+
+        start_ms/end_ms restrict sampling to [start_ms, end_ms) by seeking to start_ms
+        first. Adjacent ranges that share a boundary never sample the same frame.
+        """
+        raise NotImplementedError
+
+    def release(self):
+        pass
+
+
+class OpenCVFrameSource(FrameSource):
+    """
+    Frame source backed by cv2.VideoCapture, sampling every N-th frame.
+
+    OpenCV always converts at full resolution, so a requested resize is applied
+    right after retrieve() with INTER_AREA.
+    """
+
+    def __init__(self, video_path: str, sample_interval_s: float, sampling: str, resize=None):
+        import cv2
+
+        super().__init__(video_path, sample_interval_s, sampling, resize)
+        self._cap = cv2.VideoCapture(video_path)
+        if not self._cap.isOpened():
+            raise IOError(f"Cannot open video: {video_path}")
+
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.frame_count = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        self.step = max(1, int(round(self.fps * sample_interval_s)))
+        self.total_samples = (self.frame_count + self.step - 1) // self.step if self.frame_count > 0 else 1
+        self.duration_ms = int(self.frame_count / self.fps * 1000) if self.frame_count > 0 else 0
+
+    def _frame_at(self, ms: int) -> int:
+        """First frame on the sampling grid at or after ms."""
+        steps = int(math.ceil(ms * self.fps / 1000.0 / self.step - 1e-9))
+        return max(0, steps) * self.step
+
+    def frames(self, wanted=None, stop_check=None, start_ms=0, end_ms=None):
+        fps = self.fps
+        start_frame = self._frame_at(start_ms) if start_ms > 0 else 0
+        end_frame = self._frame_at(end_ms) if end_ms is not None else None
+        if end_frame is None and self.sampling == 'seek' and self.frame_count > 0:
+            end_frame = self.frame_count
+        for frame_idx, frame in iter_sampled_frames(
+            self._cap,
+            self.step,
+            sampling=self.sampling,
+            start_frame=start_frame,
+            end_frame=end_frame,
+            wanted=(lambda idx: wanted(int((idx / fps) * 1000))) if wanted else None,
+            stats=self.stats,
+            stop_check=stop_check,
+        ):
+            yield int((frame_idx / fps) * 1000), self._downscale(frame)
+
+    def _downscale(self, frame):
+        import cv2
+
+        source_size = (frame.shape[1], frame.shape[0])
+        if self.resize:
+            width, height = fit_size(source_size[0], source_size[1], self.resize)
+            if (width, height) != source_size:
+                t0 = time.perf_counter()
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                self.stats.resize_time_s += time.perf_counter() - t0
+        self.stats.record_output(frame, source_size)
+        return frame
+
+    def release(self):
+        try:
+            self._cap.release()
+        except Exception:
+            pass
+
+
+class PyAVFrameSource(FrameSource):
+    """
+    Frame source backed by PyAV (FFmpeg).
+
+    With sampling='keyframes' the decoder is told to skip every non-key frame,
+    so P/B frames are never reconstructed, and keyframes closer than
+    sample_interval_s to the previously sampled one are dropped. Otherwise
+    every frame is decoded and the first frame at or after each multiple of
+    sample_interval_s is sampled. Timestamps are exact presentation times
+    relative to the start of the stream.
+
+    A requested resize is done by swscale in the same pass that converts the
+    decoder's YUV output to BGR, so a full-size BGR frame is never allocated.
+    """
+
+    def __init__(self, video_path: str, sample_interval_s: float, sampling: str = 'keyframes', resize=None):
+        try:
+            import av
+        except ImportError as e:
+            raise ImportError("Keyframe sampling and the 'pyav' decode backend require PyAV (pip install av)") from e
+
+        super().__init__(video_path, sample_interval_s, sampling, resize)
+        self.keyframes_only = sampling == 'keyframes'
+        self._container = av.open(video_path)
+        if not self._container.streams.video:
+            self._container.close()
+            raise IOError(f"No video stream in: {video_path}")
+
+        self._stream = self._container.streams.video[0]
+        self._stream.thread_type = 'AUTO'
+        if self.keyframes_only:
+            self._stream.codec_context.skip_frame = 'NONKEY'
+
+        time_base = self._stream.time_base
+        if self._stream.duration is not None and time_base is not None:
+            self.duration_ms = int(float(self._stream.duration * time_base) * 1000)
+        elif self._container.duration is not None:
+            self.duration_ms = int(self._container.duration / 1000)  # AV_TIME_BASE is microseconds
+        else:
+            self.duration_ms = 0
+
+        rate = self._stream.average_rate
+        fps = float(rate) if rate else 25.0
+        self.frame_count = int(self._stream.frames or (self.duration_ms / 1000.0) * fps)
+        if self.keyframes_only:
+            # refined from the observed keyframe spacing once decoding starts
+            self.total_samples = max(1, int(math.ceil(self.duration_ms / 1000.0 / max(sample_interval_s, 2.0))))
+        else:
+            self.total_samples = max(1, int(math.ceil(self.duration_ms / 1000.0 / max(sample_interval_s, 1e-3))))
+
+    def frames(self, wanted=None, stop_check=None, start_ms=0, end_ms=None):
+        stream = self._stream
+        time_base = stream.time_base
+        start_pts = stream.start_time or 0
+        interval_ms = max(1, int(self.sample_interval_s * 1000))
+        last_sampled_ms = None
+        # next grid point to sample when decoding every frame
+        next_due_ms = int(math.ceil(start_ms / float(interval_ms))) * interval_ms
+        frames_seen = 0
+        samples = 0
+        stats = self.stats
+
+        if start_ms > 0:
+            # lands on the keyframe at or before start_ms; earlier frames are skipped below
+            self._container.seek(start_pts + int(start_ms / 1000.0 / time_base), stream=stream, backward=True)
+            stats.seeks += 1
+
+        decoder = self._container.decode(stream)
+        while True:
+            if stop_check and stop_check():
+                return
+
+            t0 = time.perf_counter()
+            try:
+                frame = next(decoder)
+            except StopIteration:
+                break
+            stats.grab_time_s += time.perf_counter() - t0
+            stats.frames_grabbed += 1
+
+            if frame.pts is None:
+                continue
+            pos_ms = int(round(float((frame.pts - start_pts) * time_base) * 1000))
+            if pos_ms < start_ms:
+                continue
+            if end_ms is not None and pos_ms >= end_ms:
+                break
+
+            frames_seen += 1
+            if self.keyframes_only:
+                if last_sampled_ms is not None and pos_ms - last_sampled_ms < interval_ms:
+                    continue
+                samples += 1
+                if pos_ms > start_ms and self.duration_ms > 0:
+                    # estimate total samples from the keyframe spacing so far; keyframes
+                    # denser than the interval (short GOPs, all-intra) are mostly dropped
+                    spacing_ms = max((pos_ms - start_ms) / frames_seen, interval_ms, 1)
+                    self.total_samples = max(samples, int(self.duration_ms / spacing_ms))
+            else:
+                if pos_ms < next_due_ms:
+                    continue
+                next_due_ms = (pos_ms // interval_ms + 1) * interval_ms
+
+            if wanted is not None and not wanted(pos_ms):
+                continue
+
+            width, height = fit_size(frame.width, frame.height, self.resize)
+            t0 = time.perf_counter()
+            if (width, height) != (frame.width, frame.height):
+                image = frame.to_ndarray(format='bgr24', width=width, height=height, interpolation='AREA')
+            else:
+                image = frame.to_ndarray(format='bgr24')
+            stats.retrieve_time_s += time.perf_counter() - t0
+            stats.frames_retrieved += 1
+            stats.record_output(image, (frame.width, frame.height))
+            last_sampled_ms = pos_ms
+            yield pos_ms, image
+
+        if not self.keyframes_only:
+            stats.frames_total = stats.frames_grabbed
+            return
+        # every frame the decoder skipped counts towards the saving estimate
+        frame_count = self.frame_count
+        if self.duration_ms > 0 and (start_ms > 0 or end_ms is not None):
+            range_ms = min(end_ms if end_ms is not None else self.duration_ms, self.duration_ms) - start_ms
+            frame_count = int(frame_count * max(0, range_ms) / self.duration_ms)
+        stats.frames_total = max(frame_count, frames_seen)
+
+    def release(self):
+        try:
+            self._container.close()
+        except Exception:
+            pass
+
+
+class PrefetchStats:
+    """Queue depth and stall counters for prefetch_frames."""
+
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.depth_samples = 0
+        self.depth_total = 0
+        self.depth_max = 0
+        self.producer_stall_s = 0.0  # decoder blocked on a full queue (inference is the bottleneck)
+        self.consumer_stall_s = 0.0  # inference blocked on an empty queue (decode is the bottleneck)
+
+    def record_depth(self, depth: int):
+        self.depth_samples += 1
+        self.depth_total += depth
+        self.depth_max = max(self.depth_max, depth)
+
+    @property
+    def depth_avg(self) -> float:
+        return self.depth_total / self.depth_samples if self.depth_samples else 0.0
+
+    def merge(self, other: 'PrefetchStats'):
+        """Add the counters of another PrefetchStats (e.g. from another segment of the same video)."""
+        self.depth_samples += other.depth_samples
+        self.depth_total += other.depth_total
+        self.depth_max = max(self.depth_max, other.depth_max)
+        self.producer_stall_s += other.producer_stall_s
+        self.consumer_stall_s += other.consumer_stall_s
+
+    def as_dict(self) -> dict:
+        return {
+            'prefetch_queue_size': self.queue_size,
+            'prefetch_depth_avg': self.depth_avg,
+            'prefetch_depth_max': self.depth_max,
+            'producer_stall_s': self.producer_stall_s,
+            'consumer_stall_s': self.consumer_stall_s,
+        }
+
+
+class _PrefetchError:
+    """Carries an exception raised in the decoder thread over to the consumer."""
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+_PREFETCH_END = object()
+
+
+def prefetch_frames(
+    frames: Generator,
+    maxsize: int = 8,
+    stats: Optional[PrefetchStats] = None,
+) -> Generator:
+    """
+    Run a frame generator in a background decoder thread and yield its items.
+
+    The decoder thread fills a bounded queue of at most maxsize items, so decode
+    of the next frames overlaps with model inference on the current ones while
+    memory stays bounded. OpenCV and PyAV release the GIL while decoding, so
+    the two stages really run in parallel. Exceptions raised by the decoder are
+    re-raised in the consumer. Closing this generator stops the decoder thread
+    and closes the wrapped generator before returning, so the caller may release
+    the underlying capture afterwards.
+    """
+    import queue
+
+    maxsize = max(1, int(maxsize))
+    if stats is None:
+        stats = PrefetchStats(maxsize)
+    q = queue.Queue(maxsize=maxsize)
+    stop_event = threading.Event()
+
+    def _put(item) -> bool:
+        t0 = time.perf_counter()
+        try:
+            while not stop_event.is_set():
+                try:
+                    q.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            stats.producer_stall_s += time.perf_counter() - t0
+
+    def _producer():
+        try:
+            for item in frames:
+                if not _put(item):
+                    break
+        except BaseException as e:
+            _put(_PrefetchError(e))
+        finally:
+            try:
+                frames.close()
+            except Exception:
+                pass
+            _put(_PREFETCH_END)
+
+    thread = threading.Thread(target=_producer, name='frame-prefetch', daemon=True)
+    thread.start()
+    try:
+        while True:
+            stats.record_depth(q.qsize())
+            t0 = time.perf_counter()
+            item = q.get()
+            stats.consumer_stall_s += time.perf_counter() - t0
+            if item is _PREFETCH_END:
+                break
+            if isinstance(item, _PrefetchError):
+                raise item.exc
+            yield item
+    finally:
+        stop_event.set()
+        # unblock a producer waiting on a full queue, then wait for it to let go of the capture
+        while thread.is_alive():
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                thread.join(timeout=0.05)
+
+
+class ShotStats:
+    """Counters for select_shot_frames."""
+
+    def __init__(self, threshold: float, max_interval_s: float):
+        self.threshold = threshold
+        self.max_interval_s = max_interval_s
+        self.frames_seen = 0  # sampled frames compared by the shot detector
+        self.frames_selected = 0  # frames passed on to the model
+        self.shots = 0  # shot boundaries found (the first frame of a range counts as one)
+        self.detect_time_s = 0.0
+
+    @property
+    def frames_skipped(self) -> int:
+        return max(0, self.frames_seen - self.frames_selected)
+
+    def merge(self, other: 'ShotStats'):
+        """Add the counters of another ShotStats (e.g. from another segment of the same video)."""
+        self.frames_seen += other.frames_seen
+        self.frames_selected += other.frames_selected
+        self.shots += other.shots
+        self.detect_time_s += other.detect_time_s
+
+    def as_dict(self) -> dict:
+        return {
+            'shot_threshold': self.threshold,
+            'shot_frames_seen': self.frames_seen,
+            'shot_frames_selected': self.frames_selected,
+            'shot_frames_skipped': self.frames_skipped,
+            'shots': self.shots,
+            'shot_detect_time_s': self.detect_time_s,
+        }
+
+
+def shot_signature(frame):
+    """
+    Hue/saturation/brightness histogram of a frame, the signature compared by select_shot_frames.
+
+    The frame is first shrunk to SHOT_SIGNATURE_WIDTH pixels wide, so the cost does not
+    depend on the decoded size. Histograms ignore where things are in the picture, so
+    a moving speaker or a passing car barely changes them while a cut to another shot
+    (other lighting, other colours) does.
+    """
+    import cv2
+
+    height, width = frame.shape[:2]
+    if width > SHOT_SIGNATURE_WIDTH:
+        small_height = max(1, int(round(height * SHOT_SIGNATURE_WIDTH / float(width))))
+        frame = cv2.resize(frame, (SHOT_SIGNATURE_WIDTH, small_height), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    # coarse brightness bins so cuts between shots of one colour but other lighting still count
+    hist = cv2.calcHist([hsv], [0, 1, 2], None, [12, 8, 4], [0, 180, 0, 256, 0, 256])
+    return cv2.normalize(hist, hist, 1.0, 0.0, cv2.NORM_L1)
+
+
+def select_shot_frames(
+    frames: Generator,
+    threshold: float = DEFAULT_SHOT_THRESHOLD,
+    max_interval_s: float = DEFAULT_SHOT_MAX_INTERVAL_S,
+    stats: Optional[ShotStats] = None,
+) -> Generator:
+    """
+    Yield only the (timestamp_ms, frame) items of frames that start a new shot.
+
+    Every sampled frame is compared with the last frame passed on, by the Bhattacharyya
+    distance (0 = identical, 1 = disjoint) of their shot_signature histograms. A frame
+    at threshold or more starts a new shot and is passed on; the others repeat the
+    current shot and are dropped. Comparing with the last passed frame rather than the
+    previous sample also catches slow changes (pans, fades) once they add up. With
+    max_interval_s > 0 a long shot also passes on one frame every max_interval_s, so a
+    static shot is still represented by a few frames. The first frame is always passed on.
+    Closing this generator closes frames.
+    """
+    import cv2
+
+    if stats is None:
+        stats = ShotStats(threshold, max_interval_s)
+    reference = None
+    reference_ms = None
+    try:
+        for pos_ms, frame in frames:
+            stats.frames_seen += 1
+            t0 = time.perf_counter()
+            signature = shot_signature(frame)
+            new_shot = reference is None or cv2.compareHist(reference, signature, cv2.HISTCMP_BHATTACHARYYA) >= threshold
+            stats.detect_time_s += time.perf_counter() - t0
+            if new_shot:
+                stats.shots += 1
+            elif not (max_interval_s > 0 and pos_ms - reference_ms >= max_interval_s * 1000):
+                continue
+            reference, reference_ms = signature, pos_ms
+            stats.frames_selected += 1
+            yield pos_ms, frame
+    finally:
+        frames.close()
+
+
+class DedupStats:
+    """Counters for near-duplicate suppression by perceptual hash (see frame_dhash)."""
+
+    def __init__(self, max_distance: int):
+        self.max_distance = max_distance
+        self.frames_hashed = 0
+        self.frames_reused = 0  # frames that reused the model output of an earlier frame
+        self.hash_time_s = 0.0
+
+    def merge(self, other: 'DedupStats'):
+        """Add the counters of another DedupStats (e.g. from another segment of the same video)."""
+        self.frames_hashed += other.frames_hashed
+        self.frames_reused += other.frames_reused
+        self.hash_time_s += other.hash_time_s
+
+    def as_dict(self) -> dict:
+        return {
+            'dedup_max_distance': self.max_distance,
+            'dedup_frames_hashed': self.frames_hashed,
+            'dedup_frames_reused': self.frames_reused,
+            'dedup_hash_time_s': self.hash_time_s,
+        }
+
+
+def frame_dhash(frame) -> int:
+    """
+    64-bit difference hash of a BGR frame.
+
+    The frame is shrunk to 9x8 grayscale pixels and each bit records whether a pixel
+    is brighter than its right neighbour, so re-encoding noise, small motion and
+    brightness drift leave most bits alone. Compare two hashes with hamming_distance.
+    """
+    return frame_fingerprint(frame)[0]
+
+
+def frame_fingerprint(frame) -> Tuple[int, 'np.ndarray', float]:
+    """
+    Everything is_near_duplicate compares, from one 9x8 shrink of a BGR frame.
+
+    Returns:
+        (frame_dhash value, 2x2 grid of mean BGR colours as a float32 array,
+        detail: mean absolute difference between horizontal neighbours of the
+        9x8 grayscale image, 0-255).
+    """
+    import cv2
+    import numpy as np
+
+    small = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    gradient = gray[:, 1:].astype(np.int16) - gray[:, :-1]
+    frame_hash = int.from_bytes(np.packbits(gradient > 0).tobytes(), 'big')
+    colour = cv2.resize(small, (2, 2), interpolation=cv2.INTER_AREA).astype(np.float32)
+    return frame_hash, colour, float(np.abs(gradient).mean())
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of differing bits between two frame_dhash values."""
+    return bin(a ^ b).count('1')
+
+
+def is_near_duplicate(a: tuple, b: tuple, max_distance: int) -> bool:
+    """
+    Whether two frame_fingerprint values are close enough for one frame to reuse the other's model outputs.
+
+    The hashes must be within max_distance bits, but the difference hash only sees
+    gradients: on frames with almost none (below DEDUP_MIN_DETAIL) its bits are noise,
+    and frames that differ only in colour or brightness hash alike. Such frames are
+    never duplicates, nor are frames whose coarse colours differ by more than
+    DEDUP_MAX_COLOUR_DELTA.
+    """
+    import numpy as np
+
+    if min(a[2], b[2]) < DEDUP_MIN_DETAIL:
+        return False
+    if hamming_distance(a[0], b[0]) > max_distance:
+        return False
+    return float(np.abs(a[1] - b[1]).max()) <= DEDUP_MAX_COLOUR_DELTA
+
+
+def open_frame_source(
+    video_path: str,
+    sample_interval_s: float = 1.0,
+    sampling: str = 'grab',
+    resize: Optional[Tuple[str, int]] = None,
+    backend: str = 'opencv',
+) -> Optional[FrameSource]:
+    """
+    Open a video for sampling.
+
+    Args:
+        video_path: Video file to open.
+        sample_interval_s: Interval between sampled frames in seconds.
+        sampling: One of SAMPLING_MODES.
+        resize: Deliver frames downscaled for the model input (see fit_size).
+        backend: 'opencv' (default) or 'pyav'. The PyAV backend scales inside the
+            decoder's colour conversion; it supports 'grab'/'read' (equivalent there)
+            and 'keyframes'. 'seek' always uses OpenCV and 'keyframes' always uses PyAV.
+
+    Returns None if the video cannot be opened. Raises ValueError for an unknown
+    sampling mode or backend and ImportError if PyAV is needed but not installed.
+    """
+    if sampling not in SAMPLING_MODES:
+        raise ValueError(f"Unknown sampling mode: {sampling}")
+    if backend not in DECODE_BACKENDS:
+        raise ValueError(f"Unknown decode backend: {backend}")
+
+    try:
+        if sampling == 'keyframes' or (backend == 'pyav' and sampling != 'seek'):
+            return PyAVFrameSource(video_path, sample_interval_s, sampling, resize)
+        return OpenCVFrameSource(video_path, sample_interval_s, sampling, resize)
+    except ImportError:
+        raise
+    except Exception:
+        return None
@@ -0,0 +1,372 @@
+# -*- coding: utf-8 -*-
+"""
+ONNX Runtime inference backend for AISearchEngine (backend='onnx').
+CLIP's vision and text towers and the YOLO detector are exported to ONNX once
+(this step needs torch, transformers and ultralytics) and then run with ONNX
+Runtime on CPU. Running the exported models only needs numpy, OpenCV,
+onnxruntime and tokenizers: images are preprocessed by preprocess.clip_preprocess
+or letterboxed here, and YOLO's boxes go through a numpy NMS.
+
+An export directory holds, per model:
+
+    clip_image.onnx, clip_text.onnx   towers returning L2-normalized embeddings
+    clip_*.int8.onnx                  dynamically quantized copies (precision='int8')
+    tokenizer.json, clip.json         tokenizer and preprocessing settings
+    yolo.onnx, yolo.json              detector and its class names
+
+so a directory exported on one machine can be copied to headless hosts:
+
+    python onnx_backend.py [--dir DIR] [--precision int8]
+"""
+
+import json
+import math
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_ONNX_DIR = os.path.join(os.path.expanduser('~'), '.videosearch_cache', 'onnx')
+
+ONNX_OPSET = 17
+
+# CLIP's text position embeddings cover this many tokens
+CLIP_TEXT_MAX_LENGTH = 77
+
+# Same post-processing defaults as ultralytics predictions
+YOLO_IOU = 0.7
+YOLO_MAX_DET = 300
+_YOLO_MAX_NMS = 30000
+_YOLO_STRIDE = 32
+_LETTERBOX_COLOR = 114
+
+
+def model_dir(root: str, model_name: str) -> str:
+    """Export directory of one model under root."""
+    return os.path.join(root, re.sub(r'[^\w.-]+', '_', model_name))
+
+
+def _onnx_path(directory: str, name: str, precision: str) -> str:
+    suffix = '.onnx' if precision == 'fp32' else f'.{precision}.onnx'
+    return os.path.join(directory, name + suffix)
+
+
+def _session(path: str, intra_op_threads: int = 0, inter_op_threads: int = 0):
+    """CPU InferenceSession with full graph optimizations; 0 threads keeps ONNX Runtime's default."""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if intra_op_threads:
+        options.intra_op_num_threads = int(intra_op_threads)
+    if inter_op_threads:
+        options.inter_op_num_threads = int(inter_op_threads)
+        # inter-op threads only run independent graph branches in parallel mode
+        if inter_op_threads > 1:
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+    return ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+
+
+def _quantize(src: str, dst: str):
+    """Write a copy of src with dynamic int8 quantization of its weights."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp_path = dst + '.tmp'
+    quantize_dynamic(src, tmp_path, weight_type=QuantType.QInt8)
+    os.replace(tmp_path, dst)
+
+
+def _torch_export(module, args: tuple, path: str, input_names: List[str], output_names: List[str], dynamic_axes: dict):
+    import torch
+
+    tmp_path = path + '.tmp'
+    with torch.no_grad():
+        torch.onnx.export(
+            module, args, tmp_path,
+            input_names=input_names, output_names=output_names, dynamic_axes=dynamic_axes,
+            opset_version=ONNX_OPSET, dynamo=False,
+        )
+    os.replace(tmp_path, path)
+
+
+def export_clip(model_name: str, directory: str, precision: str = 'fp32'):
+    """
+    Export CLIP's towers, tokenizer and preprocessing settings to directory.
+
+    Both towers include the final L2 normalization, so their outputs are used as is.
+    Files that already exist are kept.
+    """
+    import torch
+
+    os.makedirs(directory, exist_ok=True)
+    image_path = _onnx_path(directory, 'clip_image', 'fp32')
+    text_path = _onnx_path(directory, 'clip_text', 'fp32')
+
+    if not all(os.path.exists(p) for p in (image_path, text_path, os.path.join(directory, 'clip.json'))):
+        from transformers import CLIPModel, CLIPProcessor
+        from preprocess import processor_kwargs
+
+        model = CLIPModel.from_pretrained(model_name).eval()
+        processor = CLIPProcessor.from_pretrained(model_name)
+
+        class _Tower(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                # registered as a submodule so the exporter sees the weights as parameters
+                self.model = model
+
+        class _ImageTower(_Tower):
+            def forward(self, pixel_values):
+                features = self.model.get_image_features(pixel_values=pixel_values)
+                return features / features.norm(dim=-1, keepdim=True)
+
+        class _TextTower(_Tower):
+            def forward(self, input_ids, attention_mask):
+                features = self.model.get_text_features(input_ids=input_ids, attention_mask=attention_mask)
+                return features / features.norm(dim=-1, keepdim=True)
+
+        kwargs = processor_kwargs(processor.image_processor)
+        pixel_values = torch.zeros((1, 3, kwargs['crop_size'], kwargs['crop_size']), dtype=torch.float32)
+        _torch_export(
+            _ImageTower(), (pixel_values,), image_path,
+            ['pixel_values'], ['embeddings'], {'pixel_values': {0: 'batch'}, 'embeddings': {0: 'batch'}},
+        )
+        tokens = processor(text=['a photo'], return_tensors='pt', padding=True)
+        _torch_export(
+            _TextTower(), (tokens['input_ids'], tokens['attention_mask']), text_path,
+            ['input_ids', 'attention_mask'], ['embeddings'],
+            {'input_ids': {0: 'batch', 1: 'sequence'}, 'attention_mask': {0: 'batch', 1: 'sequence'}, 'embeddings': {0: 'batch'}},
+        )
+
+        processor.tokenizer.save_pretrained(directory)
+        if not os.path.exists(os.path.join(directory, 'tokenizer.json')):
+            raise RuntimeError(f"{model_name} has no fast tokenizer (tokenizer.json) to export")
+        settings = dict(kwargs, model=model_name, pad_token_id=int(processor.tokenizer.pad_token_id))
+        with open(os.path.join(directory, 'clip.json'), 'w', encoding='utf-8') as f:
+            json.dump(settings, f)
+
+    if precision != 'fp32':
+        for name in ('clip_image', 'clip_text'):
+            if not os.path.exists(_onnx_path(directory, name, precision)):
+                _quantize(_onnx_path(directory, name, 'fp32'), _onnx_path(directory, name, precision))
+
+
+def export_yolo(model_name: str, directory: str, imgsz: int = 640):
+    """Export an ultralytics YOLO model with dynamic batch and image size, plus its class names."""
+    onnx_path = os.path.join(directory, 'yolo.onnx')
+    names_path = os.path.join(directory, 'yolo.json')
+    if os.path.exists(onnx_path) and os.path.exists(names_path):
+        return
+
+    import shutil
+
+    from ultralytics import YOLO
+
+    os.makedirs(directory, exist_ok=True)
+    model = YOLO(model_name)
+    exported = model.export(format='onnx', imgsz=imgsz, dynamic=True, simplify=False, opset=ONNX_OPSET)
+    shutil.move(str(exported), onnx_path + '.tmp')
+    os.replace(onnx_path + '.tmp', onnx_path)
+    with open(names_path, 'w', encoding='utf-8') as f:
+        json.dump({'model': model_name, 'imgsz': imgsz, 'names': {str(k): v for k, v in model.names.items()}}, f)
+
+
+class OnnxCLIP:
+    """CLIP towers exported by export_clip, run with ONNX Runtime."""
+
+    def __init__(self, directory: str, precision: str = 'fp32', intra_op_threads: int = 0, inter_op_threads: int = 0):
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(directory, 'clip.json'), 'r', encoding='utf-8') as f:
+            settings = json.load(f)
+        # clip_preprocess arguments
+        self.preprocess_kwargs = {k: settings[k] for k in ('size', 'crop_size', 'mean', 'std')}
+        self._tokenizer = Tokenizer.from_file(os.path.join(directory, 'tokenizer.json'))
+        self._tokenizer.enable_truncation(CLIP_TEXT_MAX_LENGTH)
+        self._tokenizer.enable_padding(pad_id=settings['pad_token_id'])
+        self._image = _session(_onnx_path(directory, 'clip_image', precision), intra_op_threads, inter_op_threads)
+        self._text = _session(_onnx_path(directory, 'clip_text', precision), intra_op_threads, inter_op_threads)
+
+    def embed_images(self, pixel_values):
+        """(N, 3, crop, crop) float32 pixel values -> (N, dim) float32 L2-normalized embeddings."""
+        import numpy as np
+
+        return self._image.run(None, {'pixel_values': np.ascontiguousarray(pixel_values, dtype=np.float32)})[0]
+
+    def embed_texts(self, texts: List[str]):
+        """Texts -> (N, dim) float32 L2-normalized embeddings."""
+        import numpy as np
+
+        encodings = self._tokenizer.encode_batch(list(texts))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        return self._text.run(None, {'input_ids': input_ids, 'attention_mask': attention_mask})[0]
+
+
+def letterbox(frames: List, imgsz: int = 640):
+    """
+    Resize BGR frames to fit imgsz (keeping aspect ratio) and pad them like ultralytics' LetterBox.
+
+    Frames that share a size are padded to the smallest stride-aligned rectangle, so a
+    16:9 video runs at 640x384 instead of 640x640; mixed sizes are padded to a square.
+
+    Returns:
+        (float32 NCHW RGB batch scaled to 0..1, [(gain, pad_left, pad_top)] per frame)
+    """
+    import cv2
+    import numpy as np
+
+    shapes = {frame.shape[:2] for frame in frames}
+    if len(shapes) == 1:
+        height, width = shapes.pop()
+        gain = min(imgsz / height, imgsz / width)
+        out_h = int(math.ceil(round(height * gain) / _YOLO_STRIDE) * _YOLO_STRIDE)
+        out_w = int(math.ceil(round(width * gain) / _YOLO_STRIDE) * _YOLO_STRIDE)
+    else:
+        out_h = out_w = imgsz
+
+    batch = np.full((len(frames), out_h, out_w, 3), _LETTERBOX_COLOR, dtype=np.uint8)
+    transforms = []
+    for i, frame in enumerate(frames):
+        height, width = frame.shape[:2]
+        gain = min(imgsz / height, imgsz / width)
+        new_w, new_h = int(round(width * gain)), int(round(height * gain))
+        if (new_w, new_h) != (width, height):
+            frame = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+        left, top = (out_w - new_w) // 2, (out_h - new_h) // 2
+        batch[i, top:top + new_h, left:left + new_w] = frame
+        transforms.append((gain, left, top))
+    # BGR -> RGB, HWC -> CHW
+    pixels = batch[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32)
+    pixels *= 1.0 / 255.0
+    return np.ascontiguousarray(pixels), transforms
+
+
+def nms(boxes, scores, iou_threshold: float) -> List[int]:
+    """Greedy non-maximum suppression over (N, 4) xyxy boxes; returns kept indices, best first."""
+    import numpy as np
+
+    order = np.argsort(-scores)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while len(order):
+        i = order[0]
+        keep.append(int(i))
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return keep
+
+
+class OnnxYOLO:
+    """
+    YOLO detector exported by export_yolo, run with ONNX Runtime.
+
+    Attributes:
+        names: Class id -> class name, like ultralytics.YOLO.names.
+        overrides: {'imgsz': ...}, like ultralytics.YOLO.overrides.
+    """
+
+    def __init__(self, directory: str, intra_op_threads: int = 0, inter_op_threads: int = 0):
+        with open(os.path.join(directory, 'yolo.json'), 'r', encoding='utf-8') as f:
+            settings = json.load(f)
+        self.names: Dict[int, str] = {int(k): v for k, v in settings['names'].items()}
+        self.overrides = {'imgsz': int(settings.get('imgsz', 640))}
+        self._session = _session(os.path.join(directory, 'yolo.onnx'), intra_op_threads, inter_op_threads)
+        self._input = self._session.get_inputs()[0].name
+
+    def __call__(
+        self,
+        frames: List,
+        conf: float = 0.25,
+        classes: Optional[List[int]] = None,
+        iou: float = YOLO_IOU,
+        max_det: int = YOLO_MAX_DET,
+    ) -> List[Tuple[object, object, object]]:
+        """
+        Detect objects in BGR frames.
+
+        Returns:
+            Per frame (class ids int64, confidences float32, xyxyn boxes float32), most confident first.
+        """
+        return self.detect(self.preprocess(frames), conf, classes, iou, max_det)
+
+    def preprocess(self, frames: List):
+        """Letterboxed input batch for detect (see letterbox)."""
+        pixels, transforms = letterbox(frames, self.overrides['imgsz'])
+        return pixels, transforms, [frame.shape[:2] for frame in frames]
+
+    def detect(
+        self,
+        inputs,
+        conf: float = 0.25,
+        classes: Optional[List[int]] = None,
+        iou: float = YOLO_IOU,
+        max_det: int = YOLO_MAX_DET,
+    ) -> List[Tuple[object, object, object]]:
+        """Run the detector on a batch returned by preprocess; same results as calling the model on the frames."""
+        import numpy as np
+
+        pixels, transforms, shapes = inputs
+        # (N, 4 + num_classes, anchors): cx, cy, w, h in input pixels, then per-class scores
+        predictions = self._session.run(None, {self._input: pixels})[0].transpose(0, 2, 1)
+        results = []
+        for (height, width), prediction, (gain, left, top) in zip(shapes, predictions, transforms):
+            class_scores = prediction[:, 4:]
+            cls = class_scores.argmax(axis=1)
+            confidences = class_scores[np.arange(len(cls)), cls]
+            keep = confidences > conf
+            if classes is not None:
+                keep &= np.isin(cls, classes)
+            xywh, cls, confidences = prediction[keep, :4], cls[keep], confidences[keep]
+            if len(confidences) > _YOLO_MAX_NMS:
+                top_k = np.argsort(-confidences)[:_YOLO_MAX_NMS]
+                xywh, cls, confidences = xywh[top_k], cls[top_k], confidences[top_k]
+            boxes = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+            # offset boxes by class so one NMS pass never suppresses across classes
+            keep = nms(boxes + cls[:, None] * 7680.0, confidences, iou)[:max_det]
+            boxes, cls, confidences = boxes[keep], cls[keep], confidences[keep]
+
+            # undo the letterbox, clip to the frame and normalize
+            boxes = (boxes - np.array([left, top, left, top], dtype=np.float32)) / gain
+            boxes = np.clip(boxes, 0, [width, height, width, height]) / np.array([width, height, width, height], dtype=np.float32)
+            results.append((cls.astype(np.int64), confidences.astype(np.float32), boxes.astype(np.float32)))
+        return results
+
+
+def load_clip(root: str, model_name: str, precision: str = 'fp32', intra_op_threads: int = 0, inter_op_threads: int = 0) -> OnnxCLIP:
+    """OnnxCLIP for model_name, exporting it under root first if needed."""
+    directory = model_dir(root, model_name)
+    if not all(os.path.exists(_onnx_path(directory, name, precision)) for name in ('clip_image', 'clip_text')):
+        export_clip(model_name, directory, precision)
+    return OnnxCLIP(directory, precision, intra_op_threads, inter_op_threads)
+
+
+def load_yolo(root: str, model_name: str, imgsz: int = 640, intra_op_threads: int = 0, inter_op_threads: int = 0) -> OnnxYOLO:
+    """OnnxYOLO for model_name, exporting it under root first if needed."""
+    directory = model_dir(root, model_name)
+    export_yolo(model_name, directory, imgsz)
+    return OnnxYOLO(directory, intra_op_threads, inter_op_threads)
+
+
+def main(argv=None):
+    import argparse
+
+    from search import CLIP_MODEL_NAME, CLIP_PRECISIONS, YOLO_INPUT_SIZE, YOLO_MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Export the VideoSearch models for the ONNX Runtime backend")
+    parser.add_argument('--dir', default=DEFAULT_ONNX_DIR, help="export directory (AISearchEngine onnx_dir)")
+    parser.add_argument('--precision', default='fp32', choices=CLIP_PRECISIONS, help="also write quantized CLIP towers")
+    args = parser.parse_args(argv)
+
+    export_clip(CLIP_MODEL_NAME, model_dir(args.dir, CLIP_MODEL_NAME), args.precision)
+    export_yolo(YOLO_MODEL_NAME, model_dir(args.dir, YOLO_MODEL_NAME), YOLO_INPUT_SIZE)
+    print(f"Exported {CLIP_MODEL_NAME} and {YOLO_MODEL_NAME} to {args.dir}")
+
+
+if __name__ == "__main__":
+    main()
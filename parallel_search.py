@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-process search across several videos.
+Each worker process owns its own AISearchEngine (and therefore its own copy of
+the models), decodes and scores whole videos, and streams events back to the
+parent through a queue. SearchWorker uses iter_parallel_search to turn those
+events into its usual Qt signals.
+"""
+
+import os
+import time
+from typing import Callable, Generator, List, Optional
+
+# Minimum delay between two per-frame progress events sent by one worker
+_PROGRESS_INTERVAL_S = 0.2
+
+
+def _worker_main(worker_idx, task_queue, event_queue, stop_event, engine_kwargs, search_kwargs, torch_threads):
+    """Entry point of a worker process: search videos from task_queue until a None sentinel arrives."""
+    if engine_kwargs.get('backend') == 'onnx':
+        # size ONNX Runtime's pool the same way, and keep torch out of the worker
+        engine_kwargs = dict(engine_kwargs, intra_op_threads=engine_kwargs.get('intra_op_threads') or torch_threads)
+    else:
+        try:
+            import torch
+            torch.set_num_threads(torch_threads)
+        except Exception:
+            pass
+
+    from search import AISearchEngine
+
+    engine = AISearchEngine(**engine_kwargs)
+
+    while not stop_event.is_set():
+        video_path = task_queue.get()
+        if video_path is None:
+            break
+
+        event_queue.put(('start', worker_idx, video_path))
+        last_progress = [0.0]
+
+        def _progress_callback(path, processed, total_samples, reused=0):
+            now = time.monotonic()
+            if now - last_progress[0] >= _PROGRESS_INTERVAL_S or processed >= total_samples:
+                last_progress[0] = now
+                event_queue.put(('progress', worker_idx, path, int(processed), int(total_samples), int(reused)))
+
+        def _stats_callback(path, stats):
+            event_queue.put(('stats', worker_idx, path, stats))
+
+        try:
+            for item in engine.search(
+                video_paths=[video_path],
+                progress_callback=_progress_callback,
+                stop_check=stop_event.is_set,
+                stats_callback=_stats_callback,
+                **search_kwargs
+            ):
+                path, timestamp_ms, score = item[:3]
+                # multi-query searches tag each match with its query
+                event_queue.put(('match', worker_idx, path, int(timestamp_ms), float(score)) + tuple(item[3:]))
+        except BaseException as e:
+            event_queue.put(('error', worker_idx, video_path, str(e)))
+
+        event_queue.put(('done', worker_idx, video_path))
+
+    event_queue.put(('exit', worker_idx))
+
+
+def iter_parallel_search(
+    video_paths: List[str],
+    search_kwargs: dict,
+    workers: int = 2,
+    engine_kwargs: Optional[dict] = None,
+    stop_check: Optional[Callable[[], bool]] = None,
+) -> Generator[tuple, None, None]:
+    """
+    Search video_paths in a pool of worker processes and yield events as they arrive.
+
+    Args:
+        video_paths: Videos to search; each one is handled entirely by one worker.
+        search_kwargs: Keyword arguments for AISearchEngine.search (mode, queries,
+            thresholds, sampling options...). Must be picklable, so no callbacks.
+        workers: Number of worker processes. Every worker loads its own models.
+        engine_kwargs: Keyword arguments used to build the AISearchEngine in each worker.
+        stop_check: optional callable polled by the parent; when it returns True all
+            workers are asked to stop.
+
+    Yields:
+        ('start', video_path)
+        ('progress', video_path, processed, total_samples, reused)
+        ('match', video_path, timestamp_ms, score) or, in 'multi' mode,
+        ('match', video_path, timestamp_ms, score, query)
+        ('stats', video_path, stats_dict)
+        ('error', video_path, message)
+        ('done', video_path)
+    """
+    import multiprocessing
+    import queue
+
+    workers = max(1, min(int(workers), len(video_paths)))
+    if not video_paths:
+        return
+
+    # spawn keeps CUDA/Qt state of the parent out of the children on every platform
+    ctx = multiprocessing.get_context('spawn')
+    task_queue = ctx.Queue()
+    event_queue = ctx.Queue()
+    stop_event = ctx.Event()
+    torch_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    for video_path in video_paths:
+        task_queue.put(video_path)
+    for _ in range(workers):
+        task_queue.put(None)
+
+    processes = []
+    for worker_idx in range(workers):
+        p = ctx.Process(
+            target=_worker_main,
+            args=(worker_idx, task_queue, event_queue, stop_event, engine_kwargs or {}, search_kwargs, torch_threads),
+            name=f'video-search-{worker_idx}',
+            daemon=True,
+        )
+        p.start()
+        processes.append(p)
+
+    in_flight = {}  # worker_idx -> video_path
+    exited = set()
+    try:
+        while len(exited) < workers:
+            if stop_check and stop_check():
+                stop_event.set()
+
+            try:
+                event = event_queue.get(timeout=0.1)
+            except queue.Empty:
+                # a worker that died without saying goodbye (crash, OOM kill) must not hang the search
+                for worker_idx, p in enumerate(processes):
+                    if worker_idx not in exited and not p.is_alive():
+                        exited.add(worker_idx)
+                        video_path = in_flight.pop(worker_idx, None)
+                        if video_path is not None:
+                            yield ('error', video_path, f"Worker process exited with code {p.exitcode}")
+                            yield ('done', video_path)
+                continue
+
+            kind, worker_idx = event[0], event[1]
+            if kind == 'exit':
+                exited.add(worker_idx)
+                continue
+            if kind == 'start':
+                in_flight[worker_idx] = event[2]
+            elif kind == 'done':
+                in_flight.pop(worker_idx, None)
+            yield (kind,) + tuple(event[2:])
+    finally:
+        stop_event.set()
+        for p in processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
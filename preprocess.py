@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Fast CLIP image preprocessing for batches of OpenCV frames.
+Reproduces what CLIPProcessor does (shortest-edge resize, center crop,
+rescale, normalize) with OpenCV and vectorized numpy ops, without building
+PIL images or going through the generic HuggingFace processor. Only numpy and
+OpenCV are needed, so the same code also serves torch-free backends.
+"""
+
+from typing import List, Sequence
+
+# Defaults of openai/clip-vit-base-patch32; AISearchEngine reads the real values from the processor config
+CLIP_MEAN = (0.48145466, 0.4578275, 0.40821073)
+CLIP_STD = (0.26862954, 0.26130258, 0.27577711)
+
+
+def clip_preprocess(
+    frames: List,
+    size: int = 224,
+    crop_size: int = 224,
+    mean: Sequence[float] = CLIP_MEAN,
+    std: Sequence[float] = CLIP_STD,
+):
+    """
+    Turn BGR uint8 frames into a CLIP pixel_values batch.
+
+    Args:
+        frames: BGR uint8 numpy arrays (H, W, 3), as returned by OpenCV; sizes may differ.
+        size: Target length of the shorter side before cropping (must be >= crop_size).
+        crop_size: Side of the square center crop.
+        mean: Per-channel RGB mean used for normalization.
+        std: Per-channel RGB standard deviation used for normalization.
+
+    Returns:
+        float32 numpy array of shape (len(frames), 3, crop_size, crop_size).
+    """
+    import cv2
+    import numpy as np
+
+    batch = np.empty((len(frames), crop_size, crop_size, 3), dtype=np.uint8)
+    for i, frame in enumerate(frames):
+        height, width = frame.shape[:2]
+        # same output size rule as transformers' shortest_edge resize
+        if width <= height:
+            new_w, new_h = size, int(size * height / width)
+        else:
+            new_w, new_h = int(size * width / height), size
+        if (new_w, new_h) != (width, height):
+            # INTER_AREA approximates PIL's antialiased bicubic when shrinking
+            interpolation = cv2.INTER_AREA if new_w < width else cv2.INTER_CUBIC
+            frame = cv2.resize(frame, (new_w, new_h), interpolation=interpolation)
+        top = (new_h - crop_size) // 2
+        left = (new_w - crop_size) // 2
+        batch[i] = frame[top:top + crop_size, left:left + crop_size]
+
+    # BGR -> RGB, then (x / 255 - mean) / std folded into one multiply-add over the whole batch
+    scale = 1.0 / (255.0 * np.asarray(std, dtype=np.float32))
+    offset = np.asarray(mean, dtype=np.float32) / np.asarray(std, dtype=np.float32)
+    pixels = batch[..., ::-1].astype(np.float32)
+    pixels *= scale
+    pixels -= offset
+    return np.ascontiguousarray(pixels.transpose(0, 3, 1, 2))
+
+
+def processor_kwargs(image_processor, default_size: int = 224) -> dict:
+    """clip_preprocess arguments matching a HuggingFace CLIPImageProcessor configuration."""
+    size, crop_size = image_processor.size, image_processor.crop_size
+    # dict in older transformers releases, SizeDict in newer ones, a plain int in some configs
+    if hasattr(size, 'get'):
+        size = size.get('shortest_edge')
+    if hasattr(crop_size, 'get'):
+        crop_size = crop_size.get('height')
+    return {
+        'size': int(size or default_size),
+        'crop_size': int(crop_size or default_size),
+        'mean': [float(v) for v in image_processor.image_mean],
+        'std': [float(v) for v in image_processor.image_std],
+    }
+
+
+def compare_with_processor(frames: List, processor, **kwargs) -> dict:
+    """
+    Compare clip_preprocess against a HuggingFace CLIPProcessor on the same frames.
+
+    Returns a dict with the maximum and mean absolute difference of the
+    normalized pixel values. kwargs are forwarded to clip_preprocess.
+    """
+    import numpy as np
+    from PIL import Image
+
+    fast = clip_preprocess(frames, **kwargs)
+    reference = processor(images=[Image.fromarray(f[:, :, ::-1]) for f in frames], return_tensors='np')['pixel_values']
+    diff = np.abs(fast - reference.astype(np.float32))
+    return {'max_abs': float(diff.max()), 'mean_abs': float(diff.mean())}
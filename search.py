@@ -6,8 +6,50 @@ This module intentionally keeps imports local to functions so
 the application can still start without dependencies for other features.
 """
 
+import math
+import os
+import threading
 from typing import List, Tuple, Generator, Optional, Callable
 
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+YOLO_MODEL_NAME = "yolov8n.pt"
+
+# After a match, further matches within this window (in milliseconds) are suppressed
+MATCH_LOCKOUT_MS = 2000
+
+# Smallest frame sizes the models need: CLIP resizes the shorter side to 224 before
+# center-cropping, YOLO letterboxes the longer side to 640
+CLIP_INPUT_SIZE = 224
+YOLO_INPUT_SIZE = 640
+
+# Largest mean absolute difference (in normalized pixel units) accepted between the fast
+# numpy preprocessing and CLIPProcessor before the engine falls back to the processor
+FAST_PREPROCESS_TOLERANCE = 0.05
+
+# Text query embeddings kept in memory per engine (least recently used are dropped first)
+TEXT_CACHE_SIZE = 256
+
+# Lowest YOLO confidence recorded in the detection index; category queries with a
+# lower threshold rescan the video
+DETECTION_MIN_CONF = 0.1
+
+# Below this many indexed frames an exact scan is already interactive and ann_probes is ignored
+ANN_MIN_VECTORS = 50000
+
+# CLIP weight precisions: 'int8' applies dynamic int8 quantization to every nn.Linear (CPU only)
+CLIP_PRECISIONS = ('fp32', 'int8')
+
+# 'torch' runs the models eagerly with PyTorch; 'onnx' runs ONNX exports with ONNX Runtime on CPU
+BACKENDS = ('torch', 'onnx')
+
+# With near-duplicate suppression a batch is cut after batch_size * DEDUP_BATCH_SPAN sampled
+# frames, and the next batch runs the model on its first frame again
+DEDUP_BATCH_SPAN = 8
+
+# Sampling interval of the first pass of a progressive (time_budget_s) search; each later
+# pass halves it until sample_interval_s is reached
+PROGRESSIVE_START_S = 16.0
+
 
 def format_ms(ms: int) -> str:
     s = ms // 1000
@@ -17,70 +59,350 @@ def format_ms(ms: int) -> str:
     return f"{h:02d}:{m:02d}:{sec:02d}"
 
 
+def quantize_clip_model(model):
+    """
+    Return a CPU copy of a CLIPModel with dynamic int8 quantization of its nn.Linear layers.
+
+    Attention projections and MLPs of both towers, which hold nearly all the weights and
+    FLOPs, run as int8 matmuls; convolutions, embeddings and layer norms stay fp32.
+    """
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+
+    return quantize_dynamic(model.to("cpu").eval(), {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class TimeBudget:
+    """
+    Wall-clock budget of a progressive search, shared by the videos it scans.
+
+    Each video gets an even share of what is left when it starts, counting it and
+    the videos after it, so time a fast (or indexed) video does not use goes to the
+    videos after it.
+    """
+
+    def __init__(self, seconds: float, video_paths: List[str]):
+        import time
+
+        self.seconds = float(seconds)
+        self.deadline = time.monotonic() + self.seconds
+        self.video_paths = list(video_paths)
+
+    def video_deadline(self, video_path: str) -> float:
+        """time.monotonic() deadline for scanning video_path."""
+        import time
+
+        try:
+            videos_left = len(self.video_paths) - self.video_paths.index(video_path)
+        except ValueError:
+            videos_left = 1
+        now = time.monotonic()
+        return now + max(0.0, self.deadline - now) / max(1, videos_left)
+
+
 class AISearchEngine:
     """
     AI-powered search engine using CLIP for text/image search and YOLO for category/object search.
     """
 
-    def __init__(self):
-        """Initialize the AISearchEngine. Models are loaded lazily on first use."""
+    def __init__(
+        self,
+        fast_preprocess: bool = True,
+        use_index: bool = True,
+        index_dir: Optional[str] = None,
+        detection_dir: Optional[str] = None,
+        precision: str = 'fp32',
+        backend: str = 'torch',
+        onnx_dir: Optional[str] = None,
+        intra_op_threads: int = 0,
+        inter_op_threads: int = 0,
+    ):
+        """
+        Initialize the AISearchEngine. Models are loaded lazily on first use.
+
+        Args:
+            fast_preprocess: Preprocess video frames for CLIP with batched numpy/OpenCV ops
+                (preprocess.clip_preprocess) instead of CLIPProcessor. The first batch is
+                checked against CLIPProcessor and the engine falls back to it if the
+                difference exceeds FAST_PREPROCESS_TOLERANCE.
+            use_index: Store the CLIP embeddings and YOLO detections of sampled frames on disk
+                and answer later queries on the same video from them (see embedding_index.py
+                and detection_index.py). Query image embeddings are cached under index_dir too.
+            index_dir: Directory of the embedding index (default embedding_index.DEFAULT_INDEX_DIR).
+            detection_dir: Directory of the detection index (default detection_index.DEFAULT_DETECTION_DIR).
+            precision: CLIP precision, 'fp32' or 'int8'. 'int8' quantizes the linear layers of
+                both towers dynamically (weights int8, activations quantized per batch) and
+                always runs on CPU. Embeddings are cached per precision, since int8 vectors
+                drift slightly from fp32 ones (see benchmarks.py clip-int8).
+            backend: 'torch' or 'onnx'. 'onnx' runs CLIP and YOLO with ONNX Runtime on CPU
+                (see onnx_backend.py); the models are exported to onnx_dir on first use,
+                which needs torch, but searching with an existing export never imports
+                torch, transformers or ultralytics. Both backends share the indexes.
+            onnx_dir: Directory of the ONNX exports (default onnx_backend.DEFAULT_ONNX_DIR).
+            intra_op_threads: ONNX Runtime threads used inside one operator (0 = its default).
+            inter_op_threads: ONNX Runtime threads running independent operators (0 = its default).
+        """
+        from collections import OrderedDict
+        from detection_index import DEFAULT_DETECTION_DIR, DetectionIndex
+        from embedding_index import DEFAULT_INDEX_DIR, EmbeddingIndex, QueryEmbeddingCache
+
+        if precision not in CLIP_PRECISIONS:
+            raise ValueError(f"Unknown CLIP precision: {precision!r}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend: {backend!r}")
+        self.fast_preprocess = fast_preprocess
+        self._fast_preprocess_verified = False
+        self.use_index = use_index
+        self.precision = precision
+        self.backend = backend
+        self.onnx_dir = onnx_dir
+        self.intra_op_threads = int(intra_op_threads)
+        self.inter_op_threads = int(inter_op_threads)
+        self.index_dir = index_dir or DEFAULT_INDEX_DIR
+        self._index = EmbeddingIndex(self.index_dir) if use_index else None
+        self.detection_dir = detection_dir or DEFAULT_DETECTION_DIR
+        self._detections = DetectionIndex(self.detection_dir) if use_index else None
+        self._query_image_cache = QueryEmbeddingCache(os.path.join(self.index_dir, 'queries')) if use_index else None
+        # (model name, text) -> normalized text embedding, most recently used last
+        self._text_cache = OrderedDict()
+        # warm_up and a search may embed texts on different threads
+        self._text_cache_lock = threading.Lock()
         self._clip_model = None
         self._clip_processor = None
         self._yolo_model = None
         self._device = None
+        # ultralytics predictors keep per-call state and must not run concurrently
+        self._yolo_lock = threading.Lock()
+        # held while a model loads, so a search started during warm_up waits instead of loading twice
+        self._load_lock = threading.Lock()
+
+    def get_config(self) -> dict:
+        """Constructor keyword arguments that recreate an equivalent engine, e.g. in a worker process."""
+        return {
+            'fast_preprocess': self.fast_preprocess,
+            'use_index': self.use_index,
+            'index_dir': self.index_dir,
+            'detection_dir': self.detection_dir,
+            'precision': self.precision,
+            'backend': self.backend,
+            'onnx_dir': self.onnx_dir,
+            'intra_op_threads': self.intra_op_threads,
+            'inter_op_threads': self.inter_op_threads,
+        }
+
+    @property
+    def clip_model_id(self) -> str:
+        """Name of the CLIP weights and precision, used in cache keys so fp32 and int8 embeddings never mix."""
+        return CLIP_MODEL_NAME if self.precision == 'fp32' else f"{CLIP_MODEL_NAME}@{self.precision}"
 
     def _ensure_clip_loaded(self):
         """Lazy load CLIP model and processor."""
-        if self._clip_model is None:
+        if self._clip_model is not None:
+            return
+        with self._load_lock:
+            if self._clip_model is not None:
+                return
+            if self.backend == 'onnx':
+                from onnx_backend import DEFAULT_ONNX_DIR, load_clip
+
+                model = load_clip(
+                    self.onnx_dir or DEFAULT_ONNX_DIR, CLIP_MODEL_NAME, self.precision,
+                    self.intra_op_threads, self.inter_op_threads,
+                )
+                self._device = "cpu"
+                self._clip_model = model
+                return
             import torch
             from transformers import CLIPModel, CLIPProcessor
 
-            self._device = "cuda" if torch.cuda.is_available() else "cpu"
-            self._clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
-            self._clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
-            self._clip_model.to(self._device)
-            self._clip_model.eval()
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+            model = CLIPModel.from_pretrained(CLIP_MODEL_NAME)
+            self._clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
+            if self.precision == 'int8':
+                model, device = quantize_clip_model(model), "cpu"
+            model.to(device)
+            model.eval()
+            self._device = device
+            # published last: other threads only check _clip_model
+            self._clip_model = model
 
     def _ensure_yolo_loaded(self):
         """Lazy load YOLO model."""
-        if self._yolo_model is None:
+        if self._yolo_model is not None:
+            return
+        with self._load_lock:
+            if self._yolo_model is not None:
+                return
+            if self.backend == 'onnx':
+                from onnx_backend import DEFAULT_ONNX_DIR, load_yolo
+
+                self._yolo_model = load_yolo(
+                    self.onnx_dir or DEFAULT_ONNX_DIR, YOLO_MODEL_NAME, YOLO_INPUT_SIZE,
+                    self.intra_op_threads, self.inter_op_threads,
+                )
+                return
             from ultralytics import YOLO
-            self._yolo_model = YOLO("yolov8n.pt")
+            self._yolo_model = YOLO(YOLO_MODEL_NAME)
+
+    def warm_up(self, mode: str, stop_check: Optional[Callable[[], bool]] = None) -> float:
+        """
+        Load the model(s) a search mode needs and run one dummy inference, so the first real
+        search does not pay for imports, weight loading and kernel setup. Safe to call from a
+        background thread while the UI starts; a search started meanwhile waits for the load.
+
+        Args:
+            mode: 'image', 'text', 'category' or 'multi'.
+            stop_check: Checked between steps (a model load itself cannot be interrupted);
+                when it returns True the remaining steps are skipped.
+
+        Returns:
+            Seconds spent.
+        """
+        import time
+        import numpy as np
+        from PIL import Image
+
+        t0 = time.perf_counter()
+        steps = []
+        if mode in ('image', 'text', 'multi'):
+            steps.append(self._ensure_clip_loaded)
+            # a PIL image goes through CLIPProcessor, leaving the fast preprocessing check to real frames
+            steps.append(lambda: self._get_clip_image_embeddings([Image.new('RGB', (CLIP_INPUT_SIZE, CLIP_INPUT_SIZE))]))
+            if mode != 'image':
+                steps.append(lambda: self._get_clip_text_embedding(''))
+        if mode in ('category', 'multi'):
+            steps.append(self._ensure_yolo_loaded)
+            steps.append(lambda: self._detect_frames([np.zeros((YOLO_INPUT_SIZE, YOLO_INPUT_SIZE, 3), dtype=np.uint8)]))
+        for step in steps:
+            if stop_check and stop_check():
+                break
+            step()
+        return time.perf_counter() - t0
 
     def _get_clip_image_embedding(self, image):
         """Get CLIP embedding for an image (PIL Image or numpy array)."""
-        import torch
+        return self._get_clip_image_embeddings([image])
+
+    def _get_clip_image_embeddings(self, images):
+        """
+        Get CLIP embeddings for a batch of images in a single forward pass.
+
+        Args:
+            images: List of PIL Images or BGR numpy arrays (as returned by OpenCV).
+
+        Returns:
+            float32 numpy array of shape (len(images), dim) with L2-normalized embeddings.
+        """
+        return self._embed_clip_inputs(self._clip_inputs(images))
+
+    def _clip_inputs(self, images):
+        """
+        CLIP pixel values for a batch of images: the preprocessing half of _get_clip_image_embeddings.
+
+        Returns:
+            float32 numpy array of shape (len(images), 3, crop, crop).
+        """
         from PIL import Image
         import numpy as np
 
         self._ensure_clip_loaded()
 
-        if isinstance(image, np.ndarray):
-            # Convert BGR (OpenCV) to RGB
-            image = Image.fromarray(image[:, :, ::-1])
+        if self.backend == 'onnx':
+            from preprocess import clip_preprocess
 
-        inputs = self._clip_processor(images=image, return_tensors="pt")
-        inputs = {k: v.to(self._device) for k, v in inputs.items()}
+            # without CLIPProcessor, PIL images are converted to BGR frames too
+            frames = [image if isinstance(image, np.ndarray) else np.asarray(image.convert('RGB'))[:, :, ::-1] for image in images]
+            return clip_preprocess(frames, **self._clip_preprocess_kwargs())
+
+        if self.fast_preprocess and all(isinstance(image, np.ndarray) for image in images):
+            pixel_values = self._fast_clip_pixel_values(images)
+            if pixel_values is not None:
+                return pixel_values
+
+        pil_images = []
+        for image in images:
+            if isinstance(image, np.ndarray):
+                # Convert BGR (OpenCV) to RGB
+                image = Image.fromarray(image[:, :, ::-1])
+            pil_images.append(image)
+        return self._clip_processor(images=pil_images, return_tensors="np")['pixel_values'].astype(np.float32)
+
+    def _embed_clip_inputs(self, pixel_values):
+        """CLIP forward pass on pixel values from _clip_inputs; returns (N, dim) float32 L2-normalized embeddings."""
+        import numpy as np
+
+        if self.backend == 'onnx':
+            return self._clip_model.embed_images(pixel_values)
+
+        import torch
 
         with torch.no_grad():
-            image_features = self._clip_model.get_image_features(**inputs)
+            image_features = self._clip_model.get_image_features(pixel_values=torch.from_numpy(pixel_values).to(self._device))
             image_features = image_features / image_features.norm(dim=-1, keepdim=True)
 
-        return image_features
+        return image_features.cpu().numpy().astype(np.float32)
+
+    def _clip_preprocess_kwargs(self) -> dict:
+        """clip_preprocess arguments matching the loaded CLIP model's preprocessing configuration."""
+        if self.backend == 'onnx':
+            return self._clip_model.preprocess_kwargs
+        from preprocess import processor_kwargs
+
+        return processor_kwargs(self._clip_processor.image_processor, CLIP_INPUT_SIZE)
+
+    def _fast_clip_pixel_values(self, frames):
+        """
+        Preprocess BGR frames with preprocess.clip_preprocess.
+
+        The first call compares the result with CLIPProcessor; if the mean absolute
+        difference exceeds FAST_PREPROCESS_TOLERANCE, fast preprocessing is turned off
+        for this engine and None is returned so the caller uses the processor.
+        """
+        from preprocess import clip_preprocess, compare_with_processor
+
+        kwargs = self._clip_preprocess_kwargs()
+        if not self._fast_preprocess_verified:
+            try:
+                diff = compare_with_processor(frames[:1], self._clip_processor, **kwargs)
+            except Exception:
+                diff = None
+            if diff is None or diff['mean_abs'] > FAST_PREPROCESS_TOLERANCE:
+                self.fast_preprocess = False
+                return None
+            self._fast_preprocess_verified = True
+        return clip_preprocess(frames, **kwargs)
 
     def _get_clip_text_embedding(self, text: str):
-        """Get CLIP embedding for text."""
-        import torch
+        """
+        Get the (1, dim) float32 CLIP embedding for text; the last TEXT_CACHE_SIZE texts are served from memory.
+        """
+        key = (self.clip_model_id, text)
+        with self._text_cache_lock:
+            cached = self._text_cache.get(key)
+            if cached is not None:
+                self._text_cache.move_to_end(key)
+                return cached
 
         self._ensure_clip_loaded()
 
-        inputs = self._clip_processor(text=[text], return_tensors="pt", padding=True)
-        inputs = {k: v.to(self._device) for k, v in inputs.items()}
+        if self.backend == 'onnx':
+            text_features = self._clip_model.embed_texts([text])
+        else:
+            import numpy as np
+            import torch
 
-        with torch.no_grad():
-            text_features = self._clip_model.get_text_features(**inputs)
-            text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            inputs = self._clip_processor(text=[text], return_tensors="pt", padding=True)
+            inputs = {k: v.to(self._device) for k, v in inputs.items()}
 
+            with torch.no_grad():
+                text_features = self._clip_model.get_text_features(**inputs)
+                text_features = text_features / text_features.norm(dim=-1, keepdim=True)
+            text_features = text_features.cpu().numpy().astype(np.float32)
+
+        with self._text_cache_lock:
+            self._text_cache[key] = text_features
+            while len(self._text_cache) > TEXT_CACHE_SIZE:
+                self._text_cache.popitem(last=False)
         return text_features
 
     def search(
@@ -95,319 +417,1401 @@ class AISearchEngine:
         confidence_threshold: float = 0.5,
         progress_callback: Optional[Callable[[str, int, int], None]] = None,
         stop_check: Optional[Callable[[], bool]] = None,
-    ) -> Generator[Tuple[str, int, float], None, None]:
+        batch_size: int = 8,
+        sampling: str = 'grab',
+        stats_callback: Optional[Callable[[str, dict], None]] = None,
+        prefetch: int = 8,
+        segments: int = 1,
+        downscale: bool = True,
+        decode_backend: str = 'opencv',
+        ann_probes: int = 0,
+        queries: Optional[List[Tuple[str, object]]] = None,
+        preprocess_workers: int = 1,
+        inference_workers: int = 1,
+        pipeline_queue: int = 2,
+        shot_threshold: float = 0.0,
+        shot_max_interval_s: float = 10.0,
+        dedup_max_distance: Optional[int] = None,
+        coarse_interval_s: float = 0.0,
+        refine_margin: float = 0.05,
+        time_budget_s: float = 0.0,
+    ) -> Generator[tuple, None, None]:
         """
         Search videos for matches based on the specified mode.
 
         Args:
             video_paths: List of video file paths to search.
-            mode: One of 'image', 'text', or 'category'.
+            mode: One of 'image', 'text', 'category' or 'multi'.
             query_images: List of query image paths (for 'image' mode).
             query_text: Text query string (for 'text' mode).
-            query_category: Category/object name to detect (for 'category' mode).
+            query_category: Category query such as "person AND dog" (for 'category' mode, see category_query.py).
             sample_interval_s: Interval between sampled frames in seconds.
             similarity_threshold: Minimum similarity score for CLIP matches.
             confidence_threshold: Minimum confidence for YOLO detections.
-            progress_callback: optional callback called as progress_callback(video_path, processed_count, total_samples)
+            progress_callback: Called as progress_callback(video_path, processed, total[, reused]).
+            batch_size: Sampled frames passed to the model per call.
+            sampling: 'grab', 'seek', 'read' or 'keyframes' (see frame_sampler.SAMPLING_MODES).
+            stats_callback: Called as stats_callback(video_path, stats_dict) after each video.
+            prefetch: Frames queued by a background decoder thread when the pipeline runs inline.
+            segments: Time segments of each video scanned concurrently.
+            downscale: Decode frames at the size the active model needs instead of full size.
+            decode_backend: 'opencv' or 'pyav' (see frame_sampler.open_frame_source).
+            ann_probes: IVF clusters probed per query for indexed videos; 0 scores every stored frame.
+            queries: For 'multi' mode, ('text' | 'image' | 'category', query) tuples evaluated in one pass.
+            preprocess_workers: Threads preparing model inputs (see search_pipeline.run_pipeline).
+            inference_workers: Threads running the model; 0 for both runs the pipeline inline.
+            pipeline_queue: Batches held between two pipeline stages.
+            shot_threshold: Only score frames that start a new shot (see frame_sampler.select_shot_frames).
+            shot_max_interval_s: With shot_threshold, still score a frame this often within a shot.
+            dedup_max_distance: Reuse model results for near-duplicate frames (see frame_sampler.is_near_duplicate).
+            coarse_interval_s: Sample this often, then rescan near-threshold frames (see _scan_video_refined).
+            refine_margin: How far below the threshold a coarse frame still gets rescanned.
+            time_budget_s: Scan progressively within this wall-clock budget (see _scan_video_progressive).
 
         Yields:
-            Tuples of (video_path, timestamp_ms, score) for each match found.
+            Tuples of (video_path, timestamp_ms, score) for each match found; in 'multi'
+            mode (video_path, timestamp_ms, score, query) where query is the entry of
+            queries that matched. The 2 second de-duplication is applied per query.
         """
-        import cv2
+        resize_mode = mode
+        if mode == 'multi':
+            resize_mode = 'category' if any(kind == 'category' for kind, _ in queries or []) else 'text'
+
+        scan_kwargs = {
+            'sample_interval_s': sample_interval_s,
+            'progress_callback': progress_callback,
+            'stop_check': stop_check,
+            'batch_size': max(1, int(batch_size)),
+            'sampling': sampling,
+            'stats_callback': stats_callback,
+            # the threaded pipeline decodes ahead on its own thread; a second hand-off thread
+            # in front of it would only add a queue of frame copies
+            'prefetch': max(0, int(prefetch)) if max(preprocess_workers, inference_workers) <= 0 else 0,
+            'segments': max(1, int(segments)),
+            'resize': self._frame_resize(resize_mode) if downscale else None,
+            'decode_backend': decode_backend,
+            'preprocess_workers': max(0, int(preprocess_workers)),
+            'inference_workers': max(0, int(inference_workers)),
+            'pipeline_queue': max(1, int(pipeline_queue)),
+            'shots': (float(shot_threshold), max(0.0, float(shot_max_interval_s))) if shot_threshold > 0 else None,
+            'dedup': max(0, int(dedup_max_distance)) if dedup_max_distance is not None else None,
+            'coarse_interval_s': float(coarse_interval_s) if coarse_interval_s > sample_interval_s else 0.0,
+            'refine_margin': max(0.0, float(refine_margin)),
+            'budget': TimeBudget(time_budget_s, video_paths) if time_budget_s > 0 else None,
+        }
 
         if mode == 'image':
             yield from self._search_by_image(
-                video_paths, query_images, sample_interval_s, similarity_threshold, progress_callback, stop_check
+                video_paths, query_images, similarity_threshold, ann_probes=ann_probes, **scan_kwargs
             )
         elif mode == 'text':
             yield from self._search_by_text(
-                video_paths, query_text, sample_interval_s, similarity_threshold, progress_callback, stop_check
+                video_paths, query_text, similarity_threshold, ann_probes=ann_probes, **scan_kwargs
             )
         elif mode == 'category':
-            yield from self._search_by_category(
-                video_paths, query_category, sample_interval_s, confidence_threshold, progress_callback, stop_check
+            yield from self._search_by_category(video_paths, query_category, confidence_threshold, **scan_kwargs)
+        elif mode == 'multi':
+            yield from self._search_multi(
+                video_paths, queries or [], similarity_threshold, confidence_threshold, **scan_kwargs
+            )
+
+    def _search_multi(
+        self,
+        video_paths: List[str],
+        queries: List[Tuple[str, object]],
+        similarity_threshold: float,
+        confidence_threshold: float,
+        **scan_kwargs,
+    ) -> Generator[Tuple[str, int, float, Tuple[str, object]], None, None]:
+        """
+        Evaluate several text/image/category queries on each sampled frame in one pass.
+
+        Each decoded batch goes through CLIP once (if there are text/image queries) and
+        YOLO once (if there are categories), and every query is scored from those outputs.
+        Videos whose embeddings and detections are all in the indexes are answered
+        without decoding; scanned videos are recorded into the indexes like single-query
+        searches. Matches are yielded in timestamp order with per-query de-duplication.
+        """
+        import time
+
+        import numpy as np
+        from category_query import CompiledCategoryQuery, parse_category_query
+        from embedding_index import max_similarity
+        from search_pipeline import MultiScorer
+
+        stop_check = scan_kwargs.get('stop_check')
+        progress_callback = scan_kwargs.get('progress_callback')
+        stats_callback = scan_kwargs.get('stats_callback')
+
+        # (position in queries, stack of query embeddings) / (position, parsed category query)
+        clip_queries = []
+        category_queries = []
+        for qi, (kind, value) in enumerate(queries):
+            if kind == 'text':
+                clip_queries.append((qi, self._get_clip_text_embedding(value)))
+            elif kind == 'image':
+                stack = self._embed_query_images([value] if isinstance(value, str) else list(value))
+                if stack is not None:
+                    clip_queries.append((qi, stack))
+            elif kind == 'category':
+                category_queries.append((qi, parse_category_query(value)))
+            else:
+                raise ValueError(f"Unknown query kind: {kind!r}")
+        if not clip_queries and not category_queries:
+            return
+
+        thresholds = np.array(
+            [similarity_threshold if kind in ('text', 'image') else confidence_threshold for kind, _ in queries],
+            dtype=np.float64,
+        )
+        # image queries without a single readable image never match
+        active = {qi for qi, _ in clip_queries} | {qi for qi, _ in category_queries}
+        thresholds[[qi for qi in range(len(queries)) if qi not in active]] = np.inf
+        if clip_queries:
+            # every query image/text as one row; query_rows[j] lists the rows of the j-th CLIP query
+            query_np = np.concatenate([stack for _, stack in clip_queries]).astype(np.float32)
+            bounds = np.cumsum([0] + [len(stack) for _, stack in clip_queries])
+
+        for video_path in video_paths:
+            if stop_check and stop_check():
+                return
+
+            clip_key = self._index_key(video_path, scan_kwargs) if clip_queries else None
+            det_key = self._detection_key(video_path, scan_kwargs) if category_queries else None
+            clip_cached = self._index.load(clip_key) if clip_key else None
+            det_cached = self._detections.load(det_key) if det_key else None
+            if det_cached is not None and det_cached.min_conf > confidence_threshold:
+                det_cached = None
+
+            if (not clip_queries or clip_cached is not None) and (not category_queries or det_cached is not None):
+                t0 = time.perf_counter()
+                matches = []
+                frames_indexed = 0
+                per_query = []  # (position in queries, timestamps, per-frame scores)
+                if clip_queries:
+                    timestamps, embeddings = clip_cached
+                    for j, (qi, _) in enumerate(clip_queries):
+                        per_query.append((qi, timestamps, max_similarity(embeddings, query_np[bounds[j]:bounds[j + 1]])))
+                for qi, query in category_queries:
+                    scores = CompiledCategoryQuery(query, det_cached.names).frame_scores(det_cached, confidence_threshold)
+                    per_query.append((qi, det_cached.timestamps, scores))
+                for qi, timestamps, scores in per_query:
+                    frames_indexed = max(frames_indexed, len(timestamps))
+                    for _, pos_ms, score in self._indexed_matches(video_path, timestamps, scores, thresholds[qi]):
+                        matches.append((pos_ms, qi, score))
+                score_time_s = time.perf_counter() - t0
+
+                if progress_callback:
+                    try:
+                        progress_callback(video_path, frames_indexed, frames_indexed)
+                    except Exception:
+                        pass
+                for pos_ms, qi, score in sorted(matches):
+                    yield (video_path, pos_ms, score, queries[qi])
+                if stats_callback:
+                    try:
+                        stats_callback(video_path, {
+                            'from_index': True,
+                            'frames_indexed': frames_indexed,
+                            'frames_scored': frames_indexed,
+                            'score_time_s': score_time_s,
+                        })
+                    except Exception:
+                        pass
+                continue
+
+            compiled = []
+            if clip_queries:
+                self._ensure_clip_loaded()
+            if category_queries:
+                self._ensure_yolo_loaded()
+                compiled = [(qi, CompiledCategoryQuery(query, self._yolo_model.names)) for qi, query in category_queries]
+            record_clip = bool(clip_key) and clip_cached is None
+            record_det = bool(det_key) and det_cached is None
+            record_conf = min(DETECTION_MIN_CONF, confidence_threshold)
+            scorer = MultiScorer(
+                self, len(queries), thresholds,
+                [qi for qi, _ in clip_queries], query_np if clip_queries else None, bounds if clip_queries else None,
+                compiled, confidence_threshold,
+                record_clip=record_clip, record_conf=record_conf if record_det else None,
             )
 
+            last_match_ms = [None] * len(queries)
+            # every query has its own threshold, so there is no single score to refine around
+            multi_scan_kwargs = dict(scan_kwargs, coarse_interval_s=0.0, budget=None)
+            for _, pos_ms, _ in self._scan_videos(
+                [video_path], scorer, 0.0, score_all=True, lockout=False, **multi_scan_kwargs
+            ):
+                scores = scorer.pending.pop(pos_ms)
+                for qi in range(len(queries)):
+                    if scores[qi] < thresholds[qi]:
+                        continue
+                    if last_match_ms[qi] is not None and pos_ms <= last_match_ms[qi] + MATCH_LOCKOUT_MS:
+                        continue
+                    last_match_ms[qi] = pos_ms
+                    yield (video_path, pos_ms, float(scores[qi]), queries[qi])
+
+            if not scorer.failed and not (stop_check and stop_check()):
+                if record_clip and scorer.clip_recorded:
+                    # the first batch may have turned fast preprocessing off
+                    self._save_embeddings(self._index_key(video_path, scan_kwargs), video_path, scorer.clip_recorded)
+                if record_det and scorer.det_recorded:
+                    self._save_detections(det_key, video_path, scorer.det_recorded, record_conf)
+
     def _search_by_image(
         self,
         video_paths: List[str],
         query_images: List[str],
-        sample_interval_s: float,
         similarity_threshold: float,
-        progress_callback: Optional[Callable[[str, int, int], None]] = None,
-        stop_check: Optional[Callable[[], bool]] = None,
+        **scan_kwargs,
     ) -> Generator[Tuple[str, int, float], None, None]:
         """Search videos using query images with CLIP similarity."""
-        import cv2
-        import torch
-        from PIL import Image
+        query_stack = self._embed_query_images(query_images)
+        if query_stack is None:
+            return
 
-        self._ensure_clip_loaded()
+        yield from self._search_clip(video_paths, query_stack, similarity_threshold, **scan_kwargs)
+
+    def _embed_query_images(self, query_images: List[str]):
+        """
+        CLIP embeddings of the readable query images as one (N, dim) float32 array, or None if none could be read.
+
+        Embeddings are cached on disk by image content; images missing from the cache
+        are embedded together in one forward pass.
+        """
+        import io
+
+        import numpy as np
+        from PIL import Image
+        from embedding_index import QueryEmbeddingCache
 
-        # Pre-compute embeddings for all query images
-        query_embeddings = []
-        for img_path in query_images:
+        embeddings = {}  # position in query_images -> (dim,) array
+        missing = []  # (position, cache key, PIL image)
+        for i, img_path in enumerate(query_images):
             try:
-                img = Image.open(img_path).convert('RGB')
-                embedding = self._get_clip_image_embedding(img)
-                query_embeddings.append(embedding)
+                with open(img_path, 'rb') as f:
+                    data = f.read()
+                key = QueryEmbeddingCache.make_key(data, self.clip_model_id)
+                cached = self._query_image_cache.load(key) if self._query_image_cache else None
+                if cached is not None:
+                    embeddings[i] = cached
+                    continue
+                missing.append((i, key, Image.open(io.BytesIO(data)).convert('RGB')))
             except Exception:
                 continue
 
-        if not query_embeddings:
-            return
+        if missing:
+            try:
+                batch = self._get_clip_image_embeddings([img for _, _, img in missing])
+            except Exception:
+                batch = None
+            for row, (i, key, _) in enumerate(missing if batch is not None else []):
+                embeddings[i] = batch[row]
+                if self._query_image_cache:
+                    try:
+                        self._query_image_cache.save(key, batch[row])
+                    except OSError:
+                        pass
 
-        # Stack all query embeddings for batch comparison
-        query_stack = torch.cat(query_embeddings, dim=0)
+        if not embeddings:
+            return None
+
+        # Stack all query embeddings (in query order) for batch comparison
+        return np.stack([embeddings[i] for i in sorted(embeddings)])
+
+    def _search_by_text(
+        self,
+        video_paths: List[str],
+        query_text: str,
+        similarity_threshold: float,
+        **scan_kwargs,
+    ) -> Generator[Tuple[str, int, float], None, None]:
+        """Search videos using text query with CLIP."""
+        # Pre-compute text embedding
+        text_embedding = self._get_clip_text_embedding(query_text)
+
+        yield from self._search_clip(video_paths, text_embedding, similarity_threshold, **scan_kwargs)
+
+    def _search_clip(
+        self,
+        video_paths: List[str],
+        query_stack,
+        similarity_threshold: float,
+        ann_probes: int = 0,
+        **scan_kwargs,
+    ) -> Generator[Tuple[str, int, float], None, None]:
+        """
+        Score videos against a stack of CLIP query embeddings (match any query).
+
+        Videos already in the embedding index are answered from the stored vectors
+        without decoding (only from the ANN candidate rows when ann_probes > 0).
+        Other videos are scanned; with the index enabled every sampled frame is
+        embedded (the post-match lockout then only filters results) and the
+        embeddings are saved once the video has been scanned completely. Coarse-to-fine
+        and time-budgeted scans are not saved.
+        """
+        import numpy as np
+        from search_pipeline import ClipScorer
+
+        stop_check = scan_kwargs.get('stop_check')
+        query_np = np.asarray(query_stack, dtype=np.float32)
+        ann_rows = self._ann_candidates(video_paths, scan_kwargs, query_np, ann_probes) if ann_probes else {}
 
         for video_path in video_paths:
-            # check stop request before opening heavy resources
             if stop_check and stop_check():
                 return
 
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
+            key = self._index_key(video_path, scan_kwargs)
+            cached = self._index.load(key) if key else None
+            if cached is not None:
+                yield from self._search_indexed(
+                    video_path, cached[0], cached[1], query_np, similarity_threshold,
+                    scan_kwargs.get('progress_callback'), scan_kwargs.get('stats_callback'),
+                    rows=ann_rows.get(video_path),
+                )
                 continue
 
-            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-            step = max(1, int(round(fps * sample_interval_s)))
-            total_samples = (frame_count + step - 1) // step if frame_count > 0 else 1
-            processed = 0
+            self._ensure_clip_loaded()
+            if self._partial_scan(scan_kwargs):
+                # only part of the frames are embedded, which is not an index entry
+                key = None
+            scorer = ClipScorer(self, query_np, record=bool(key))
 
-            frame_idx = 0
-            last_match_frame = -1
-            skip_frames = int(round(fps * 2.0))
+            yield from self._scan_videos(
+                [video_path], scorer, similarity_threshold, score_all=bool(key), **scan_kwargs
+            )
 
-            try:
-                while True:
-                    # check stop request on each loop
-                    if stop_check and stop_check():
-                        break
+            if key and scorer.recorded and not scorer.failed and not (stop_check and stop_check()):
+                # the first batch may have turned fast preprocessing off
+                self._save_embeddings(self._index_key(video_path, scan_kwargs), video_path, scorer.recorded)
 
-                    ok, frame = cap.read()
-                    if not ok:
-                        break
+    def _save_embeddings(self, key: str, video_path: str, recorded: list):
+        """Save (timestamps, embeddings) batches recorded during a complete scan to the embedding index."""
+        import numpy as np
 
-                    if frame_idx % step == 0 and frame_idx > last_match_frame + skip_frames:
-                        processed += 1
-                        if progress_callback:
-                            try:
-                                progress_callback(video_path, processed, total_samples)
-                            except Exception:
-                                pass
-                        try:
-                            frame_embedding = self._get_clip_image_embedding(frame)
-
-                            # Compute similarity with all query images (match any)
-                            similarities = torch.matmul(query_stack, frame_embedding.T).squeeze(-1)
-                            max_similarity = similarities.max().item()
-
-                            if max_similarity >= similarity_threshold:
-                                pos_ms = int((frame_idx / fps) * 1000)
-                                try:
-                                    yield (video_path, pos_ms, max_similarity)
-                                except GeneratorExit:
-                                    try:
-                                        cap.release()
-                                    except Exception:
-                                        pass
-                                    return
-                                last_match_frame = frame_idx
-                        except Exception:
-                            pass
+        timestamps = np.concatenate([np.asarray(t, dtype=np.int64) for t, _ in recorded])
+        embeddings = np.concatenate([e for _, e in recorded])
+        order = np.argsort(timestamps, kind='stable')
+        try:
+            self._index.save(key, timestamps[order], embeddings[order], {'video': video_path, 'model': CLIP_MODEL_NAME, 'precision': self.precision})
+        except OSError:
+            pass
+
+    def _index_key(self, video_path: str, scan_kwargs: dict) -> Optional[str]:
+        """Embedding index key for a video scanned with scan_kwargs, or None when the index is off."""
+        if self._index is None:
+            return None
+        # clip_preprocess and CLIPProcessor resize differently, so their vectors are not interchangeable
+        preprocess = 'fast' if self.backend == 'onnx' or self.fast_preprocess else 'processor'
+        return self._index.make_key(
+            video_path, scan_kwargs.get('sample_interval_s', 1.0), self.clip_model_id,
+            preprocess=preprocess, **self._sampling_key(scan_kwargs)
+        )
+
+    def _ann_candidates(self, video_paths: List[str], scan_kwargs: dict, query_np, ann_probes: int) -> dict:
+        """
+        Candidate rows per indexed video from an IVF index over all their stored embeddings.
 
-                    frame_idx += 1
-            except GeneratorExit:
-                # Generator was closed; release resources and exit gracefully
-                try:
-                    cap.release()
-                except Exception:
-                    pass
-                return
+        The IVF index is built on first use for a given set of index entries and kept
+        next to them (EmbeddingIndex.save_ann), until one of the entries is rewritten or
+        it is evicted. Returns {video_path: sorted row ids};
+        videos that are missing from the result are scored exactly.
+        """
+        import numpy as np
+        from ann_index import IVFIndex
 
-            cap.release()
+        if self._index is None:
+            return {}
 
-    def _search_by_text(
+        entries = []
+        for video_path in video_paths:
+            key = self._index_key(video_path, scan_kwargs)
+            cached = self._index.load(key) if key else None
+            if cached is not None and len(cached[1]):
+                entries.append((video_path, key, cached[1]))
+        total = sum(len(embeddings) for _, _, embeddings in entries)
+        if total < ANN_MIN_VECTORS:
+            return {}
+
+        keys = [key for _, key, _ in entries]
+        ivf = self._index.load_ann(keys)
+        if ivf is None or ivf.size != total:
+            ivf = IVFIndex.build([embeddings for _, _, embeddings in entries])
+            try:
+                self._index.save_ann(keys, ivf)
+            except OSError:
+                pass
+
+        rows = ivf.candidates(query_np, ann_probes)
+        result = {}
+        offset = 0
+        for video_path, _, embeddings in entries:
+            lo, hi = np.searchsorted(rows, [offset, offset + len(embeddings)])
+            result[video_path] = rows[lo:hi] - offset
+            offset += len(embeddings)
+        return result
+
+    def _search_indexed(
         self,
-        video_paths: List[str],
-        query_text: str,
-        sample_interval_s: float,
+        video_path: str,
+        timestamps,
+        embeddings,
+        query_np,
         similarity_threshold: float,
         progress_callback: Optional[Callable[[str, int, int], None]] = None,
-        stop_check: Optional[Callable[[], bool]] = None,
+        stats_callback: Optional[Callable[[str, dict], None]] = None,
+        rows=None,
     ) -> Generator[Tuple[str, int, float], None, None]:
-        """Search videos using text query with CLIP."""
-        import cv2
-        import torch
+        """
+        Yield matches for one video from stored frame embeddings (timestamps sorted ascending).
 
-        self._ensure_clip_loaded()
+        embeddings is usually a float16 memmap; it is scored in chunks of
+        embedding_index.SCORE_CHUNK_ROWS rows, so the entry is never held in memory
+        as float32 all at once. rows (sorted row ids, e.g. ANN candidates) restricts
+        scoring to those frames.
+        """
+        import time
+        from embedding_index import max_similarity
 
-        # Pre-compute text embedding
-        text_embedding = self._get_clip_text_embedding(query_text)
+        frames_indexed = len(timestamps)
+        t0 = time.perf_counter()
+        if rows is not None:
+            timestamps, embeddings = timestamps[rows], embeddings[rows]
+        scores = max_similarity(embeddings, query_np)
+        score_time_s = time.perf_counter() - t0
+
+        if progress_callback:
+            try:
+                progress_callback(video_path, frames_indexed, frames_indexed)
+            except Exception:
+                pass
+
+        yield from self._indexed_matches(video_path, timestamps, scores, similarity_threshold)
+
+        if stats_callback:
+            try:
+                stats_callback(video_path, {
+                    'from_index': True,
+                    'frames_indexed': frames_indexed,
+                    'frames_scored': len(timestamps),
+                    'score_time_s': score_time_s,
+                })
+            except Exception:
+                pass
+
+    @staticmethod
+    def _indexed_matches(video_path: str, timestamps, scores, threshold: float) -> Generator[Tuple[str, int, float], None, None]:
+        """Yield (video_path, timestamp_ms, score) for stored frames at or above threshold, applying the match lockout."""
+        last_match_ms = None
+        for i in (scores >= threshold).nonzero()[0]:
+            pos_ms = int(timestamps[i])
+            if last_match_ms is not None and pos_ms <= last_match_ms + MATCH_LOCKOUT_MS:
+                continue
+            yield (video_path, pos_ms, float(scores[i]))
+            last_match_ms = pos_ms
+
+    def _search_by_category(
+        self,
+        video_paths: List[str],
+        query_category: str,
+        confidence_threshold: float,
+        **scan_kwargs,
+    ) -> Generator[Tuple[str, int, float], None, None]:
+        """
+        Search videos for objects matching the category using YOLO.
+
+        query_category may be a compound query such as "person AND dog" or
+        "at least 3 person" (see category_query.py); all of it is evaluated on the
+        same detections, so one YOLO pass per frame answers the whole query.
+        Videos in the detection index are answered from their stored detections.
+        Other videos are scanned; with the index enabled every detection down to
+        DETECTION_MIN_CONF is recorded and saved once the video has been scanned completely
+        (not for coarse-to-fine or time-budgeted scans).
+        """
+        from category_query import CompiledCategoryQuery, parse_category_query
+        from search_pipeline import CategoryScorer
+
+        query = parse_category_query(query_category)
+        compiled = None
+        stop_check = scan_kwargs.get('stop_check')
 
         for video_path in video_paths:
             if stop_check and stop_check():
                 return
 
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
+            key = self._detection_key(video_path, scan_kwargs)
+            cached = self._detections.load(key) if key else None
+            if cached is not None and cached.min_conf <= confidence_threshold:
+                yield from self._search_detections(
+                    video_path, cached, CompiledCategoryQuery(query, cached.names), confidence_threshold,
+                    scan_kwargs.get('progress_callback'), scan_kwargs.get('stats_callback')
+                )
                 continue
 
-            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-            step = max(1, int(round(fps * sample_interval_s)))
-            total_samples = (frame_count + step - 1) // step if frame_count > 0 else 1
-            processed = 0
+            self._ensure_yolo_loaded()
+            if compiled is None:
+                compiled = CompiledCategoryQuery(query, self._yolo_model.names)
+            if self._partial_scan(scan_kwargs):
+                # only part of the frames are run through the detector, which is not an index entry
+                key = None
+            record_conf = min(DETECTION_MIN_CONF, confidence_threshold)
+            # a coarse frame whose boxes fall just under the threshold still has to score
+            # within refine_margin of it to get a refine window; matches are decided on
+            # the real threshold
+            score_floor = None
+            if scan_kwargs.get('coarse_interval_s'):
+                score_floor = max(0.0, confidence_threshold - scan_kwargs.get('refine_margin', 0.0))
+            scorer = CategoryScorer(self, compiled, confidence_threshold, record_conf if key else None, score_floor)
+
+            yield from self._scan_videos(
+                [video_path], scorer, confidence_threshold, score_all=bool(key), **scan_kwargs
+            )
 
-            frame_idx = 0
-            last_match_frame = -1
-            skip_frames = int(round(fps * 2.0))
+            if key and scorer.recorded and not scorer.failed and not (stop_check and stop_check()):
+                self._save_detections(key, video_path, scorer.recorded, record_conf)
 
+    def _save_detections(self, key: str, video_path: str, recorded: list, record_conf: float):
+        """Save per-frame (timestamp, classes, confidences, boxes) recorded during a complete scan to the detection index."""
+        import numpy as np
+        from detection_index import Detections
+
+        recorded.sort(key=lambda r: r[0])
+        offsets = np.zeros(len(recorded) + 1, dtype=np.int64)
+        np.cumsum([len(r[1]) for r in recorded], out=offsets[1:])
+        detections = Detections(
+            np.array([r[0] for r in recorded], dtype=np.int64),
+            offsets,
+            np.concatenate([r[1] for r in recorded]),
+            np.concatenate([r[2] for r in recorded]),
+            np.concatenate([r[3] for r in recorded]).reshape(-1, 4),
+            dict(self._yolo_model.names),
+            record_conf,
+        )
+        try:
+            self._detections.save(key, detections, {'video': video_path, 'model': YOLO_MODEL_NAME})
+        except OSError:
+            pass
+
+    def _detection_key(self, video_path: str, scan_kwargs: dict) -> Optional[str]:
+        """Detection index key for a video scanned with scan_kwargs, or None when the index is off."""
+        if self._detections is None:
+            return None
+        return self._detections.make_key(
+            video_path, scan_kwargs.get('sample_interval_s', 1.0), YOLO_MODEL_NAME, **self._sampling_key(scan_kwargs)
+        )
+
+    @staticmethod
+    def _partial_scan(scan_kwargs: dict) -> bool:
+        """Whether a scan with scan_kwargs may skip frames of the sampling grid (coarse-to-fine or time budget)."""
+        return bool(scan_kwargs.get('coarse_interval_s') or scan_kwargs.get('budget'))
+
+    @staticmethod
+    def _sampling_key(scan_kwargs: dict) -> dict:
+        """Index key fields describing which frames a scan with scan_kwargs samples, and at what size."""
+        sampling = scan_kwargs.get('sampling', 'grab')
+        key = {
+            # read/grab/seek all sample the same frame grid
+            'sampling': 'keyframes' if sampling == 'keyframes' else 'grid',
+            'backend': scan_kwargs.get('decode_backend', 'opencv'),
+        }
+        if scan_kwargs.get('shots'):
+            # only the frames picked by the shot filter are stored
+            key['shots'] = [round(value, 6) for value in scan_kwargs['shots']]
+        if scan_kwargs.get('dedup') is not None:
+            # near-duplicate frames store the vectors of the frame they reused
+            key['dedup'] = scan_kwargs['dedup']
+        if scan_kwargs.get('resize'):
+            # frames shrunk with INTER_AREA before the model's own resize give different pixels
+            key['resize'] = list(scan_kwargs['resize'])
+        return key
+
+    def _search_detections(
+        self,
+        video_path: str,
+        detections,
+        compiled,
+        confidence_threshold: float,
+        progress_callback: Optional[Callable[[str, int, int], None]] = None,
+        stats_callback: Optional[Callable[[str, dict], None]] = None,
+    ) -> Generator[Tuple[str, int, float], None, None]:
+        """
+        Yield category matches for one video from its stored detections (detection_index.Detections),
+        scored with a category_query.CompiledCategoryQuery bound to the stored class names.
+        """
+        import time
+
+        t0 = time.perf_counter()
+        scores = compiled.frame_scores(detections, confidence_threshold)
+        score_time_s = time.perf_counter() - t0
+
+        if progress_callback:
             try:
-                while True:
-                    if stop_check and stop_check():
-                        break
+                progress_callback(video_path, len(detections), len(detections))
+            except Exception:
+                pass
 
-                    ok, frame = cap.read()
-                    if not ok:
-                        break
+        yield from self._indexed_matches(video_path, detections.timestamps, scores, confidence_threshold)
 
-                    if frame_idx % step == 0 and frame_idx > last_match_frame + skip_frames:
-                        processed += 1
-                        if progress_callback:
-                            try:
-                                progress_callback(video_path, processed, total_samples)
-                            except Exception:
-                                pass
-                        try:
-                            frame_embedding = self._get_clip_image_embedding(frame)
-
-                            similarity = torch.matmul(text_embedding, frame_embedding.T).item()
-
-                            if similarity >= similarity_threshold:
-                                pos_ms = int((frame_idx / fps) * 1000)
-                                try:
-                                    yield (video_path, pos_ms, similarity)
-                                except GeneratorExit:
-                                    try:
-                                        cap.release()
-                                    except Exception:
-                                        pass
-                                    return
-                                last_match_frame = frame_idx
-                        except Exception:
-                            pass
+        if stats_callback:
+            try:
+                stats_callback(video_path, {
+                    'from_index': True,
+                    'frames_indexed': len(detections),
+                    'frames_scored': len(detections),
+                    'score_time_s': score_time_s,
+                })
+            except Exception:
+                pass
+
+    def _frame_resize(self, mode: str) -> Optional[Tuple[str, int]]:
+        """Frame size requirement of the model used by mode, in frame_sampler.fit_size format."""
+        if mode == 'category':
+            imgsz = YOLO_INPUT_SIZE
+            if self._yolo_model is not None:
+                imgsz = self._yolo_model.overrides.get('imgsz') or imgsz
+            if isinstance(imgsz, (list, tuple)):
+                imgsz = max(imgsz)
+            return ('long', int(imgsz))
+        if mode in ('image', 'text'):
+            size = CLIP_INPUT_SIZE
+            if self._clip_model is not None:
+                size = self._clip_preprocess_kwargs()['size']
+            return ('short', int(size))
+        return None
+
+    def _detect_frames(self, frames: list, **predict_kwargs) -> list:
+        """
+        Run YOLO on a batch of frames in one call.
 
-                    frame_idx += 1
-            except GeneratorExit:
-                try:
-                    cap.release()
-                except Exception:
-                    pass
-                return
+        predict_kwargs (conf, classes...) are passed to the model call.
 
-            cap.release()
+        Returns:
+            Per frame (class ids int64, confidences float32, xyxyn boxes float32) numpy arrays.
+        """
+        return self._detect_inputs(self._yolo_inputs(frames), **predict_kwargs)
 
-    def _search_by_category(
+    def _yolo_inputs(self, frames: list):
+        """The preprocessing half of _detect_frames (letterboxing; ultralytics does it inside the predict call)."""
+        if self.backend == 'onnx':
+            return self._yolo_model.preprocess(list(frames))
+        return list(frames)
+
+    def _detect_inputs(self, inputs, **predict_kwargs) -> list:
+        """The inference half of _detect_frames, on a batch returned by _yolo_inputs."""
+        import numpy as np
+
+        if self.backend == 'onnx':
+            # ONNX Runtime sessions may run concurrently
+            return self._yolo_model.detect(inputs, **predict_kwargs)
+        with self._yolo_lock:
+            results = self._yolo_model(inputs, verbose=False, **predict_kwargs)
+        detections = []
+        for result in results:
+            boxes = result.boxes
+            if boxes is None:
+                detections.append((np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32), np.zeros((0, 4), dtype=np.float32)))
+                continue
+            detections.append((
+                boxes.cls.cpu().numpy().astype(np.int64),
+                boxes.conf.cpu().numpy().astype(np.float32),
+                boxes.xyxyn.cpu().numpy().astype(np.float32),
+            ))
+        return detections
+
+    def _scan_videos(
         self,
         video_paths: List[str],
-        query_category: str,
-        sample_interval_s: float,
-        confidence_threshold: float,
+        scorer,
+        threshold: float,
+        sample_interval_s: float = 1.0,
         progress_callback: Optional[Callable[[str, int, int], None]] = None,
         stop_check: Optional[Callable[[], bool]] = None,
+        batch_size: int = 8,
+        sampling: str = 'grab',
+        stats_callback: Optional[Callable[[str, dict], None]] = None,
+        prefetch: int = 0,
+        segments: int = 1,
+        resize: Optional[Tuple[str, int]] = None,
+        decode_backend: str = 'opencv',
+        preprocess_workers: int = 1,
+        inference_workers: int = 1,
+        pipeline_queue: int = 2,
+        shots: Optional[Tuple[float, float]] = None,
+        dedup: Optional[int] = None,
+        coarse_interval_s: float = 0.0,
+        refine_margin: float = 0.05,
+        budget: Optional['TimeBudget'] = None,
+        score_all: bool = False,
+        lockout: bool = True,
     ) -> Generator[Tuple[str, int, float], None, None]:
-        """Search videos for objects matching the category using YOLO."""
-        import cv2
+        """
+        Sample frames from each video and yield the ones whose score reaches threshold.
+
+        scorer is a search_pipeline.Scorer, or a plain score_batch(frames, times) callable
+        that receives a list of BGR frames and their timestamps in ms and returns one
+        score per frame.
+        Sampled frames are collected into batches of batch_size and pushed through
+        search_pipeline.run_pipeline, whose decode, preprocess and inference stages
+        run in preprocess_workers/inference_workers threads joined by queues of
+        pipeline_queue batches. The 2 second de-duplication after a match is applied
+        when a scored batch is emitted, so results are identical to scoring one frame
+        at a time.
+
+        With prefetch > 0, decoding runs in a background thread that keeps up to prefetch
+        sampled frames queued ahead of the scoring loop. With segments > 1,
+        each video is split into that many time ranges scanned concurrently.
+        resize and decode_backend are passed to frame_sampler.open_frame_source.
+        shots is (threshold, max_interval_s) to score only the frames picked by
+        frame_sampler.select_shot_frames; the frames it skips count as processed.
+        dedup is the Hamming distance up to which a frame reuses the model outputs of the
+        previous frame run through the model (see frame_sampler.frame_dhash); progress_callback
+        then also receives the number of reused frames.
+        With coarse_interval_s > 0 each video is scanned coarse-to-fine instead (see
+        _scan_video_refined), one frame per refined window, ignoring segments and shots.
+        With a TimeBudget each video gets its share of the remaining time and is scanned
+        progressively (see _scan_video_progressive), ignoring the options above.
+        With score_all=True, frames inside the post-match lockout are still decoded
+        and scored (e.g. to record their embeddings); only the results are filtered.
+        With lockout=False every frame reaching threshold is yielded, in timestamp order.
+        """
+        from frame_sampler import open_frame_source
+        from search_pipeline import FunctionScorer, Scorer
 
-        self._ensure_yolo_loaded()
+        if not isinstance(scorer, Scorer):
+            scorer = FunctionScorer(scorer)
+        pipeline = {
+            'preprocess_workers': preprocess_workers,
+            'inference_workers': inference_workers,
+            'queue_size': pipeline_queue,
+        }
 
-        # Normalize category name for comparison
-        query_category_lower = query_category.lower().strip()
+        def _open_source(video_path, interval_s=sample_interval_s, sampling_mode=sampling):
+            return open_frame_source(video_path, interval_s, sampling_mode, resize=resize, backend=decode_backend)
 
         for video_path in video_paths:
+            # check stop request before opening heavy resources
             if stop_check and stop_check():
                 return
 
-            cap = cv2.VideoCapture(video_path)
-            if not cap.isOpened():
-                continue
+            if budget is not None:
+                yield from self._scan_video_progressive(
+                    video_path, _open_source, scorer, threshold, budget,
+                    progress_callback, stop_check, batch_size, stats_callback, pipeline, dedup
+                )
+            elif coarse_interval_s > 0:
+                yield from self._scan_video_refined(
+                    video_path, _open_source, scorer, threshold, coarse_interval_s, refine_margin,
+                    progress_callback, stop_check, batch_size, stats_callback, pipeline, dedup
+                )
+            elif segments > 1:
+                yield from self._scan_video_segments(
+                    video_path, _open_source, scorer, threshold, progress_callback, stop_check,
+                    batch_size, stats_callback, prefetch, segments, score_all, lockout, pipeline, shots, dedup
+                )
+            else:
+                yield from self._scan_video(
+                    video_path, _open_source, scorer, threshold, progress_callback, stop_check,
+                    batch_size, stats_callback, prefetch, score_all, lockout, pipeline, shots, dedup
+                )
+
+    def _scan_video(
+        self,
+        video_path: str,
+        open_source: Callable,
+        scorer,
+        threshold: float,
+        progress_callback: Optional[Callable[[str, int, int], None]],
+        stop_check: Optional[Callable[[], bool]],
+        batch_size: int,
+        stats_callback: Optional[Callable[[str, dict], None]],
+        prefetch: int,
+        score_all: bool = False,
+        lockout: bool = True,
+        pipeline: Optional[dict] = None,
+        shots: Optional[Tuple[float, float]] = None,
+        dedup: Optional[int] = None,
+    ) -> Generator[Tuple[str, int, float], None, None]:
+        """Scan one video sequentially (see _scan_videos); open_source(video_path) returns a FrameSource."""
+        from frame_sampler import DedupStats, PrefetchStats, ShotStats
+        from search_pipeline import PipelineStats
 
-            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
-            frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
-            step = max(1, int(round(fps * sample_interval_s)))
-            total_samples = (frame_count + step - 1) // step if frame_count > 0 else 1
-            processed = 0
+        pipeline = dict(pipeline or {})
+
+        source = open_source(video_path)
+        if source is None:
+            return
 
-            frame_idx = 0
-            last_match_frame = -1
-            skip_frames = int(round(fps * 2.0))
+        processed = [0]
+        reused = [0]
 
+        def _on_sample(reused_output=False):
+            processed[0] += 1
+            reused[0] += int(reused_output)
+            if progress_callback:
+                try:
+                    if dedup is not None:
+                        progress_callback(video_path, processed[0], max(processed[0], source.total_samples), reused[0])
+                    else:
+                        progress_callback(video_path, processed[0], max(processed[0], source.total_samples))
+                except Exception:
+                    pass
+
+        prefetch_stats = PrefetchStats(prefetch) if prefetch > 0 else None
+        pipeline['stats'] = PipelineStats(pipeline.get('preprocess_workers', 1), pipeline.get('inference_workers', 1))
+        shot_stats = ShotStats(*shots) if shots else None
+        dedup_stats = DedupStats(dedup) if dedup is not None else None
+        try:
+            for pos_ms, score in self._scan_range(
+                source, scorer, threshold, batch_size, stop_check, _on_sample, prefetch_stats,
+                lockout=lockout, skip_locked=not score_all, pipeline=pipeline, shot_stats=shot_stats,
+                dedup_stats=dedup_stats
+            ):
+                yield (video_path, pos_ms, score)
+        finally:
+            # also runs when the generator is closed early (GeneratorExit)
+            source.release()
+
+        self._report_stats(video_path, stats_callback, source.stats, prefetch_stats, shot_stats, dedup_stats, pipeline['stats'])
+
+    def _scan_video_segments(
+        self,
+        video_path: str,
+        open_source: Callable,
+        scorer,
+        threshold: float,
+        progress_callback: Optional[Callable[[str, int, int], None]],
+        stop_check: Optional[Callable[[], bool]],
+        batch_size: int,
+        stats_callback: Optional[Callable[[str, dict], None]],
+        prefetch: int,
+        segments: int,
+        score_all: bool = False,
+        lockout: bool = True,
+        pipeline: Optional[dict] = None,
+        shots: Optional[Tuple[float, float]] = None,
+        dedup: Optional[int] = None,
+    ) -> Generator[Tuple[str, int, float], None, None]:
+        """
+        Scan one video as several time segments in parallel threads.
+
+        Every segment opens its own decoder and starts by seeking to its first
+        sampled frame; segment boundaries are aligned to the sampling grid so the
+        same frames are scored as in a sequential scan. Segments report every frame
+        above threshold; results are merged in timestamp order (segment 0 streams
+        live, later segments are buffered until their predecessors finish) and the
+        2 second de-duplication is applied once over the merged stream, so it also
+        holds across segment boundaries. Every segment runs its own scoring pipeline;
+        the scorer's score stage is serialized across segments. With shots, each segment
+        starts a new shot at its first frame. If a segment fails (its decoder cannot be
+        opened or decoding or a model call raises), the other segments are stopped,
+        scorer.failed is set and the first error in segment order is re-raised once the
+        merged results before it have been yielded.
+        """
+        import queue
+        from concurrent.futures import ThreadPoolExecutor
+        from frame_sampler import DecodeStats, DedupStats, PrefetchStats, ShotStats
+        from search_pipeline import PipelineStats
+
+        pipeline = dict(pipeline or {})
+        probe = open_source(video_path)
+        if probe is None:
+            return
+        duration_ms = probe.duration_ms
+        total_samples = probe.total_samples
+        sample_interval_s = probe.sample_interval_s
+        sampling = probe.sampling
+        probe.release()
+
+        # unknown length (or too short to be worth it): fall back to a sequential scan
+        segment_ms = int(math.ceil(duration_ms / float(segments))) if duration_ms > 0 else 0
+        if segment_ms < sample_interval_s * 1000 * 2:
+            yield from self._scan_video(
+                video_path, open_source, scorer, threshold, progress_callback, stop_check,
+                batch_size, stats_callback, prefetch, score_all, lockout, pipeline, shots, dedup
+            )
+            return
+
+        bounds = [(i * segment_ms, (i + 1) * segment_ms if i < segments - 1 else None) for i in range(segments)]
+        result_queues = [queue.Queue() for _ in bounds]
+        decode_stats = [DecodeStats(sampling) for _ in bounds]
+        prefetch_stats = [PrefetchStats(prefetch) if prefetch > 0 else None for _ in bounds]
+        pipeline_workers = (pipeline.get('preprocess_workers', 1), pipeline.get('inference_workers', 1))
+        pipeline_stats = [PipelineStats(*pipeline_workers) for _ in bounds]
+        shot_stats = [ShotStats(*shots) if shots else None for _ in bounds]
+        dedup_stats = [DedupStats(dedup) if dedup is not None else None for _ in bounds]
+        closed = threading.Event()
+        errors = [None for _ in bounds]
+        processed = [0]
+        reused = [0]
+        processed_lock = threading.Lock()
+        done = object()
+        # scorers keep per-search state (recorded embeddings, pending scores)
+        score_lock = threading.Lock()
+
+        def _stopped():
+            return closed.is_set() or bool(stop_check and stop_check())
+
+        def _on_sample(reused_output=False):
+            with processed_lock:
+                processed[0] += 1
+                reused[0] += int(reused_output)
+
+        def _run_segment(i):
+            start_ms, end_ms = bounds[i]
+            source = None
             try:
+                source = open_source(video_path)
+                if source is None:
+                    raise IOError(f"Cannot open video: {video_path}")
+                for pos_ms, score in self._scan_range(
+                    source, scorer, threshold, batch_size, _stopped, _on_sample, prefetch_stats[i],
+                    start_ms=start_ms, end_ms=end_ms, lockout=False,
+                    pipeline=dict(pipeline, stats=pipeline_stats[i]), score_lock=score_lock,
+                    shot_stats=shot_stats[i], dedup_stats=dedup_stats[i]
+                ):
+                    result_queues[i].put((pos_ms, score))
+            except Exception as e:
+                # a time range is missing, so the results (and anything recorded for an index) are incomplete
+                errors[i] = e
+                scorer.failed = True
+                closed.set()
+            finally:
+                if source is not None:
+                    decode_stats[i].merge(source.stats)
+                    source.release()
+                result_queues[i].put(done)
+
+        executor = ThreadPoolExecutor(max_workers=segments, thread_name_prefix='video-segment')
+        last_progress = 0
+        last_match_ms = None
+        try:
+            for i in range(len(bounds)):
+                executor.submit(_run_segment, i)
+
+            for i in range(len(bounds)):
                 while True:
-                    if stop_check and stop_check():
-                        break
-
-                    ok, frame = cap.read()
-                    if not ok:
-                        break
+                    try:
+                        item = result_queues[i].get(timeout=0.1)
+                    except queue.Empty:
+                        item = None
 
-                    if frame_idx % step == 0 and frame_idx > last_match_frame + skip_frames:
-                        processed += 1
-                        if progress_callback:
-                            try:
-                                progress_callback(video_path, processed, total_samples)
-                            except Exception:
-                                pass
+                    if progress_callback and processed[0] != last_progress:
+                        last_progress = processed[0]
                         try:
-                            results = self._yolo_model(frame, verbose=False)
-
-                            found_match = False
-                            for result in results:
-                                if found_match:
-                                    break
-                                if result.boxes is None:
-                                    continue
-
-                                for box in result.boxes:
-                                    cls_id = int(box.cls[0])
-                                    conf = float(box.conf[0])
-                                    class_name = self._yolo_model.names[cls_id].lower()
-
-                                    # Check for exact match or word boundary match
-                                    # Split class name into words and check if query matches any word
-                                    class_words = class_name.replace('-', ' ').replace('_', ' ').split()
-                                    query_words = query_category_lower.replace('-', ' ').replace('_', ' ').split()
-
-                                    is_match = (
-                                        class_name == query_category_lower or
-                                        query_category_lower in class_words or
-                                        any(qw in class_words for qw in query_words)
-                                    )
-
-                                    if is_match and conf >= confidence_threshold:
-                                        pos_ms = int((frame_idx / fps) * 1000)
-                                        try:
-                                            yield (video_path, pos_ms, conf)
-                                        except GeneratorExit:
-                                            try:
-                                                cap.release()
-                                            except Exception:
-                                                pass
-                                            return
-                                        last_match_frame = frame_idx
-                                        found_match = True
-                                        break
+                            if dedup is not None:
+                                progress_callback(video_path, last_progress, max(last_progress, total_samples), reused[0])
+                            else:
+                                progress_callback(video_path, last_progress, max(last_progress, total_samples))
                         except Exception:
                             pass
 
-                    frame_idx += 1
-            except GeneratorExit:
+                    if item is done:
+                        break
+                    if item is None:
+                        continue
+
+                    pos_ms, score = item
+                    if not lockout or last_match_ms is None or pos_ms > last_match_ms + MATCH_LOCKOUT_MS:
+                        yield (video_path, pos_ms, score)
+                        last_match_ms = pos_ms
+                if errors[i] is not None:
+                    break
+        finally:
+            # also runs when the generator is closed early (GeneratorExit)
+            closed.set()
+            executor.shutdown(wait=True)
+
+        for error in errors:
+            if error is not None:
+                raise error
+
+        if stop_check and stop_check():
+            return
+
+        merged_decode = DecodeStats(sampling)
+        for stats in decode_stats:
+            merged_decode.merge(stats)
+        merged_prefetch = None
+        if prefetch > 0:
+            merged_prefetch = PrefetchStats(prefetch)
+            for stats in prefetch_stats:
+                merged_prefetch.merge(stats)
+        merged_shots = None
+        if shots:
+            merged_shots = ShotStats(*shots)
+            for stats in shot_stats:
+                merged_shots.merge(stats)
+        merged_dedup = None
+        if dedup is not None:
+            merged_dedup = DedupStats(dedup)
+            for stats in dedup_stats:
+                merged_dedup.merge(stats)
+        merged_pipeline = PipelineStats(*pipeline_workers)
+        for stats in pipeline_stats:
+            merged_pipeline.merge(stats)
+        self._report_stats(video_path, stats_callback, merged_decode, merged_prefetch, merged_shots, merged_dedup, merged_pipeline)
+
+    def _scan_video_progressive(
+        self,
+        video_path: str,
+        open_source: Callable,
+        scorer,
+        threshold: float,
+        budget: 'TimeBudget',
+        progress_callback: Optional[Callable[[str, int, int], None]],
+        stop_check: Optional[Callable[[], bool]],
+        batch_size: int,
+        stats_callback: Optional[Callable[[str, dict], None]],
+        pipeline: Optional[dict] = None,
+        dedup: Optional[int] = None,
+    ) -> Generator[Tuple[str, int, float], None, None]:
+        """
+        Scan one video in progressively refining passes until its share of budget runs out.
+
+        Frames are the sample_interval_s grid of open_source(video_path, sampling_mode='seek').
+        Pass k visits the grid frames i with i % 2**k == 0 that no earlier pass visited,
+        coarsest pass (interval closest to PROGRESSIVE_START_S) first, so every pass halves
+        the interval over the whole video. Matches are yielded as they are found; one within
+        MATCH_LOCKOUT_MS of an earlier match (from any pass) is dropped.
+        """
+        import bisect
+        import time
+        from frame_sampler import DedupStats
+        from search_pipeline import PipelineStats
+
+        deadline = budget.video_deadline(video_path)
+        t0 = time.monotonic()
+        source = open_source(video_path, sampling_mode='seek')
+        if source is None:
+            return
+
+        pipeline = dict(pipeline or {})
+        pipeline_stats = PipelineStats(pipeline.get('preprocess_workers', 1), pipeline.get('inference_workers', 1))
+        pipeline['stats'] = pipeline_stats
+        dedup_stats = DedupStats(dedup) if dedup is not None else None
+        grid_ms = source.step * 1000.0 / source.fps
+        levels = max(0, int(math.floor(math.log2(max(1.0, PROGRESSIVE_START_S * 1000.0 / grid_ms)) + 1e-9)))
+        processed = [0]
+        matches = []  # sorted timestamps of the matches yielded so far
+        complete_s = None  # interval of the finest pass that finished
+
+        def _out_of_time():
+            return time.monotonic() >= deadline or bool(stop_check and stop_check())
+
+        def _on_sample(reused_output=False):
+            processed[0] += 1
+            if progress_callback:
                 try:
-                    cap.release()
+                    progress_callback(video_path, processed[0], max(processed[0], source.total_samples))
                 except Exception:
                     pass
-                return
 
-            cap.release()
+        try:
+            for level in range(levels, -1, -1):
+                if _out_of_time():
+                    break
+                stride = 2 ** level
+
+                def _in_pass(pos_ms, stride=stride, level=level):
+                    i = int(round(pos_ms / grid_ms))
+                    return i % stride == 0 and (level == levels or i % (stride * 2) != 0)
+
+                for pos_ms, score in self._scan_range(
+                    source, scorer, threshold, batch_size, _out_of_time, _on_sample,
+                    lockout=False, pipeline=pipeline, dedup_stats=dedup_stats, wanted=_in_pass
+                ):
+                    at = bisect.bisect_left(matches, pos_ms)
+                    if at > 0 and pos_ms - matches[at - 1] <= MATCH_LOCKOUT_MS:
+                        continue
+                    if at < len(matches) and matches[at] - pos_ms <= MATCH_LOCKOUT_MS:
+                        continue
+                    matches.insert(at, pos_ms)
+                    yield (video_path, pos_ms, score)
+                if _out_of_time():
+                    break
+                complete_s = stride * grid_ms / 1000.0
+        finally:
+            source.release()
+
+        if stop_check and stop_check():
+            return
+        duration_s = source.duration_ms / 1000.0
+        progressive_stats = {
+            # this video's share of the search budget
+            'budget_s': deadline - t0,
+            'budget_used_s': time.monotonic() - t0,
+            'budget_exhausted': complete_s is None or complete_s > grid_ms / 1000.0 + 1e-6,
+            'progressive_samples': processed[0],
+            'progressive_complete_s': complete_s,
+            # average spacing of the frames actually scored
+            'effective_interval_s': duration_s / processed[0] if processed[0] and duration_s > 0 else 0.0,
+            'sample_interval_s': grid_ms / 1000.0,
+        }
+        self._report_stats(video_path, stats_callback, source.stats, dedup_stats, pipeline_stats, progressive_stats)
+
+    def _scan_video_refined(
+        self,
+        video_path: str,
+        open_source: Callable,
+        scorer,
+        threshold: float,
+        coarse_interval_s: float,
+        refine_margin: float,
+        progress_callback: Optional[Callable[[str, int, int], None]],
+        stop_check: Optional[Callable[[], bool]],
+        batch_size: int,
+        stats_callback: Optional[Callable[[str, dict], None]],
+        pipeline: Optional[dict] = None,
+        dedup: Optional[int] = None,
+    ) -> Generator[Tuple[str, int, float], None, None]:
+        """
+        Scan one video coarse-to-fine (see _scan_videos).
+
+        The coarse pass samples every coarse_interval_s (open_source(video_path, interval_s)).
+        Each coarse frame scoring at least threshold - refine_margin gets a window reaching
+        up to coarse_interval_s to either side, cut halfway to the neighbouring candidates so
+        windows never overlap, which is rescanned at the fine sample interval. The best frame
+        of each window is reported if it reaches threshold; of two reported frames closer
+        than MATCH_LOCKOUT_MS only the better one is kept.
+        """
+        from frame_sampler import DecodeStats, DedupStats
+        from search_pipeline import PipelineStats
+
+        pipeline = dict(pipeline or {})
+        pipeline_stats = PipelineStats(pipeline.get('preprocess_workers', 1), pipeline.get('inference_workers', 1))
+        pipeline['stats'] = pipeline_stats
+        dedup_stats = DedupStats(dedup) if dedup is not None else None
+
+        coarse = open_source(video_path, coarse_interval_s)
+        if coarse is None:
+            return
+        decode_stats = DecodeStats(coarse.sampling)
+        processed = [0]
+        total = [coarse.total_samples]
+
+        def _on_sample(reused_output=False):
+            processed[0] += 1
+            if progress_callback:
+                try:
+                    progress_callback(video_path, processed[0], max(processed[0], total[0]))
+                except Exception:
+                    pass
+
+        try:
+            candidates = list(self._scan_range(
+                coarse, scorer, threshold - refine_margin, batch_size, stop_check, _on_sample,
+                lockout=False, pipeline=pipeline
+            ))
+        finally:
+            decode_stats.merge(coarse.stats)
+            coarse.release()
+        coarse_samples = processed[0]
+        if stop_check and stop_check():
+            return
+
+        windows = self._refine_windows(candidates, int(coarse_interval_s * 1000))
+        fine = open_source(video_path) if windows else None
+        if fine is not None:
+            step_ms = fine.sample_interval_s * 1000
+            # the coarse pass is done; the rest of the progress bar covers the windows
+            total[0] = coarse_samples + sum(int((end - start) / step_ms) + 1 for start, end, _ in windows)
+            kept = None
+            try:
+                for start_ms, end_ms, best in windows:
+                    if stop_check and stop_check():
+                        return
+                    for pos_ms, score in self._scan_range(
+                        fine, scorer, float('-inf'), batch_size, stop_check, _on_sample,
+                        start_ms=start_ms, end_ms=end_ms, lockout=False, pipeline=pipeline,
+                        dedup_stats=dedup_stats
+                    ):
+                        if score > best[1]:
+                            best = (pos_ms, score)
+                    if best[1] < threshold:
+                        continue
+                    if kept is not None and best[0] <= kept[0] + MATCH_LOCKOUT_MS:
+                        # two windows peaking at their shared edge: keep the better frame
+                        if best[1] > kept[1]:
+                            kept = best
+                        continue
+                    if kept is not None:
+                        yield (video_path, kept[0], kept[1])
+                    kept = best
+                if kept is not None and not (stop_check and stop_check()):
+                    yield (video_path, kept[0], kept[1])
+            finally:
+                decode_stats.merge(fine.stats)
+                fine.release()
+
+        refine_stats = {
+            'coarse_interval_s': coarse_interval_s,
+            'coarse_samples': coarse_samples,
+            'refine_windows': len(windows),
+            'refine_samples': processed[0] - coarse_samples,
+        }
+        self._report_stats(video_path, stats_callback, decode_stats, dedup_stats, pipeline_stats, refine_stats)
+
+    @staticmethod
+    def _refine_windows(candidates: List[Tuple[int, float]], radius_ms: int) -> List[Tuple[int, int, Tuple[int, float]]]:
+        """
+        Rescan windows around coarse candidates, as (start_ms, end_ms, (timestamp_ms, score)).
+
+        Each window reaches radius_ms to either side of its candidate, but stops halfway
+        to the neighbouring candidates so adjacent windows share an edge instead of overlapping.
+        """
+        windows = []
+        for i, (pos_ms, score) in enumerate(candidates):
+            start_ms = max(0, pos_ms - radius_ms)
+            end_ms = pos_ms + radius_ms
+            if i > 0:
+                start_ms = max(start_ms, (candidates[i - 1][0] + pos_ms) // 2)
+            if i + 1 < len(candidates):
+                end_ms = min(end_ms, (pos_ms + candidates[i + 1][0]) // 2)
+            windows.append((start_ms, end_ms, (pos_ms, score)))
+        return windows
+
+    def _scan_range(
+        self,
+        source,
+        scorer,
+        threshold: float,
+        batch_size: int,
+        stop_check: Optional[Callable[[], bool]],
+        on_sample: Callable[[], None],
+        prefetch_stats=None,
+        start_ms: int = 0,
+        end_ms: Optional[int] = None,
+        lockout: bool = True,
+        skip_locked: bool = True,
+        pipeline: Optional[dict] = None,
+        score_lock=None,
+        shot_stats=None,
+        dedup_stats=None,
+        wanted: Optional[Callable[[int], bool]] = None,
+    ) -> Generator[Tuple[int, float], None, None]:
+        """
+        Score the sampled frames of an opened frame source and yield (timestamp_ms, score) matches.
+
+        Batches of batch_size frames go through search_pipeline.run_pipeline with the
+        scorer; pipeline holds its keyword arguments (worker counts, queue_size, stats).
+        With lockout=True, matches within MATCH_LOCKOUT_MS after the previous match are
+        dropped (and, with skip_locked=True, those frames are not decoded at all once the
+        match is known); with lockout=False every frame at or above threshold is yielded.
+        on_sample() is called for each scored frame, for progress reporting. score_lock,
+        if given, is held around the scorer's score stage. With shot_stats (a
+        frame_sampler.ShotStats), only frames picked by select_shot_frames are scored and
+        on_sample() is also called for the ones it skipped. With dedup_stats (a
+        frame_sampler.DedupStats), a frame whose perceptual hash is within
+        dedup_stats.max_distance bits of the last frame run through the model (and whose
+        coarse colours match, see frame_sampler.is_near_duplicate) reuses its outputs, and
+        on_sample(True) is called for it. Sampled frames whose timestamp fails wanted()
+        are neither decoded nor counted.
+        """
+        import collections
+        import time
+        from frame_sampler import frame_fingerprint, is_near_duplicate, prefetch_frames, select_shot_frames
+        from search_pipeline import run_pipeline
+
+        last_match_ms = None
+
+        def _outside_lockout(pos_ms):
+            return last_match_ms is None or pos_ms > last_match_ms + MATCH_LOCKOUT_MS
+
+        def _wanted(pos_ms):
+            # frames inside the lockout after a match are not decoded at all
+            if lockout and skip_locked and not _outside_lockout(pos_ms):
+                return False
+            return wanted is None or wanted(pos_ms)
+
+        frames = source.frames(
+            wanted=_wanted if wanted is not None or (lockout and skip_locked) else None,
+            stop_check=stop_check, start_ms=start_ms, end_ms=end_ms
+        )
+        if prefetch_stats is not None:
+            frames = prefetch_frames(frames, prefetch_stats.queue_size, prefetch_stats)
+        if shot_stats is not None:
+            frames = select_shot_frames(frames, shot_stats.threshold, shot_stats.max_interval_s, shot_stats)
+        reported_skips = 0
+
+        def _report_skips():
+            nonlocal reported_skips
+            # counted on the decode thread as the shot filter drops frames
+            skipped = shot_stats.frames_skipped if shot_stats is not None else 0
+            for _ in range(skipped - reported_skips):
+                on_sample()
+            reported_skips = max(reported_skips, skipped)
+
+        # frames of each batch that reuse another frame's outputs, in batch order
+        reused_counts = collections.deque()
+        # without dedup a batch is sent as soon as it is full; with dedup it also takes the
+        # duplicates of its last frame, up to a bound
+        max_batch_frames = batch_size if dedup_stats is None else batch_size * DEDUP_BATCH_SPAN
+
+        def _batch(batch_frames, batch_times, batch_rows):
+            if dedup_stats is None:
+                return batch_frames, batch_times
+            reused_counts.append(len(batch_times) - len(batch_frames))
+            return batch_frames, batch_times, batch_rows
+
+        def _batches():
+            batch_frames, batch_times, batch_rows = [], [], []
+            reference = None
+            for pos_ms, frame in frames:
+                reused = False
+                if dedup_stats is not None:
+                    t0 = time.perf_counter()
+                    fingerprint = frame_fingerprint(frame)
+                    dedup_stats.hash_time_s += time.perf_counter() - t0
+                    dedup_stats.frames_hashed += 1
+                    # only within a batch, so every batch runs the model on its first frame
+                    reused = bool(batch_frames) and is_near_duplicate(fingerprint, reference, dedup_stats.max_distance)
+                    if reused:
+                        dedup_stats.frames_reused += 1
+                    else:
+                        reference = fingerprint
+                        if len(batch_frames) >= batch_size:
+                            yield _batch(batch_frames, batch_times, batch_rows)
+                            batch_frames, batch_times, batch_rows = [], [], []
+                if not reused:
+                    batch_frames.append(frame)
+                batch_times.append(pos_ms)
+                batch_rows.append(len(batch_frames) - 1)
+                if len(batch_times) >= max_batch_frames:
+                    yield _batch(batch_frames, batch_times, batch_rows)
+                    batch_frames, batch_times, batch_rows = [], [], []
+            # sampling was interrupted by a stop request; don't score the leftovers
+            if batch_frames and not (stop_check and stop_check()):
+                yield _batch(batch_frames, batch_times, batch_rows)
+
+        results = run_pipeline(_batches(), scorer, score_lock=score_lock, **(pipeline or {}))
+        try:
+            for batch_times, scores in results:
+                _report_skips()
+                reused = reused_counts.popleft() if dedup_stats is not None else 0
+                for i in range(len(batch_times)):
+                    on_sample(i >= len(batch_times) - reused)
+                for frame_ms, score in zip(batch_times, scores):
+                    # frames decoded before a match in an earlier batch was known
+                    if lockout and not _outside_lockout(frame_ms):
+                        continue
+                    if score >= threshold:
+                        yield (frame_ms, score)
+                        last_match_ms = frame_ms
+            _report_skips()
+        finally:
+            # stops the pipeline threads, then a prefetching decoder thread, before the caller releases the source
+            results.close()
+            frames.close()
+
+    @staticmethod
+    def _report_stats(video_path, stats_callback, decode_stats, *extra_stats):
+        """Call stats_callback with decode_stats.as_dict() updated by every non-None extra stats object (or dict)."""
+        if stats_callback:
+            try:
+                stats = decode_stats.as_dict()
+                for extra in extra_stats:
+                    if extra is not None:
+                        stats.update(extra if isinstance(extra, dict) else extra.as_dict())
+                stats_callback(video_path, stats)
+            except Exception:
+                pass
@@ -0,0 +1,548 @@
+# -*- coding: utf-8 -*-
+"""
+Staged scoring pipeline used by AISearchEngine's frame scans.
+
+    decode -> preprocess -> inference -> score/emit
+
+Batches of sampled frames flow through bounded queues between the stages, so a
+slow stage blocks the ones before it (backpressure) instead of letting decoded
+frames pile up in memory. Each stage has its own worker count: preprocessing
+(resize, normalize, letterbox) is numpy/OpenCV work and model calls run in
+torch or ONNX Runtime kernels, all of which release the GIL, so the stages
+really overlap with decoding and with each other. The score/emit stage runs on
+the consumer's thread one batch at a time in frame order, so scorers can keep
+state (recorded embeddings, pending matches) without locks.
+
+A search mode plugs in as a Scorer with one method per stage; ClipScorer,
+CategoryScorer and MultiScorer implement the engine's modes.
+"""
+
+import threading
+import time
+from typing import Callable, Generator, List, Optional, Tuple
+
+# Batches held by each queue between two stages
+DEFAULT_QUEUE_SIZE = 2
+
+_END = object()
+
+
+class Scorer:
+    """
+    The per-batch work of a search mode, split by pipeline stage.
+
+    preprocess and infer may run on several batches at once in worker threads;
+    score is called for one batch at a time, in frame order, and returns one score
+    per frame. failed is set by run_pipeline when a stage raised, so results
+    recorded along the way (e.g. for an index) are known to be incomplete.
+    """
+
+    failed = False
+
+    def preprocess(self, frames: list):
+        return frames
+
+    def infer(self, inputs):
+        return inputs
+
+    def score(self, outputs, times: List[int]) -> List[float]:
+        raise NotImplementedError
+
+    def expand(self, outputs, rows: List[int]):
+        """
+        Outputs of infer for a batch whose frame i reuses the result of inference row rows[i].
+
+        Used when near-duplicate frames were left out of inference. The default handles
+        what the built-in scorers return: numpy arrays with one row per frame, lists
+        with one item per frame, tuples of those, and None.
+        """
+        return take_rows(outputs, rows)
+
+
+def take_rows(outputs, rows: List[int]):
+    """Pick rows (in order, repeats allowed) from per-frame outputs; see Scorer.expand."""
+    if outputs is None:
+        return None
+    if isinstance(outputs, tuple):
+        return tuple(take_rows(output, rows) for output in outputs)
+    if isinstance(outputs, list):
+        return [outputs[row] for row in rows]
+    return outputs[rows]
+
+
+class FunctionScorer(Scorer):
+    """Wraps a plain score_batch(frames, times) callable; everything runs in the score stage."""
+
+    def __init__(self, score_batch: Callable[[list, list], List[float]]):
+        self.score_batch = score_batch
+
+    def score(self, outputs, times: List[int]) -> List[float]:
+        return self.score_batch(outputs, times)
+
+
+class ClipScorer(Scorer):
+    """Best CLIP similarity of each frame against a stack of query embeddings."""
+
+    def __init__(self, engine, queries, record: bool = False):
+        """
+        Args:
+            engine: The AISearchEngine whose CLIP model is used (already loaded).
+            queries: (Q, dim) float32 array of L2-normalized query embeddings.
+            record: Keep (timestamps, float16 embeddings) of every batch in recorded.
+        """
+        self.engine = engine
+        self.queries = queries
+        self.record = record
+        self.recorded = []
+
+    def preprocess(self, frames: list):
+        return self.engine._clip_inputs(frames)
+
+    def infer(self, inputs):
+        return self.engine._embed_clip_inputs(inputs)
+
+    def score(self, embeddings, times: List[int]) -> List[float]:
+        import numpy as np
+
+        if self.record:
+            self.recorded.append((list(times), embeddings.astype(np.float16)))
+        # (num_frames, dim) @ (dim, num_queries) -> best similarity per frame
+        return (embeddings @ self.queries.T).max(axis=1).tolist()
+
+
+class CategoryScorer(Scorer):
+    """YOLO detections of each frame scored for a compiled category query."""
+
+    def __init__(
+        self,
+        engine,
+        compiled,
+        confidence_threshold: float,
+        record_conf: Optional[float] = None,
+        score_floor: Optional[float] = None,
+    ):
+        """
+        Args:
+            engine: The AISearchEngine whose YOLO model is used (already loaded).
+            compiled: category_query.CompiledCategoryQuery bound to the model's class names.
+            confidence_threshold: Boxes below this confidence do not count.
+            record_conf: When set, detect every class down to this confidence and keep
+                (timestamp, classes, confidences, xyxyn boxes) per frame in recorded.
+                Otherwise only the query's classes are requested from the detector.
+            score_floor: Count boxes down to this confidence instead (below
+                confidence_threshold), so frames just under the threshold keep their
+                score; the caller compares scores against the real threshold.
+        """
+        self.engine = engine
+        self.compiled = compiled
+        self.confidence_threshold = confidence_threshold
+        self.record_conf = record_conf
+        self.score_floor = confidence_threshold if score_floor is None else min(score_floor, confidence_threshold)
+        self.recorded = []
+
+    def preprocess(self, frames: list):
+        return self.engine._yolo_inputs(frames)
+
+    def infer(self, inputs):
+        if self.record_conf is not None:
+            return self.engine._detect_inputs(inputs, conf=self.record_conf)
+        # boxes below the threshold are dropped before NMS, so crowded frames hand back few boxes
+        return self.engine._detect_inputs(inputs, conf=self.score_floor, classes=self.compiled.class_ids)
+
+    def score(self, detections, times: List[int]) -> List[float]:
+        if detections is None:
+            return [0.0] * len(times)
+        scores = []
+        for (classes, confidences, boxes), pos_ms in zip(detections, times):
+            if self.record_conf is not None:
+                self.recorded.append((pos_ms, classes, confidences, boxes))
+            scores.append(self.compiled.score(classes, confidences, self.score_floor) if len(classes) else 0.0)
+        return scores
+
+
+class MultiScorer(Scorer):
+    """
+    Several text/image/category queries scored from one CLIP and one YOLO pass per batch.
+
+    score returns, per frame, the best margin of any query over its own threshold (>= 0
+    when at least one query matched) and keeps every query's score of those frames in
+    pending, by timestamp.
+    """
+
+    def __init__(
+        self,
+        engine,
+        num_queries: int,
+        thresholds,
+        clip_queries: List[int],
+        query_embeddings,
+        bounds,
+        category_queries: list,
+        confidence_threshold: float,
+        record_clip: bool = False,
+        record_conf: Optional[float] = None,
+    ):
+        """
+        Args:
+            engine: The AISearchEngine whose models are used (already loaded).
+            num_queries: Number of queries; scores have one column per query.
+            thresholds: (num_queries,) per-query thresholds.
+            clip_queries: Positions of the text/image queries.
+            query_embeddings: Their stacked embeddings; rows bounds[j]:bounds[j + 1] belong to clip_queries[j].
+            category_queries: (position, CompiledCategoryQuery) of the category queries.
+            confidence_threshold: Boxes below this confidence do not count.
+            record_clip: Keep (timestamps, float16 embeddings) per batch in clip_recorded.
+            record_conf: When set, detect every class down to this confidence and keep
+                the detections per frame in det_recorded.
+        """
+        self.engine = engine
+        self.num_queries = num_queries
+        self.thresholds = thresholds
+        self.clip_queries = clip_queries
+        self.query_embeddings = query_embeddings
+        self.bounds = bounds
+        self.category_queries = category_queries
+        self.confidence_threshold = confidence_threshold
+        self.record_clip = record_clip
+        self.record_conf = record_conf
+        self.class_ids = sorted({i for _, c in category_queries for i in c.class_ids})
+        self.clip_recorded = []
+        self.det_recorded = []
+        self.pending = {}
+
+    def preprocess(self, frames: list):
+        return (
+            self.engine._clip_inputs(frames) if self.clip_queries else None,
+            self.engine._yolo_inputs(frames) if self.category_queries else None,
+        )
+
+    def infer(self, inputs):
+        clip_inputs, yolo_inputs = inputs
+        embeddings = self.engine._embed_clip_inputs(clip_inputs) if clip_inputs is not None else None
+        detections = None
+        if yolo_inputs is not None:
+            if self.record_conf is not None:
+                detections = self.engine._detect_inputs(yolo_inputs, conf=self.record_conf)
+            elif self.class_ids:
+                detections = self.engine._detect_inputs(yolo_inputs, conf=self.confidence_threshold, classes=self.class_ids)
+        return embeddings, detections
+
+    def score(self, outputs, times: List[int]) -> List[float]:
+        import numpy as np
+
+        embeddings, detections = outputs
+        scores = np.zeros((len(times), self.num_queries), dtype=np.float64)
+        if embeddings is not None:
+            if self.record_clip:
+                self.clip_recorded.append((list(times), embeddings.astype(np.float16)))
+            # (num_frames, dim) @ (dim, num_query_rows), then best row of each query
+            sims = embeddings @ self.query_embeddings.T
+            for j, qi in enumerate(self.clip_queries):
+                scores[:, qi] = sims[:, self.bounds[j]:self.bounds[j + 1]].max(axis=1)
+        if detections is not None:
+            for f, ((classes, confidences, boxes), pos_ms) in enumerate(zip(detections, times)):
+                if self.record_conf is not None:
+                    self.det_recorded.append((pos_ms, classes, confidences, boxes))
+                for qi, compiled in self.category_queries:
+                    scores[f, qi] = compiled.score(classes, confidences, self.confidence_threshold)
+        margins = (scores - self.thresholds).max(axis=1)
+        for f, pos_ms in enumerate(times):
+            if margins[f] >= 0:
+                self.pending[pos_ms] = scores[f]
+        return margins.tolist()
+
+
+def _unpack(batch):
+    """(frames, times, rows) of a batch item, with rows None for a plain (frames, times) batch."""
+    if len(batch) == 3:
+        return batch
+    frames, times = batch
+    return frames, times, None
+
+
+class PipelineStats:
+    """
+    Busy time per stage of run_pipeline; comparing them shows which stage limits throughput.
+
+    With stage threads it also keeps, per bounded queue (named after the stage it
+    feeds), the depth seen by each put, and how long producers waited on a full
+    queue and consumers on an empty one.
+    """
+
+    STAGES = ('decode', 'preprocess', 'inference', 'score')
+    QUEUES = ('preprocess', 'inference', 'score')
+
+    def __init__(self, preprocess_workers: int = 0, inference_workers: int = 0):
+        self.preprocess_workers = preprocess_workers
+        self.inference_workers = inference_workers
+        self.busy_s = dict.fromkeys(self.STAGES, 0.0)
+        self.batches = 0
+        self.queue_size = 0  # set by run_pipeline when it runs stage threads
+        self.depth_samples = dict.fromkeys(self.QUEUES, 0)
+        self.depth_total = dict.fromkeys(self.QUEUES, 0)
+        self.depth_max = dict.fromkeys(self.QUEUES, 0)
+        self.producer_stall_s = dict.fromkeys(self.QUEUES, 0.0)  # put blocked on a full queue
+        self.consumer_stall_s = dict.fromkeys(self.QUEUES, 0.0)  # get blocked on an empty queue
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.busy_s[stage] += seconds
+
+    def record_put(self, queue_name: str, depth: int, stall_s: float):
+        with self._lock:
+            self.depth_samples[queue_name] += 1
+            self.depth_total[queue_name] += depth
+            self.depth_max[queue_name] = max(self.depth_max[queue_name], depth)
+            self.producer_stall_s[queue_name] += stall_s
+
+    def record_get(self, queue_name: str, stall_s: float):
+        with self._lock:
+            self.consumer_stall_s[queue_name] += stall_s
+
+    def merge(self, other: 'PipelineStats'):
+        """Add the counters of another PipelineStats (e.g. from another segment of the same video)."""
+        for stage in self.STAGES:
+            self.busy_s[stage] += other.busy_s[stage]
+        self.batches += other.batches
+        self.queue_size = max(self.queue_size, other.queue_size)
+        for name in self.QUEUES:
+            self.depth_samples[name] += other.depth_samples[name]
+            self.depth_total[name] += other.depth_total[name]
+            self.depth_max[name] = max(self.depth_max[name], other.depth_max[name])
+            self.producer_stall_s[name] += other.producer_stall_s[name]
+            self.consumer_stall_s[name] += other.consumer_stall_s[name]
+
+    def as_dict(self) -> dict:
+        stats = {
+            'pipeline_workers': {'preprocess': self.preprocess_workers, 'inference': self.inference_workers},
+            'pipeline_busy_s': dict(self.busy_s),
+            'pipeline_batches': self.batches,
+        }
+        if self.queue_size:
+            stats.update({
+                'pipeline_queue_size': self.queue_size,
+                'pipeline_queue_depth_avg': {
+                    name: self.depth_total[name] / self.depth_samples[name] if self.depth_samples[name] else 0.0
+                    for name in self.QUEUES
+                },
+                'pipeline_queue_depth_max': dict(self.depth_max),
+                'pipeline_producer_stall_s': dict(self.producer_stall_s),
+                'pipeline_consumer_stall_s': dict(self.consumer_stall_s),
+            })
+        return stats
+
+
+def run_pipeline(
+    batches: Generator[Tuple[list, List[int]], None, None],
+    scorer: Scorer,
+    preprocess_workers: int = 1,
+    inference_workers: int = 1,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    stats: Optional[PipelineStats] = None,
+    score_lock=None,
+) -> Generator[Tuple[List[int], List[float]], None, None]:
+    """
+    Push (frames, timestamps) batches through a scorer's stages and yield (timestamps, scores) per batch, in order.
+
+    A batch may also be (frames, timestamps, rows): then frames holds only the frames
+    to run the model on and timestamp i takes the outputs of frames[rows[i]] (see
+    Scorer.expand), so near-duplicate frames are scored without another model call.
+
+    With preprocess_workers and inference_workers both 0 every stage runs inline on
+    the calling thread. Otherwise a decode thread pulls the batches (so the batches
+    generator is driven from that thread), preprocess_workers and inference_workers
+    threads (at least one each) run those stages, and queues of queue_size batches
+    connect them. The score stage always runs on the calling thread, holding
+    score_lock if given (for scorers shared by several pipelines).
+
+    A batch whose preprocess, infer or score raised is yielded with no scores and
+    scorer.failed is set. An exception raised by the batches generator itself (a
+    decode error) is re-raised after the batches before it. Closing this generator
+    stops every stage thread and closes batches before returning.
+    """
+    import queue
+
+    if stats is None:
+        stats = PipelineStats(preprocess_workers, inference_workers)
+
+    def _score(outputs, times, rows, error):
+        if error is None:
+            t0 = time.perf_counter()
+            try:
+                if rows is not None:
+                    outputs = scorer.expand(outputs, rows)
+                if score_lock is not None:
+                    with score_lock:
+                        scores = scorer.score(outputs, times)
+                else:
+                    scores = scorer.score(outputs, times)
+            except Exception as e:
+                error = e
+            stats.add('score', time.perf_counter() - t0)
+        stats.batches += 1
+        if error is not None:
+            scorer.failed = True
+            return []
+        return scores
+
+    if preprocess_workers <= 0 and inference_workers <= 0:
+        try:
+            while True:
+                t0 = time.perf_counter()
+                try:
+                    frames, times, rows = _unpack(next(batches))
+                except StopIteration:
+                    break
+                finally:
+                    stats.add('decode', time.perf_counter() - t0)
+                outputs, error = None, None
+                try:
+                    t0 = time.perf_counter()
+                    inputs = scorer.preprocess(frames)
+                    stats.add('preprocess', time.perf_counter() - t0)
+                    t0 = time.perf_counter()
+                    outputs = scorer.infer(inputs)
+                    stats.add('inference', time.perf_counter() - t0)
+                except Exception as e:
+                    error = e
+                yield times, _score(outputs, times, rows, error)
+        finally:
+            batches.close()
+        return
+
+    preprocess_workers = max(1, int(preprocess_workers))
+    inference_workers = max(1, int(inference_workers))
+    queue_size = max(1, int(queue_size))
+    stats.queue_size = queue_size
+    to_preprocess = queue.Queue(maxsize=queue_size)
+    to_infer = queue.Queue(maxsize=queue_size)
+    to_score = queue.Queue(maxsize=queue_size)
+    queue_names = {id(to_preprocess): 'preprocess', id(to_infer): 'inference', id(to_score): 'score'}
+    stop_event = threading.Event()
+    decode_error = []
+    # workers still running per stage; the last one to finish passes the end marker on
+    running = {'preprocess': preprocess_workers, 'inference': inference_workers}
+    running_lock = threading.Lock()
+
+    def _put(q, item) -> bool:
+        depth = q.qsize()
+        t0 = time.perf_counter()
+        while not stop_event.is_set():
+            try:
+                q.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            if item is not _END:
+                stats.record_put(queue_names[id(q)], depth, time.perf_counter() - t0)
+            return True
+        return False
+
+    def _get(q):
+        t0 = time.perf_counter()
+        while not stop_event.is_set():
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is not _END:
+                stats.record_get(queue_names[id(q)], time.perf_counter() - t0)
+            return item
+        return _END
+
+    def _finish(stage, next_queue, next_workers):
+        with running_lock:
+            running[stage] -= 1
+            last = running[stage] == 0
+        if last:
+            for _ in range(next_workers):
+                _put(next_queue, _END)
+
+    def _decode():
+        seq = 0
+        try:
+            while not stop_event.is_set():
+                t0 = time.perf_counter()
+                try:
+                    frames, times, rows = _unpack(next(batches))
+                except StopIteration:
+                    break
+                finally:
+                    stats.add('decode', time.perf_counter() - t0)
+                if not _put(to_preprocess, (seq, (times, rows), frames, None)):
+                    break
+                seq += 1
+        except BaseException as e:
+            decode_error.append(e)
+        finally:
+            try:
+                batches.close()
+            except Exception:
+                pass
+            for _ in range(preprocess_workers):
+                _put(to_preprocess, _END)
+
+    def _stage(name, run, in_queue, out_queue, next_stage_workers):
+        try:
+            while True:
+                item = _get(in_queue)
+                if item is _END:
+                    break
+                # (timestamps, rows) ride along untouched to the score stage
+                seq, batch_info, data, error = item
+                if error is None:
+                    t0 = time.perf_counter()
+                    try:
+                        data = run(data)
+                    except Exception as e:
+                        data, error = None, e
+                    stats.add(name, time.perf_counter() - t0)
+                if not _put(out_queue, (seq, batch_info, data, error)):
+                    break
+        finally:
+            _finish(name, out_queue, next_stage_workers)
+
+    threads = [threading.Thread(target=_decode, name='pipeline-decode', daemon=True)]
+    threads += [
+        threading.Thread(
+            target=_stage, args=('preprocess', scorer.preprocess, to_preprocess, to_infer, inference_workers),
+            name=f'pipeline-preprocess-{i}', daemon=True,
+        )
+        for i in range(preprocess_workers)
+    ]
+    threads += [
+        threading.Thread(
+            target=_stage, args=('inference', scorer.infer, to_infer, to_score, 1),
+            name=f'pipeline-inference-{i}', daemon=True,
+        )
+        for i in range(inference_workers)
+    ]
+    for thread in threads:
+        thread.start()
+
+    pending = {}  # seq -> (times, rows, outputs, error), for batches that finished out of order
+    next_seq = 0
+    try:
+        while True:
+            item = _get(to_score)
+            if item is _END:
+                break
+            seq, (times, rows), outputs, error = item
+            pending[seq] = (times, rows, outputs, error)
+            while next_seq in pending:
+                times, rows, outputs, error = pending.pop(next_seq)
+                next_seq += 1
+                yield times, _score(outputs, times, rows, error)
+        if decode_error:
+            raise decode_error[0]
+    finally:
+        stop_event.set()
+        # unblock threads waiting on full queues, then wait for the decoder to let go of the source
+        for thread in threads:
+            while thread.is_alive():
+                for q in (to_preprocess, to_infer, to_score):
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+                thread.join(timeout=0.05)
@@ -4,9 +4,10 @@ SearchWorker runs AI-powered search in a background QThread and emits
 signals back to the UI thread. Kept in a separate module to keep UI
 code (app.py) smaller.
 """
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from PySide6.QtCore import QThread, Signal
 import os
+import time
 
 # import the search engine interface (must exist in search.py)
 from search import AISearchEngine
@@ -16,9 +17,10 @@ class SearchWorker(QThread):
     """Worker thread to run AI search without freezing the UI."""
 
     match_found = Signal(str, int, float)  # video_path, timestamp_ms, score
+    query_match_found = Signal(str, int, float, object)  # video_path, timestamp_ms, score, (kind, query) in 'multi' mode
     error = Signal(str)  # error message
     finished_search = Signal()  # search completed
-    progress = Signal(object)  # structured progress: ('video', completed_count, total) or ('frame', video_idx, processed, total_samples, total_videos)
+    progress = Signal(object)  # structured progress: ('video', completed_count, total) or ('frame', video_idx, processed, total_samples, total_videos, reused)
     message = Signal(object)  # structured message for i18n: (key, params_dict) or plain str
 
     def __init__(
@@ -30,6 +32,9 @@ class SearchWorker(QThread):
         query_text: Optional[str] = None,
         query_category: Optional[str] = None,
         score_threshold: float = 0.25,
+        workers: int = 1,
+        search_options: Optional[dict] = None,
+        queries: Optional[List[Tuple[str, object]]] = None,
         parent=None
     ):
         super().__init__(parent)
@@ -40,19 +45,168 @@ class SearchWorker(QThread):
         self.query_text = query_text or ""
         self.query_category = query_category or ""
         self.score_threshold = float(score_threshold)
+        # >1 searches several videos at once in separate processes (see parallel_search.py)
+        self.workers = max(1, int(workers))
+        # extra AISearchEngine.search keyword arguments (sampling, batch_size, prefetch, segments...)
+        self.search_options = dict(search_options or {})
+        # 'multi' mode: [('text', str), ('image', path), ('category', str), ...] searched in one pass
+        self.queries = list(queries or [])
         self._stopped = False
 
     def stop(self):
         """Request the search to stop."""
         self._stopped = True
 
+    def _search_kwargs(self) -> dict:
+        """Mode-specific keyword arguments for AISearchEngine.search (without callbacks)."""
+        kwargs = dict(self.search_options)
+        kwargs.update({
+            'mode': self.mode,
+            'query_images': self.query_images if self.mode == 'image' else None,
+            'query_text': self.query_text if self.mode == 'text' else None,
+            'query_category': self.query_category if self.mode == 'category' else None,
+        })
+        if self.mode in ('image', 'text'):
+            kwargs['similarity_threshold'] = self.score_threshold
+        elif self.mode == 'category':
+            kwargs['confidence_threshold'] = self.score_threshold
+        elif self.mode == 'multi':
+            kwargs['queries'] = self.queries
+            # one slider value; search_options may set separate CLIP/YOLO thresholds
+            kwargs.setdefault('similarity_threshold', self.score_threshold)
+            kwargs.setdefault('confidence_threshold', self.score_threshold)
+        return kwargs
+
+    def _emit_match(self, video_path, timestamp_ms, score, query=None):
+        self.match_found.emit(video_path, timestamp_ms, float(score))
+        if query is not None:
+            self.query_match_found.emit(video_path, timestamp_ms, float(score), query)
+        try:
+            params = {'name': os.path.basename(video_path), 'sec': int(timestamp_ms/1000), 'score': float(score)}
+            if query is not None:
+                kind, value = query
+                value = os.path.basename(value) if kind == 'image' and isinstance(value, str) else value
+                params['query'] = f"{kind}: {value}"
+                self.message.emit(('found_query_match', params))
+            else:
+                self.message.emit(('found_match', params))
+        except Exception:
+            self.message.emit("Found match")
+
+    def _emit_stats(self, video_path, stats):
+        try:
+            if stats.get('from_index'):
+                self.message.emit(('index_hit', {
+                    'name': os.path.basename(video_path),
+                    'count': int(stats.get('frames_indexed', 0)),
+                    'ms': float(stats.get('score_time_s', 0.0)) * 1000,
+                }))
+                return
+            self.message.emit(('decode_stats', {
+                'name': os.path.basename(video_path),
+                'decoded': int(stats.get('frames_decoded', 0)),
+                'total': int(stats.get('frames_total', 0)),
+                'saved': float(stats.get('saved_time_s', 0.0)),
+            }))
+            output_size = tuple(stats.get('output_size') or (0, 0))
+            source_size = tuple(stats.get('source_size') or (0, 0))
+            if output_size != source_size and stats.get('saved_bytes'):
+                self.message.emit(('resize_stats', {
+                    'name': os.path.basename(video_path),
+                    'size': f"{output_size[0]}x{output_size[1]}",
+                    'source': f"{source_size[0]}x{source_size[1]}",
+                    'saved_mb': float(stats.get('saved_bytes', 0)) / (1024 * 1024),
+                }))
+            if 'prefetch_queue_size' in stats:
+                self.message.emit(('prefetch_stats', {
+                    'name': os.path.basename(video_path),
+                    'depth': float(stats.get('prefetch_depth_avg', 0.0)),
+                    'size': int(stats.get('prefetch_queue_size', 0)),
+                    'decode_wait': float(stats.get('producer_stall_s', 0.0)),
+                    'model_wait': float(stats.get('consumer_stall_s', 0.0)),
+                }))
+            if 'shots' in stats:
+                self.message.emit(('shot_stats', {
+                    'name': os.path.basename(video_path),
+                    'shots': int(stats.get('shots', 0)),
+                    'scored': int(stats.get('shot_frames_selected', 0)),
+                    'seen': int(stats.get('shot_frames_seen', 0)),
+                }))
+            if 'progressive_samples' in stats:
+                complete_s = stats.get('progressive_complete_s')
+                self.message.emit(('progressive_stats' if stats.get('budget_exhausted') else 'progressive_done', {
+                    'name': os.path.basename(video_path),
+                    'samples': int(stats.get('progressive_samples', 0)),
+                    'sec': float(stats.get('budget_used_s', 0.0)),
+                    'effective': float(stats.get('effective_interval_s', 0.0)),
+                    'complete': f"{complete_s:g}s" if complete_s else '-',
+                }))
+            if 'refine_windows' in stats:
+                self.message.emit(('refine_stats', {
+                    'name': os.path.basename(video_path),
+                    'coarse': int(stats.get('coarse_samples', 0)),
+                    'interval': float(stats.get('coarse_interval_s', 0.0)),
+                    'windows': int(stats.get('refine_windows', 0)),
+                    'fine': int(stats.get('refine_samples', 0)),
+                }))
+            if 'dedup_frames_reused' in stats:
+                self.message.emit(('dedup_stats', {
+                    'name': os.path.basename(video_path),
+                    'reused': int(stats.get('dedup_frames_reused', 0)),
+                    'hashed': int(stats.get('dedup_frames_hashed', 0)),
+                    'ms': float(stats.get('dedup_hash_time_s', 0.0)) * 1000,
+                }))
+            if stats.get('pipeline_batches'):
+                busy = stats.get('pipeline_busy_s') or {}
+                workers = stats.get('pipeline_workers') or {}
+                self.message.emit(('pipeline_stats', {
+                    'name': os.path.basename(video_path),
+                    'batches': int(stats.get('pipeline_batches', 0)),
+                    'decode': float(busy.get('decode', 0.0)),
+                    'preprocess': float(busy.get('preprocess', 0.0)),
+                    'inference': float(busy.get('inference', 0.0)),
+                    'score': float(busy.get('score', 0.0)),
+                    'preprocess_workers': int(workers.get('preprocess', 0)),
+                    'inference_workers': int(workers.get('inference', 0)),
+                }))
+            if 'pipeline_queue_size' in stats:
+                depth = stats.get('pipeline_queue_depth_avg') or {}
+                self.message.emit(('pipeline_queue_stats', {
+                    'name': os.path.basename(video_path),
+                    'size': int(stats.get('pipeline_queue_size', 0)),
+                    'preprocess': float(depth.get('preprocess', 0.0)),
+                    'inference': float(depth.get('inference', 0.0)),
+                    'score': float(depth.get('score', 0.0)),
+                    'producer_wait': sum((stats.get('pipeline_producer_stall_s') or {}).values()),
+                    'consumer_wait': sum((stats.get('pipeline_consumer_stall_s') or {}).values()),
+                }))
+        except Exception:
+            pass
+
     def run(self):
         """Execute the search in a background thread."""
+        if self.workers > 1 and len(self.video_paths) > 1:
+            self._run_parallel()
+            return
+
         total = len(self.video_paths)
+        # 'time_budget_s' covers the whole search; each video gets its share of what is left
+        budget_s = float(self.search_options.get('time_budget_s') or 0.0)
+        deadline = time.monotonic() + budget_s
         try:
             for idx, video in enumerate(self.video_paths, start=1):
                 if self._stopped:
                     break
+                search_kwargs = self._search_kwargs()
+                if budget_s > 0:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        try:
+                            self.message.emit(('budget_exhausted', {'done': idx - 1, 'total': total}))
+                        except Exception:
+                            pass
+                        break
+                    search_kwargs['time_budget_s'] = remaining / (total - idx + 1)
 
                 # Emit a structured message to indicate which video is being searched
                 try:
@@ -68,35 +222,26 @@ class SearchWorker(QThread):
                     pass
 
                 # per-sample/frame progress callback — emit frame-level progress including video index and total videos
-                def _progress_callback(video_path, processed, total_samples):
+                def _progress_callback(video_path, processed, total_samples, reused=0):
                     try:
                         if total_samples is None:
                             return
                         # only emit frame progress when there is more than one sample
                         if int(total_samples) <= 1:
                             return
-                        # send video index, processed samples, total_samples, total videos
-                        self.progress.emit(('frame', idx, int(processed), int(total_samples), total))
+                        # send video index, processed samples, total_samples, total videos and frames that reused a model result
+                        self.progress.emit(('frame', idx, int(processed), int(total_samples), total, int(reused)))
                     except Exception:
                         pass
 
                 # call search for single video and pass per-sample progress callback
                 try:
-                    kwargs = {}
-                    if self.mode in ('image', 'text'):
-                        kwargs['similarity_threshold'] = self.score_threshold
-                    elif self.mode == 'category':
-                        kwargs['confidence_threshold'] = self.score_threshold
-
                     gen = self.search_engine.search(
                         video_paths=[video],
-                        mode=self.mode,
-                        query_images=self.query_images if self.mode == 'image' else None,
-                        query_text=self.query_text if self.mode == 'text' else None,
-                        query_category=self.query_category if self.mode == 'category' else None,
                         progress_callback=_progress_callback,
                         stop_check=lambda: self._stopped,
-                        **kwargs
+                        stats_callback=self._emit_stats,
+                        **search_kwargs
                     )
 
                     # iterate generator using next() to catch GeneratorExit clearly
@@ -119,13 +264,8 @@ class SearchWorker(QThread):
                             break
 
                         try:
-                            video_path, timestamp_ms, score = item
-                            # emit match found
-                            self.match_found.emit(video_path, timestamp_ms, float(score))
-                            try:
-                                self.message.emit(('found_match', {'name': os.path.basename(video_path), 'sec': int(timestamp_ms/1000), 'score': float(score)}))
-                            except Exception:
-                                self.message.emit("Found match")
+                            # (video_path, timestamp_ms, score), plus the query in 'multi' mode
+                            self._emit_match(*item)
                         except Exception:
                             # malformed item, ignore
                             pass
@@ -154,3 +294,97 @@ class SearchWorker(QThread):
                 self.finished_search.emit()
             except Exception:
                 pass
+
+    def _run_parallel(self):
+        """Search the videos in a pool of worker processes, emitting the same signals as run()."""
+        from parallel_search import iter_parallel_search
+
+        total = len(self.video_paths)
+        index_of = {video: idx for idx, video in enumerate(self.video_paths, start=1)}
+        in_flight = []  # video paths in start order; frame progress follows the oldest one
+        completed = 0
+
+        try:
+            self.progress.emit(('video', 0, total))
+            search_kwargs = self._search_kwargs()
+            if search_kwargs.get('time_budget_s'):
+                # every worker searches one video at a time, so each video gets a share of workers * budget
+                search_kwargs['time_budget_s'] = float(search_kwargs['time_budget_s']) * min(self.workers, total) / total
+            events = iter_parallel_search(
+                self.video_paths,
+                search_kwargs,
+                workers=self.workers,
+                engine_kwargs=self.search_engine.get_config(),
+                stop_check=lambda: self._stopped,
+            )
+            for event in events:
+                kind = event[0]
+                try:
+                    if kind == 'start':
+                        video = event[1]
+                        in_flight.append(video)
+                        self.message.emit(('searching_video', {'name': os.path.basename(video), 'idx': index_of.get(video, 0), 'total': total}))
+                    elif kind == 'progress':
+                        video, processed, total_samples, reused = event[1:5]
+                        if in_flight and video == in_flight[0] and int(total_samples) > 1:
+                            self.progress.emit(('frame', index_of.get(video, 0), int(processed), int(total_samples), total, int(reused)))
+                    elif kind == 'match':
+                        if not self._stopped:
+                            self._emit_match(*event[1:])
+                    elif kind == 'stats':
+                        self._emit_stats(event[1], event[2])
+                    elif kind == 'error':
+                        self.error.emit(str(event[2]))
+                    elif kind == 'done':
+                        if event[1] in in_flight:
+                            in_flight.remove(event[1])
+                        completed += 1
+                        self.progress.emit(('video', completed, total))
+                except Exception:
+                    pass
+        except BaseException as e:
+            try:
+                self.error.emit(str(e))
+            except Exception:
+                pass
+        finally:
+            try:
+                self.finished_search.emit()
+            except Exception:
+                pass
+
+
+class WarmupWorker(QThread):
+    """Loads the model for a search mode in the background (AISearchEngine.warm_up) after startup."""
+
+    ready = Signal(str, float)  # mode, seconds spent
+    failed = Signal(str, str)  # mode, error message
+
+    def __init__(self, search_engine: AISearchEngine, mode: str, parent=None):
+        super().__init__(parent)
+        self.search_engine = search_engine
+        self.mode = mode
+        self._stop_requested = False
+
+    def stop(self):
+        """Skip the remaining warm-up steps; the step in progress (e.g. a model load) still finishes."""
+        self._stop_requested = True
+
+    def run(self):
+        try:
+            seconds = self.search_engine.warm_up(self.mode, stop_check=lambda: self._stop_requested)
+        except BaseException as e:
+            # not fatal: the model is loaded again on the first search, which reports the error
+            if self._stop_requested:
+                return
+            try:
+                self.failed.emit(self.mode, str(e))
+            except Exception:
+                pass
+            return
+        if self._stop_requested:
+            return
+        try:
+            self.ready.emit(self.mode, float(seconds))
+        except Exception:
+            pass
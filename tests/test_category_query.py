@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from category_query import BoolOp, CompiledCategoryQuery, Term, parse_category_query
+
+NAMES = {0: 'person', 1: 'car', 2: 'truck', 3: 'dog', 4: 'cat', 5: 'traffic light'}
+
+
+def _score(text, classes, confidences, threshold=0.5):
+    compiled = CompiledCategoryQuery(parse_category_query(text), NAMES)
+    return compiled.score(np.array(classes, dtype=np.int64), np.array(confidences, dtype=np.float32), threshold)
+
+
+def test_and_binds_tighter_than_or():
+    query = parse_category_query('car OR truck AND dog')
+    assert isinstance(query, BoolOp) and query.op == 'OR'
+    assert repr(query) == "OR(Term('car'), AND(Term('truck'), Term('dog')))"
+    # a car alone satisfies the query, a truck alone does not
+    assert _score('car OR truck AND dog', [1], [0.9]) == pytest.approx(0.9)
+    assert _score('car OR truck AND dog', [2], [0.9]) == 0.0
+    assert _score('car OR truck AND dog', [2, 3], [0.9, 0.7]) == pytest.approx(0.7)
+
+
+def test_parentheses_group():
+    query = parse_category_query('(car OR truck) AND dog')
+    assert repr(query) == "AND(OR(Term('car'), Term('truck')), Term('dog'))"
+    assert _score('(car OR truck) AND dog', [1], [0.9]) == 0.0
+
+
+def test_at_least_count():
+    query = parse_category_query('at least 3 person')
+    assert isinstance(query, Term) and query.name == 'person' and query.count == 3
+    assert _score('at least 3 person', [0, 0], [0.9, 0.8]) == 0.0
+    # the third most confident box decides, and boxes under the threshold do not count
+    assert _score('at least 3 person', [0, 0, 0, 0], [0.9, 0.6, 0.8, 0.4]) == pytest.approx(0.6)
+    assert parse_category_query('2 dog').count == 2
+
+
+def test_multi_word_class_name():
+    query = parse_category_query('traffic light AND car')
+    assert [term.name for term in query.terms()] == ['traffic light', 'car']
+    compiled = CompiledCategoryQuery(query, NAMES)
+    assert compiled.class_ids == [1, 5]
+    assert _score('Traffic Light', [5], [0.7]) == pytest.approx(0.7)
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    'AND dog',
+    'dog AND',
+    'dog OR OR cat',
+    'at least x person',
+    'at least 0 person',
+    '(dog OR cat',
+    'dog )',
+])
+def test_malformed_queries_raise(text):
+    with pytest.raises(ValueError):
+        parse_category_query(text)
+
+
+def test_unknown_names_raise():
+    with pytest.raises(ValueError, match='unicorn'):
+        CompiledCategoryQuery(parse_category_query('cat OR unicorn'), NAMES)
+    with pytest.raises(ValueError, match='dragon'):
+        CompiledCategoryQuery(parse_category_query('at least 2 dragon'), NAMES)
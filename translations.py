@@ -30,7 +30,7 @@ TRANSLATIONS = {
         'search_mode_category': '类别搜索',
         'search_mode_text': '文字搜索',
         'mode_hint_image': '通过相似图片搜索视频内容',
-        'mode_hint_category': '通过选择或输入类别搜索视频内容',
+        'mode_hint_category': '通过选择或输入类别搜索视频内容，可组合如 "person AND dog"、"car OR truck"、"at least 3 person"',
         'mode_hint_text': '通过输入文字描述搜索视频内容',
         'mode_hint_select': '请选择一个搜索模式',
         'need_images': '请先选择一张或多张查询图片。',
@@ -40,6 +40,23 @@ TRANSLATIONS = {
         'search_log': '搜索日志',
         'searching_video': '正在搜索 {name} ({idx}/{total})...',
         'found_match': '在 {name} {sec}s 发现匹配 (分数={score:.2f})',
+        'found_query_match': '在 {name} {sec}s 发现 [{query}] 的匹配 (分数={score:.2f})',
+        'decode_stats': '{name}：解码 {decoded}/{total} 帧，约节省 {saved:.1f}s 解码时间',
+        'index_hit': '{name}：使用已索引的 {count} 帧，评分耗时 {ms:.0f} ms',
+        'warmup_started': '正在后台加载{mode}模型...',
+        'warmup_ready': '{mode}模型已就绪（{sec:.1f} 秒）',
+        'warmup_failed': '预加载{mode}模型失败，将在首次搜索时重试：{error}',
+        'resize_stats': '{name}：以 {size} 代替 {source} 输出帧，少处理 {saved_mb:.0f} MB 帧数据',
+        'prefetch_stats': '{name}：预取队列平均深度 {depth:.1f}/{size}，解码等待 {decode_wait:.1f}s，模型等待 {model_wait:.1f}s',
+        'progressive_stats': '{name}：时间预算用完，{sec:.1f} 秒内搜索了 {samples} 帧，平均每 {effective:.1f} 秒一帧（完整覆盖到每 {complete} 一帧）',
+        'progressive_done': '{name}：在预算内完成全部 {samples} 帧（每 {effective:.1f} 秒一帧），用时 {sec:.1f} 秒',
+        'budget_exhausted': '时间预算已用完，已搜索 {done}/{total} 个视频',
+        'refine_stats': '{name}：粗扫 {coarse} 帧（每 {interval:g} 秒一帧），在 {windows} 个窗口内精扫 {fine} 帧',
+        'progress_reused': '%p%（{reused} 帧复用）',
+        'dedup_stats': '{name}：{hashed} 个采样帧中有 {reused} 帧与前一帧近似重复，复用了模型结果（哈希耗时 {ms:.0f} ms）',
+        'shot_stats': '{name}：检测到 {shots} 个镜头，{seen} 个采样帧中仅对 {scored} 帧运行模型',
+        'pipeline_stats': '{name}：流水线 {batches} 批，各阶段耗时 解码 {decode:.1f}s，预处理 {preprocess:.1f}s（{preprocess_workers} 线程），推理 {inference:.1f}s（{inference_workers} 线程），评分 {score:.1f}s',
+        'pipeline_queue_stats': '{name}：流水线队列（容量 {size}）平均深度 预处理 {preprocess:.1f} / 推理 {inference:.1f} / 评分 {score:.1f}，上游阻塞 {producer_wait:.1f}s，下游等待 {consumer_wait:.1f}s',
         'search_finished': '搜索完成。',
         'search_error_title': '搜索错误',
         'stop_search': '停止搜索'
@@ -68,7 +85,7 @@ TRANSLATIONS = {
         'search_mode_category': 'Category',
         'search_mode_text': 'Text',
         'mode_hint_image': 'Search video content using similar images',
-        'mode_hint_category': 'Search video content by selecting or entering categories',
+        'mode_hint_category': 'Search video content by selecting or entering categories, or combine them, e.g. "person AND dog", "car OR truck", "at least 3 person"',
         'mode_hint_text': 'Search video content by entering text descriptions',
         'mode_hint_select': 'Select a search mode',
         'need_images': 'Please select one or more query images.',
@@ -78,6 +95,23 @@ TRANSLATIONS = {
         'search_log': 'Search Log',
         'searching_video': 'Searching {name} ({idx}/{total})...',
         'found_match': 'Found match in {name} at {sec}s (score={score:.2f})',
+        'found_query_match': 'Found match for [{query}] in {name} at {sec}s (score={score:.2f})',
+        'decode_stats': '{name}: decoded {decoded}/{total} frames, saved ~{saved:.1f}s of decode time',
+        'index_hit': '{name}: answered from {count} indexed frames in {ms:.0f} ms',
+        'warmup_started': 'Loading the {mode} search model in the background...',
+        'warmup_ready': '{mode} search model ready ({sec:.1f}s)',
+        'warmup_failed': 'Could not preload the {mode} search model, it will be loaded on the first search: {error}',
+        'resize_stats': '{name}: frames delivered at {size} instead of {source}, {saved_mb:.0f} MB less frame data',
+        'prefetch_stats': '{name}: prefetch queue depth {depth:.1f}/{size} on average, decoder waited {decode_wait:.1f}s, model waited {model_wait:.1f}s',
+        'progressive_stats': '{name}: time budget used up after {samples} frames in {sec:.1f}s, one frame every {effective:.1f}s on average (complete down to every {complete})',
+        'progressive_done': '{name}: all {samples} frames searched within the budget (one every {effective:.1f}s) in {sec:.1f}s',
+        'budget_exhausted': 'Time budget used up; searched {done}/{total} videos',
+        'refine_stats': '{name}: coarse pass over {coarse} frames (one every {interval:g}s), {fine} frames rescanned in {windows} windows',
+        'progress_reused': '%p% ({reused} frames reused)',
+        'dedup_stats': '{name}: {reused} of {hashed} sampled frames were near duplicates and reused a model result (hashing took {ms:.0f} ms)',
+        'shot_stats': '{name}: {shots} shots found, model run on {scored} of {seen} sampled frames',
+        'pipeline_stats': '{name}: {batches} pipeline batches, busy decode {decode:.1f}s, preprocess {preprocess:.1f}s ({preprocess_workers} threads), inference {inference:.1f}s ({inference_workers} threads), score {score:.1f}s',
+        'pipeline_queue_stats': '{name}: pipeline queues (size {size}) average depth preprocess {preprocess:.1f} / inference {inference:.1f} / score {score:.1f}, producers blocked {producer_wait:.1f}s, consumers waited {consumer_wait:.1f}s',
         'search_finished': 'Search finished.',
         'search_error_title': 'Search Error',
         'stop_search': 'Stop Search'